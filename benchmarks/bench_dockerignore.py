@@ -0,0 +1,50 @@
+"""Benchmark `.dockerignore` matching on a synthetic tree.
+
+Usage:
+    python benchmarks/bench_dockerignore.py [--files 200000]
+
+Compares matching every file against all rules and its parent directories
+with the pruned walk the kernel uses to mirror the build context.
+"""
+
+import argparse
+import os
+import tempfile
+
+from common import RULES, create_tree, timed
+from dockerfile_kernel.utils.dockerignore import DockerignoreMatcher, dockerignore
+from dockerfile_kernel.utils.filesystem import scan_files
+
+
+def match_all(root: str, matcher: DockerignoreMatcher):
+    """Match every path of the tree without pruning or reusing parent results."""
+    excluded = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        rel_dir = "" if rel_dir == "." else rel_dir
+        for name in dirnames + filenames:
+            excluded += matcher.matches(os.path.join(rel_dir, name))
+    return excluded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        timed(
+            f"create tree ({args.files} files)", lambda: create_tree(root, args.files)
+        )
+        timed("walk without matching", lambda: sum(1 for _ in os.walk(root)))
+        matcher = DockerignoreMatcher(RULES)
+        excluded = timed("match every path", lambda: match_all(root, matcher))
+        manifest = timed(
+            "pruned walk (scan_files)",
+            lambda: scan_files(root, dockerignore(root, RULES)),
+        )
+        print(f"{excluded} paths excluded, {len(manifest)} paths kept")
+
+
+if __name__ == "__main__":
+    main()
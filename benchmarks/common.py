@@ -0,0 +1,99 @@
+"""Synthetic build contexts and `.dockerignore` rule sets shared by the benchmarks."""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+RULES = [
+    ".git",
+    "node_modules",
+    "**/__pycache__",
+    "**/*.pyc",
+    "*.log",
+    "build/**",
+    "!build/dist/*.whl",
+    "data/**/*.tmp",
+]
+
+# Rule sets as found in real projects
+RULE_SETS = {
+    "small": RULES,
+    "python": [
+        ".git",
+        ".venv",
+        "**/__pycache__",
+        "**/*.py[cod]",
+        "**/.pytest_cache",
+        ".mypy_cache",
+        "*.egg-info",
+        "build",
+        "dist",
+        "!dist/*.whl",
+        "docs/_build",
+        "**/*.log",
+        ".coverage",
+        "htmlcov",
+    ],
+    "node": [
+        ".git",
+        "node_modules",
+        "!node_modules/.bin",
+        "npm-debug.log*",
+        "yarn-error.log",
+        "coverage",
+        ".next",
+        "out",
+        "build",
+        "**/*.map",
+        "**/.DS_Store",
+        "*.md",
+        "!README.md",
+    ],
+    "monorepo": [
+        "**",
+        "!src/**",
+        "!package.json",
+        "!requirements*.txt",
+        "src/**/test*",
+        "src/**/*.tmp",
+        "**/node_modules",
+        "**/__pycache__",
+        "!src/**/fixtures/**",
+        "data/**",
+        "!data/schema/*.json",
+    ],
+}
+
+# Share of the files per top level directory and files per subdirectory
+LAYOUT = {
+    "node_modules": (0.45, 50),
+    "src": (0.25, 40),
+    "build": (0.15, 100),
+    "data": (0.1, 200),
+    ".git": (0.05, 250),
+}
+SUFFIXES = [".py", ".pyc", ".js", ".tmp", ".log", ".whl", ".txt"]
+
+
+def create_tree(root: str, files: int, content: bytes = b""):
+    """Create *files* files below *root*."""
+    for top, (share, per_dir) in LAYOUT.items():
+        count = int(files * share)
+        for index in range(count):
+            directory = os.path.join(
+                root, top, f"d{index // per_dir // 20}", f"d{index // per_dir}"
+            )
+            if index % per_dir == 0:
+                os.makedirs(directory, exist_ok=True)
+            suffix = SUFFIXES[index % len(SUFFIXES)]
+            with open(os.path.join(directory, f"f{index}{suffix}"), "wb") as f:
+                f.write(content)
+
+
+def timed(name: str, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"{name:<40} {time.perf_counter() - start:8.3f} s")
+    return result
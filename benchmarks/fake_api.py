@@ -0,0 +1,56 @@
+"""In-process stand-in for `docker.APIClient`, answering builds without a docker daemon."""
+
+import hashlib
+import io
+import json
+import tarfile
+
+
+class FakeAPIClient:
+    """Implements the parts of `docker.APIClient` used by the kernel.
+
+    Builds read the whole build context and respond with the log of the classic builder.
+    """
+
+    api_version = "1.43"
+
+    def __init__(self):
+        self.hooks = {"response": []}
+        self.images: dict[str, int] = {}
+
+    def build(self, path=None, fileobj=None, dockerfile=None, **kwargs):
+        if fileobj is not None:
+            data = fileobj.read()
+            with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                code = tar.extractfile(dockerfile).read().decode()
+        else:
+            with open(dockerfile) as f:
+                code = f.read()
+        instructions = [
+            line
+            for line in code.splitlines()
+            if line.strip() and not line.startswith((" ", "#"))
+        ]
+        image_id = "sha256:" + hashlib.sha256(code.encode()).hexdigest()
+        self.images[image_id] = 1_000_000 * len(instructions)
+
+        messages = []
+        for number, instruction in enumerate(instructions, 1):
+            step_id = hashlib.sha256(f"{code}{number}".encode()).hexdigest()[:12]
+            messages.append(
+                {"stream": f"Step {number}/{len(instructions)} : {instruction}\n"}
+            )
+            messages.append({"stream": f" ---> {step_id}\n"})
+        messages.append({"aux": {"ID": image_id}})
+        messages.append({"stream": f"Successfully built {image_id[7:19]}\n"})
+        # The daemon sends one message per chunk
+        return iter([json.dumps(m).encode() + b"\r\n" for m in messages])
+
+    def inspect_image(self, image):
+        return {"Id": image, "Size": self.images.get(image, 0)}
+
+    def history(self, image):
+        return [{"Size": self.images.get(image, 0)}]
+
+    def tag(self, image, repository, tag=None):
+        return True
@@ -0,0 +1,122 @@
+"""Run the benchmark suite and compare the results with previous commits.
+
+Usage:
+    python benchmarks/run.py [--files 10000 100000 1000000] [--filter dockerignore]
+
+Results are appended to `benchmarks/results.jsonl`, one line per benchmark and run,
+tagged with the commit they were measured at. Each run is compared with the latest
+result of another commit, slowdowns above the threshold are marked.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import common  # noqa: F401, sets up the import path
+from suite import BENCHMARKS, Tree
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+
+def git_commit() -> tuple[str, bool]:
+    """Get the current commit and whether the working tree has changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", True
+    return commit, bool(status.strip())
+
+
+def load_results(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline(results: list[dict], commit: str, name: str, files: int | None):
+    """Latest result of the benchmark measured at another commit."""
+    for result in reversed(results):
+        if (
+            result["benchmark"] == name
+            and result["files"] == files
+            and result["commit"] != commit
+        ):
+            return result
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, nargs="+", default=[10_000])
+    parser.add_argument(
+        "--filter", default="", help="Only run benchmarks containing this"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Best of n runs is kept")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--output", default=RESULTS)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    previous = load_results(args.output)
+    selected = [b for b in BENCHMARKS if args.filter in b.name]
+    runs = [(b, None) for b in selected if not b.uses_tree]
+    runs += [(b, files) for files in args.files for b in selected if b.uses_tree]
+
+    results = []
+    trees: dict[int, Tree] = {}
+    try:
+        for bench, files in runs:
+            if files is not None and files not in trees:
+                for tree in trees.values():
+                    tree.cleanup()
+                trees = {files: Tree(files)}
+            inputs = (trees[files],) if files is not None else ()
+            seconds = min(bench.function(*inputs) for _ in range(args.repeat))
+
+            label = bench.name if files is None else f"{bench.name} [{files} files]"
+            line = f"{label:<60} {seconds:9.4f} s"
+            base = baseline(previous, commit, bench.name, files)
+            if base is not None and base["seconds"] > 0:
+                change = seconds / base["seconds"] - 1
+                marker = "  <-- slower" if change > args.threshold else ""
+                line += f"  {change:+7.1%} vs {base['commit']}{marker}"
+            print(line, flush=True)
+            results.append(
+                {
+                    "commit": commit,
+                    "dirty": dirty,
+                    "timestamp": time.time(),
+                    "python": platform.python_version(),
+                    "benchmark": bench.name,
+                    "files": files,
+                    "seconds": seconds,
+                }
+            )
+    finally:
+        for tree in trees.values():
+            tree.cleanup()
+
+    if not args.no_save:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Benchmarks of the kernel's hot paths.
+
+Each benchmark returns the seconds its measured part took.
+Benchmarks taking a tree run on a synthetic build context of the requested number of files.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, NamedTuple
+
+from common import RULE_SETS, create_tree
+from fake_api import FakeAPIClient
+from dockerfile_kernel.kernel import DockerKernel
+from dockerfile_kernel.magics.magic import Magic
+from dockerfile_kernel.utils.dockerignore import (
+    DockerignoreMatcher,
+    dockerignore,
+    match_dockerignore,
+)
+from dockerfile_kernel.utils.filesystem import (
+    FileCopier,
+    copy_files,
+    get_dir_size,
+    scan_files,
+    sync_files,
+)
+
+
+class Benchmark(NamedTuple):
+    name: str
+    function: Callable
+    uses_tree: bool
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def benchmark(name: str, uses_tree: bool = True):
+    def register(function):
+        BENCHMARKS.append(Benchmark(name, function, uses_tree))
+        return function
+
+    return register
+
+
+class Tree:
+    """A synthetic build context, created once for all benchmarks of a size."""
+
+    def __init__(self, files: int):
+        self.files = files
+        self._dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self._dir.name, "context")
+        create_tree(self.root, files, content=b"x" * 64)
+        self.paths = [
+            os.path.relpath(os.path.join(dirpath, name), self.root)
+            for dirpath, dirnames, filenames in os.walk(self.root)
+            for name in dirnames + filenames
+        ]
+
+    def scratch(self) -> str:
+        """Create an empty directory next to the tree."""
+        return tempfile.mkdtemp(dir=self._dir.name)
+
+    def cleanup(self):
+        self._dir.cleanup()
+
+
+def measure(function: Callable) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+########################################
+# Build context
+########################################
+
+
+@benchmark("match_dockerignore (first 10k paths)")
+def bench_match_dockerignore(tree: Tree) -> float:
+    rules = RULE_SETS["python"]
+
+    def run():
+        for path in tree.paths[:10_000]:
+            for rule in rules:
+                match_dockerignore(path, rule)
+
+    return measure(run)
+
+
+for _rule_set in RULE_SETS:
+
+    @benchmark(f"matcher every path ({_rule_set})")
+    def bench_matcher(tree: Tree, rule_set=_rule_set) -> float:
+        matcher = DockerignoreMatcher(RULE_SETS[rule_set])
+        return measure(lambda: [matcher.matches(path) for path in tree.paths])
+
+    @benchmark(f"dockerignore pruned walk ({_rule_set})")
+    def bench_pruned_walk(tree: Tree, rule_set=_rule_set) -> float:
+        return measure(
+            lambda: scan_files(tree.root, dockerignore(tree.root, RULE_SETS[rule_set]))
+        )
+
+
+@benchmark("get_dir_size")
+def bench_get_dir_size(tree: Tree) -> float:
+    ignore = dockerignore(tree.root, RULE_SETS["small"])
+    return measure(lambda: get_dir_size(tree.root, ignore))
+
+
+@benchmark("copy_files")
+def bench_copy_files(tree: Tree) -> float:
+    dest = tree.scratch()
+    ignore = dockerignore(tree.root, RULE_SETS["small"])
+    seconds = measure(lambda: copy_files(tree.root, dest, ignore))
+    shutil.rmtree(dest)
+    return seconds
+
+
+@benchmark("copy_files (FileCopier)")
+def bench_copy_files_copier(tree: Tree) -> float:
+    dest = tree.scratch()
+    ignore = dockerignore(tree.root, RULE_SETS["small"])
+    copier = FileCopier()
+    seconds = measure(lambda: copy_files(tree.root, dest, ignore, copier))
+    shutil.rmtree(dest)
+    return seconds
+
+
+@benchmark("sync_files (unchanged)")
+def bench_sync_files(tree: Tree) -> float:
+    dest = tree.scratch()
+    ignore = dockerignore(tree.root, RULE_SETS["small"])
+    manifest, _, _ = sync_files(tree.root, dest, {}, ignore)
+    seconds = measure(lambda: sync_files(tree.root, dest, manifest, ignore))
+    shutil.rmtree(dest)
+    return seconds
+
+
+########################################
+# Kernel
+########################################
+
+
+class FakeFrontend:
+    def handle_code(self, code: str):
+        return False
+
+    def build_context_warning(self):
+        pass
+
+
+class BenchmarkKernel(DockerKernel):
+    """Kernel talking to a `FakeAPIClient` and discarding its output."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._frontend = FakeFrontend()
+
+    def _create_api(self, version=None):
+        return FakeAPIClient()
+
+    def send_response(self, content_text):
+        pass
+
+    def send_display(self, content_text, display_id, update=False):
+        pass
+
+
+MAGIC_LINES = [
+    "%arg VERSION=1.0 NAME=test",
+    "%context /tmp --mode stream",
+    "%install pip numpy scipy pandas matplotlib",
+    "%tag image:latest",
+    "%stages",
+    "FROM python:3.11",
+    "RUN pip install numpy",
+]
+
+
+@benchmark("detect_magic (70k lines)", uses_tree=False)
+def bench_detect_magic() -> float:
+    return measure(lambda: [Magic.detect_magic(line) for line in MAGIC_LINES * 10_000])
+
+
+@benchmark("do_complete (5k line cell)", uses_tree=False)
+def bench_do_complete() -> float:
+    kernel = BenchmarkKernel()
+    code = "\n".join(
+        f"RUN echo {index} && apt-get install -y package{index}"
+        for index in range(5_000)
+    )
+    code += "\nRU"
+    return measure(lambda: [kernel.do_complete(code, len(code)) for _ in range(100)])
+
+
+@contextmanager
+def temporary_cache():
+    """Point the kernel's cache directory to an empty directory."""
+    previous = os.environ.get("XDG_CACHE_HOME")
+    with tempfile.TemporaryDirectory() as cache:
+        os.environ["XDG_CACHE_HOME"] = cache
+        try:
+            yield
+        finally:
+            if previous is None:
+                del os.environ["XDG_CACHE_HOME"]
+            else:
+                os.environ["XDG_CACHE_HOME"] = previous
+
+
+@benchmark("do_execute (100 cells, fake daemon)", uses_tree=False)
+def bench_do_execute() -> float:
+    with temporary_cache():
+        kernel = BenchmarkKernel()
+        kernel.build_cache = False
+        cells = ["FROM python:3.11"] + [f"RUN echo {i}" for i in range(99)]
+        return measure(
+            lambda: [kernel.do_execute(cell, silent=False) for cell in cells]
+        )
+
+
+@benchmark("do_execute (100 cached cells, fake daemon)", uses_tree=False)
+def bench_do_execute_cached() -> float:
+    with temporary_cache():
+        kernel = BenchmarkKernel()
+        cells = ["FROM python:3.11"] + [f"RUN echo {i}" for i in range(99)]
+        for cell in cells:
+            kernel.do_execute(cell, silent=False)
+        kernel._sha1 = None
+        return measure(
+            lambda: [kernel.do_execute(cell, silent=False) for cell in cells]
+        )
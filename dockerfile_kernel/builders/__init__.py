@@ -0,0 +1,3 @@
+from .builder import Builder
+from .classic import ClassicBuilder
+from .buildkit import BuildKitBuilder
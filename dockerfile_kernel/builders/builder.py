@@ -0,0 +1,102 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Iterator
+
+if TYPE_CHECKING:
+    from ..kernel import DockerKernel
+
+from abc import ABC, abstractmethod
+
+import queue
+import threading
+
+# Seconds to wait for a cancelled build to shut down
+CANCEL_TIMEOUT = 10
+# Seconds after which an empty message is yielded while the build is silent
+HEARTBEAT = 0.1
+
+
+class Builder(ABC):
+    """Abstract class as base for a build backend.
+
+    The build runs on a worker thread while the calling thread receives its log messages.
+    A `KeyboardInterrupt` (e.g. a kernel interrupt) in the calling thread cancels the build.
+    """
+
+    def __init__(self, kernel: DockerKernel):
+        """
+        Args:
+            kernel (DockerKernel): Current instance of the `DockerKernel`
+        """
+        self._kernel = kernel
+        self._cancelled = threading.Event()
+
+    def build(self, context: dict[str, Any], buildargs: dict[str, str]):
+        """Build an image.
+
+        Args:
+            context (dict[str, Any]): Build context and *Dockerfile* as keyword arguments for `docker.APIClient.build`.
+            buildargs (dict[str, str]): Build arguments.
+
+        Raises:
+            KeyboardInterrupt: The build was interrupted and has been cancelled.
+
+        Yields:
+            dict[str, Any]: Log messages in the format of the docker daemon, e.g. `{"stream": ...}`, `{"aux": ...}` or `{"error": ...}`.
+                An empty message every `HEARTBEAT` seconds the build is silent.
+        """
+        self._cancelled.clear()
+        messages: queue.Queue = queue.Queue()
+
+        def run():
+            try:
+                for message in self._build(context, buildargs):
+                    messages.put(message)
+            except Exception as e:
+                if not self._cancelled.is_set():
+                    messages.put(e)
+            finally:
+                messages.put(None)
+
+        worker = threading.Thread(target=run, name="docker-build", daemon=True)
+        worker.start()
+        try:
+            while True:
+                try:
+                    message = messages.get(timeout=HEARTBEAT)
+                except queue.Empty:
+                    yield {}
+                    continue
+                if message is None:
+                    break
+                if isinstance(message, Exception):
+                    raise message
+                yield message
+        except KeyboardInterrupt:
+            self.cancel()
+            worker.join(CANCEL_TIMEOUT)
+            raise
+
+    def cancel(self):
+        """Cancel the running build."""
+        self._cancelled.set()
+        self._cancel()
+
+    @abstractmethod
+    def _build(
+        self, context: dict[str, Any], buildargs: dict[str, str]
+    ) -> Iterator[dict[str, Any]]:
+        """*(abstract)* Run the build, called on the worker thread.
+
+        Args:
+            context (dict[str, Any]): Build context and *Dockerfile* as keyword arguments for `docker.APIClient.build`.
+            buildargs (dict[str, str]): Build arguments.
+
+        Yields:
+            dict[str, Any]: Log messages in the format of the docker daemon.
+        """
+        pass
+
+    @abstractmethod
+    def _cancel(self):
+        """*(abstract)* Stop the running build, called from the calling thread."""
+        pass
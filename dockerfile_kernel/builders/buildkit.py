@@ -0,0 +1,105 @@
+from typing import Any, Iterator
+
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+
+from .builder import Builder
+
+
+class BuildKitBuilder(Builder):
+    """Build with [BuildKit](https://docs.docker.com/build/buildkit/) through the `docker buildx build` CLI.
+
+    The plain progress output is forwarded as log messages and the image id is read from `--iidfile`.
+    Cancelling interrupts the CLI, which then aborts the build.
+    """
+
+    def __init__(self, kernel):
+        super().__init__(kernel)
+        self._process: subprocess.Popen | None = None
+
+    def _build(
+        self, context: dict[str, Any], buildargs: dict[str, str]
+    ) -> Iterator[dict[str, Any]]:
+        executable = shutil.which("docker")
+        if executable is None:
+            yield {"error": "The BuildKit backend requires the docker CLI"}
+            return
+
+        iid_fd, iid_path = tempfile.mkstemp(prefix="dockerfile-kernel-", suffix=".iid")
+        os.close(iid_fd)
+        command = [
+            executable,
+            "buildx",
+            "build",
+            "--progress=plain",
+            "--load",
+            "--iidfile",
+            iid_path,
+            "--file",
+            context["dockerfile"],
+        ]
+        for name, value in buildargs.items():
+            command += ["--build-arg", f"{name}={value}"]
+        # An archived build context is read from stdin
+        fileobj = context.get("fileobj")
+        command.append("-" if fileobj is not None else context["path"])
+
+        try:
+            self._process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE if fileobj is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                # Build on the kernel's daemon
+                env={**os.environ, "DOCKER_HOST": self._kernel.docker_url},
+            )
+            if fileobj is not None:
+                threading.Thread(
+                    target=self._write_context,
+                    args=(fileobj, self._process.stdin),
+                    daemon=True,
+                ).start()
+
+            errors = []
+            for line in self._process.stdout:
+                if line.startswith("ERROR:"):
+                    errors.append(line.removeprefix("ERROR:").strip())
+                yield {"stream": line}
+            returncode = self._process.wait()
+
+            if returncode != 0:
+                yield {
+                    "error": "\n".join(errors)
+                    or f"docker buildx build exited with status {returncode}"
+                }
+                return
+            with open(iid_path) as iid_file:
+                yield {"aux": {"ID": iid_file.read().strip()}}
+        finally:
+            self._process = None
+            os.remove(iid_path)
+
+    @staticmethod
+    def _write_context(fileobj, stdin):
+        """Pipe the archived build context into the CLI."""
+        try:
+            for chunk in fileobj:
+                stdin.buffer.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # The CLI exited before reading the whole build context
+            pass
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def _cancel(self):
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.send_signal(signal.SIGINT)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Iterator
+
+from .builder import Builder
+from ..utils.compression import UploadStream
+from ..utils.stream import JSONStreamDecoder
+
+if TYPE_CHECKING:
+    from docker import APIClient
+    from requests import Response
+
+
+class ClassicBuilder(Builder):
+    """Build with the docker daemon's classic builder through `docker.APIClient.build`.
+
+    The build context is compressed following the kernel's `context_compression`
+    and the bytes sent are reported once the daemon received it.
+    Cancelling closes the connection to the daemon, which then aborts the build.
+    """
+
+    def __init__(self, kernel, api: APIClient | None = None):
+        """
+        Args:
+            kernel (DockerKernel): Current instance of the `DockerKernel`
+            api (APIClient | None, optional): Client used instead of the kernel's, e.g. for builds on other threads.
+                Defaults to None.
+        """
+        super().__init__(kernel)
+        self._api = api
+        self._response: Response | None = None
+        self._context = None
+
+    def _build(
+        self, context: dict[str, Any], buildargs: dict[str, str]
+    ) -> Iterator[dict[str, Any]]:
+        self._response = None
+        context, upload = self._upload_context(context)
+        self._context = upload
+        api = self._api if self._api is not None else self._kernel._api
+        api.hooks["response"].append(self._track_response)
+        decoder = JSONStreamDecoder()
+        try:
+            # The build context is uploaded before the daemon's response is returned
+            response = api.build(buildargs=buildargs, rm=True, **context)
+            if upload is not None:
+                self._kernel._compression.record(upload)
+                yield {"stream": upload.summary() + "\n"}
+            # Chunks of the response may hold several or partial messages
+            for chunk in response:
+                yield from decoder.feed(chunk)
+            decoder.close()
+        finally:
+            api.hooks["response"].remove(self._track_response)
+
+    def _upload_context(
+        self, context: dict[str, Any]
+    ) -> tuple[dict[str, Any], UploadStream | None]:
+        """Wrap an archived build context for the upload, compressing it if chosen by the kernel's policy.
+
+        Args:
+            context (dict[str, Any]): Build context and *Dockerfile* as keyword arguments for `docker.APIClient.build`.
+
+        Returns:
+            tuple[dict[str, Any], UploadStream | None]: The keyword arguments to build with
+                and the stream uploaded, `None` if docker archives a directory itself.
+        """
+        compress = self._kernel._compression.choose(self._kernel.context_compression)
+        fileobj = context.get("fileobj")
+        if fileobj is None:
+            return ({**context, "gzip": True} if compress else context), None
+        upload = UploadStream(fileobj, compress)
+        context = {**context, "fileobj": upload}
+        if compress:
+            context["encoding"] = "gzip"
+        return context, upload
+
+    def _track_response(self, response: Response, *args, **kwargs):
+        """Response hook of `requests` remembering the build's streamed response."""
+        if response.request.path_url.split("?")[0].endswith("/build"):
+            self._response = response
+
+    def _cancel(self):
+        # Stop uploading the build context if the daemon didn't respond yet
+        if self._context is not None:
+            self._context.close()
+        if self._response is not None:
+            self._response.close()
@@ -1,7 +1,10 @@
 import os
 import os.path
 
-from nbconvert.exporters import TemplateExporter
+from nbconvert.exporters import Exporter, TemplateExporter
+from traitlets import Bool
+
+from .optimize import optimize_cells
 
 
 class DockerExporter(TemplateExporter):
@@ -11,10 +14,25 @@ class DockerExporter(TemplateExporter):
 
     export_from_notebook = "Dockerfile"
 
+    optimize = Bool(
+        False,
+        help="""Export a Dockerfile with fewer layers instead of restorable cells.
+        Consecutive RUN cells and %install cells of the same package manager are merged and metadata instructions are moved to the end of their stage,
+        markdown and other magic cells are dropped.""",
+    ).tag(config=True)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.environment.globals["cell_has_empty_line"] = self.cell_has_empty_line
 
+    def from_notebook_node(self, nb, resources=None, **kw):
+        if not self.optimize:
+            return super().from_notebook_node(nb, resources, **kw)
+        # Preprocessed without rendering the template
+        nb_copy, resources = Exporter.from_notebook_node(self, nb, resources, **kw)
+        cells = [cell.source for cell in nb_copy.cells if cell.cell_type == "code"]
+        return optimize_cells(cells), resources
+
     def cell_has_empty_line(self, cell):
         lines = cell.source.split("\n")
         empty_lines = [l for l in lines if not l]
@@ -34,3 +52,14 @@ class DockerExporter(TemplateExporter):
 
     def _template_file_default(self):
         return "docker_template.tpl"
+
+
+class OptimizedDockerExporter(DockerExporter):
+    """
+    Dockerfile exporter merging cells into fewer layers
+    """
+
+    export_from_notebook = "Dockerfile (optimized)"
+
+    def _optimize_default(self):
+        return True
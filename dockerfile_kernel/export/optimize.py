@@ -0,0 +1,275 @@
+import re
+from typing import NamedTuple
+
+from ..magics import Arg, Install
+from ..magics.magic import Magic
+from ..utils.batch import plan_cells, resolve_stage_indices
+from ..utils.instructions import HEREDOC_REGEX, split_flags, split_instructions
+
+# Instructions only setting image metadata, they don't affect the following instructions' filesystem
+METADATA_KEYWORDS = {
+    "LABEL",
+    "EXPOSE",
+    "CMD",
+    "ENTRYPOINT",
+    "HEALTHCHECK",
+    "STOPSIGNAL",
+    "MAINTAINER",
+}
+# Commands which can't be joined with `&&` as is, e.g. `a; b` or `a || b`, or which change the shell's state
+COMPOUND_REGEX = re.compile(r";|\n|\|\||(?<![&>])&(?![&>])")
+SHELL_STATE_REGEX = re.compile(
+    r"(?:^|[;&|(]\s*)(?:cd|export|set|source|unset|umask|alias|shopt|eval|exec|\.)\s"
+)
+# Commands doing nothing
+NOOP_COMMANDS = {"true", ":"}
+# Package manager aliases of `%install`
+PACKAGE_MANAGERS = {"apt": "apt-get"}
+LINE_BREAK = " \\\n    "
+
+
+class Instruction(NamedTuple):
+    """An instruction of the optimized *Dockerfile*.
+
+    - *keyword* is the upper case keyword, e.g. `RUN`
+    - *arguments* is the instruction's arguments, for `RUN` without its flags
+    - *flags* are the leading flags of a `RUN` instruction, e.g. `--mount=type=cache,target=/root/.cache`
+    - *commands* are the shell commands of a `RUN` instruction joined with `&&`
+    - *packages* are the packages of folded `%install` cells, with the package manager in *arguments*
+    """
+
+    keyword: str
+    arguments: str
+    flags: str = ""
+    commands: tuple[str, ...] = ()
+    packages: tuple[str, ...] = ()
+
+
+def optimize_cells(cells: list[str]) -> str:
+    """Create a *Dockerfile* with fewer layers from the code cells of a notebook.
+
+    The *Dockerfile* builds the same filesystem as executing the cells one by one:
+
+    - empty cells, comments, `RUN true` and *Magics* not building anything are dropped
+    - metadata instructions such as `LABEL` or `CMD` without variables are moved to the end of their build stage
+      or before the next `SHELL` instruction, keeping their order
+    - consecutive `%install` cells of the same package manager are folded into one `RUN` instruction,
+      packages queued by `%install queue` are installed where the queue is flushed
+    - consecutive `RUN` instructions with the same flags are merged into one, commands changing the shell's state run in a subshell
+
+    Args:
+        cells (list[str]): The sources of the code cells in order.
+
+    Returns:
+        str: The optimized *Dockerfile* code.
+    """
+    codes: list[str] = []
+    installs: dict[int, tuple[str, list[str]]] = {}
+    buildargs: dict[str, str] = {}
+    queue: list[tuple[str, list[str]]] | None = None
+
+    def install(manager: str, packages: list[str]):
+        manager = PACKAGE_MANAGERS.get(manager, manager)
+        install_code = Install.install_code(manager, packages)
+        if install_code is not None:
+            # Kept for the stage indices of the cells after it
+            installs[len(codes)] = (manager, packages)
+            codes.append(install_code.format(newLine="&& "))
+
+    for cell in cells:
+        code = cell.strip()
+        if not code:
+            continue
+        if code.startswith("%"):
+            MagicClass, args, _ = Magic.detect_magic(code)
+            if MagicClass is Install and len(args) == 1:
+                # Queued packages are installed where the queue is flushed
+                if args[0].lower() == "queue":
+                    queue = queue if queue is not None else []
+                elif args[0].lower() == "flush":
+                    for manager, packages in queue or []:
+                        install(manager, packages)
+                    queue = None
+            elif MagicClass is Install and len(args) >= 2:
+                if queue is not None:
+                    Install.enqueue(queue, args[0], list(args[1:]))
+                else:
+                    install(args[0].lower(), list(args[1:]))
+            elif MagicClass is Arg:
+                _apply_arg(buildargs, args)
+            continue
+        codes.append(code)
+
+    # The kernel's build stage indices become docker build stage numbers
+    codes = resolve_stage_indices(plan_cells(codes))
+    stages: list[list[Instruction]] = [[]]
+    for position, code in enumerate(codes):
+        if position in installs:
+            manager, packages = installs[position]
+            stages[-1].append(
+                Instruction("%install", manager, packages=tuple(packages))
+            )
+            continue
+        for keyword, arguments in split_instructions(code):
+            if keyword == "FROM":
+                stages.append([])
+            stages[-1].append(_instruction(keyword, arguments))
+
+    lines = [
+        f"# docker build --build-arg {name}={value}"
+        for name, value in buildargs.items()
+    ]
+    for stage in stages:
+        if not stage:
+            continue
+        if lines:
+            lines.append("")
+        lines.extend(
+            _render(i) for i in _merge_runs(_fold_installs(_move_metadata(stage)))
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _apply_arg(buildargs: dict[str, str], args: tuple[str, ...]):
+    """Follow the build arguments set and removed by `%arg` cells."""
+    if not args:
+        return
+    if args[0].lower() in ("rm", "remove"):
+        if len(args) == 1:
+            buildargs.clear()
+        for name in args[1:]:
+            buildargs.pop(name, None)
+        return
+    for arg in args:
+        name, separator, value = arg.partition("=")
+        if separator:
+            buildargs[name] = value
+
+
+def _instruction(keyword: str, arguments: str) -> Instruction:
+    if keyword != "RUN":
+        return Instruction(keyword, arguments)
+    flags, command = split_flags(arguments)
+    # Exec form and heredocs are kept as they are
+    if command.startswith("[") or HEREDOC_REGEX.search(command):
+        return Instruction(keyword, arguments)
+    flag_string = " ".join(
+        f"--{name}={value}" if value else f"--{name}" for name, value in flags.items()
+    )
+    return Instruction(keyword, command, flag_string, (command,))
+
+
+def _move_metadata(stage: list[Instruction]) -> list[Instruction]:
+    """Move metadata instructions to the end of a build stage, so that changing them keeps the cache of the others.
+
+    They are not moved past a `SHELL` instruction, which changes how the shell form of e.g. `CMD` is run.
+    """
+    moved: list[Instruction] = []
+    metadata: list[Instruction] = []
+    for instruction in stage:
+        if instruction.keyword == "SHELL":
+            moved.extend(metadata)
+            metadata.clear()
+        # Variables might be changed by the instructions after them
+        if (
+            instruction.keyword in METADATA_KEYWORDS
+            and "$" not in instruction.arguments
+        ):
+            metadata.append(instruction)
+        else:
+            moved.append(instruction)
+    return moved + metadata
+
+
+def _fold_installs(stage: list[Instruction]) -> list[Instruction]:
+    """Fold consecutive `%install` cells of the same package manager into one.
+
+    Cells of another package manager in between are not skipped, their packages might be needed by the later cells.
+    """
+    folded: list[Instruction] = []
+    for instruction in stage:
+        previous = folded[-1] if folded else None
+        if (
+            instruction.keyword != "%install"
+            or previous is None
+            or previous.keyword != "%install"
+            or previous.arguments != instruction.arguments
+        ):
+            folded.append(instruction)
+            continue
+        packages = previous.packages + tuple(
+            p for p in instruction.packages if p not in previous.packages
+        )
+        folded[-1] = previous._replace(packages=packages)
+    return folded
+
+
+def _merge_runs(stage: list[Instruction]) -> list[Instruction]:
+    """Merge consecutive `RUN` instructions in shell form with the same flags.
+
+    Commands with a comment are not merged, the comment would swallow the commands joined after it.
+    """
+    merged: list[Instruction] = []
+    custom_shell = False
+    for instruction in stage:
+        if instruction.keyword == "SHELL":
+            # `&&` might not chain commands in other shells
+            custom_shell = True
+        if instruction.commands:
+            commands = tuple(
+                c for c in instruction.commands if c.strip() not in NOOP_COMMANDS
+            )
+            if not commands:
+                continue
+            instruction = instruction._replace(commands=commands)
+            previous = merged[-1] if merged else None
+            if (
+                not custom_shell
+                and previous is not None
+                and previous.commands
+                and previous.flags == instruction.flags
+                and not any(_has_comment(c) for c in previous.commands + commands)
+            ):
+                merged[-1] = previous._replace(commands=previous.commands + commands)
+                continue
+        merged.append(instruction)
+    return merged
+
+
+def _render(instruction: Instruction) -> str:
+    if instruction.keyword == "%install":
+        code = Install.install_code(instruction.arguments, list(instruction.packages))
+        return code.format(newLine="&&" + LINE_BREAK)
+    if not instruction.commands:
+        return f"{instruction.keyword} {instruction.arguments}".rstrip()
+    commands = instruction.commands
+    if len(commands) > 1:
+        commands = tuple(_chainable(command) for command in commands)
+    flags = f"{instruction.flags} " if instruction.flags else ""
+    return f"RUN {flags}" + (LINE_BREAK + "&& ").join(commands)
+
+
+def _chainable(command: str) -> str:
+    """Run a command in a subshell if chaining it with `&&` would change its outcome or that of other commands."""
+    if COMPOUND_REGEX.search(command) or SHELL_STATE_REGEX.search(command):
+        return f"( {command} )"
+    return command
+
+
+def _has_comment(command: str) -> bool:
+    """Check if a shell command contains an unquoted `#`, which might start a comment."""
+    quote = None
+    escaped = False
+    for char in command:
+        if escaped:
+            escaped = False
+        elif char == "\\" and quote != "'":
+            escaped = True
+        elif quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "#":
+            return True
+    return False
@@ -1,4 +1,9 @@
-from ipylab import JupyterFrontEnd
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ipylab import JupyterFrontEnd
 
 
 class FrontendInteraction:
@@ -7,6 +12,17 @@ class FrontendInteraction:
     def __init__(self, app: JupyterFrontEnd):
         self.app = app
 
+    @classmethod
+    def create(cls) -> FrontendInteraction:
+        """Connect to the frontend, importing `ipylab` only once it is needed.
+
+        Returns:
+            FrontendInteraction: Interaction with a new `JupyterFrontEnd`.
+        """
+        from ipylab import JupyterFrontEnd
+
+        return cls(JupyterFrontEnd())
+
     def handle_code(self, code: str):
         """Entry method to be used in every code execution.
 
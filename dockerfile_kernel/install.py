@@ -5,8 +5,18 @@ import sys
 from jupyter_client.kernelspec import KernelSpecManager
 from IPython.utils.tempdir import TemporaryDirectory
 
+# Name of the installed kernel spec
+KERNEL_NAME = "docker"
+
 kernel_json = {
-    "argv": [sys.executable, "-m", "dockerfile_kernel", "-f", "{connection_file}"],
+    "argv": [
+        sys.executable,
+        "-m",
+        "dockerfile_kernel",
+        "-f",
+        "{connection_file}",
+        f"--DockerKernel.kernel_name={KERNEL_NAME}",
+    ],
     "display_name": "Dockerfile",
     "language": "text",
 }
@@ -19,4 +29,4 @@ if __name__ == "__main__":
             json.dump(kernel_json, f, sort_keys=True)
 
         print("Installing Jupyter kernel spec for DockerKernel")
-        KernelSpecManager().install_kernel_spec(td, "docker", prefix=sys.prefix)
+        KernelSpecManager().install_kernel_spec(td, KERNEL_NAME, prefix=sys.prefix)
@@ -1,26 +1,90 @@
+from __future__ import annotations
+
+import json
+import queue
 import shutil
+from collections import deque
+from contextlib import nullcontext
 import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 
-import docker
-import json
 import os
-from typing import Tuple
+from typing import TYPE_CHECKING, Callable, Tuple
 from ipykernel.kernelbase import Kernel
+from traitlets import Bool, CaselessStrEnum, Integer, Unicode
 
-from ipylab import JupyterFrontEnd
-
+from .builders import Builder, BuildKitBuilder, ClassicBuilder
+from .builders.builder import HEARTBEAT
+from . import magics
 from .magics.magic import Magic
 from .utils.notebook import get_cursor_frame, get_cursor_words, get_line_start
-from .utils.filesystem import create_dockerfile, copy_files, empty_dir, get_dir_size
+from .utils.filesystem import (
+    FileCopier,
+    ManifestEntry,
+    create_dockerfile,
+    empty_dir,
+    get_dir_size,
+    sync_files,
+    sync_paths,
+)
 from .utils.dockerignore import preporcessed_dockerignore, dockerignore
+from .utils.background import BackgroundTask
+from .utils.batch import (
+    read_code_cells,
+    BatchCell,
+    StepTracker,
+    plan_cells,
+    resolve_stage_indices,
+    stage_units,
+    unit_code,
+)
+from .utils.cache import BuildCache, build_key, cache_dir
+from .utils.compression import COMPRESSION_MODES, CompressionPolicy
+from .utils.instructions import (
+    PREDEFINED_ARGS,
+    context_sources,
+    declared_args,
+    has_remote_sources,
+    split_instructions,
+)
+from .utils.gc import (
+    GarbageReport,
+    ImageLedger,
+    collect_garbage,
+    parse_size,
+    stored_images,
+)
+from .utils.profile import BuildProfile
+from .utils.pull import ImagePuller, base_images
+from .utils.state import (
+    load_state,
+    notebook_file,
+    notebook_path,
+    save_state,
+    state_path,
+)
+from .utils.stream import CompactProgress, OutputBatcher
+from .utils.tarball import ContextArchive, context_digest, context_tar
+from .utils.watcher import ContextWatcher
 from .magics.helper.errors import MagicError
 from .frontend.interaction import FrontendInteraction
-from docker.errors import APIError
-from prettytable import PrettyTable
+
+# Imported on first use to keep the kernel's startup fast
+if TYPE_CHECKING:
+    import docker
+    from prettytable import PrettyTable
 
 # The single source of version truth
 __version__ = "0.0.1"
 
+# Number of executions whose profiles are kept for `%profile`
+PROFILE_HISTORY = 200
+# Seconds between automatic garbage collections
+GC_INTERVAL = 60
+
 
 class DockerKernel(Kernel):
     """Docker kernel for Jupyter.
@@ -32,7 +96,6 @@ class DockerKernel(Kernel):
     implementation = "Dockerfile Kernel"
     implementation_version = __version__
     language = "docker"
-    language_version = docker.__version__
     language_info = {
         "name": "docker",
         "mimetype": "text/x-dockerfile",
@@ -41,6 +104,120 @@ class DockerKernel(Kernel):
     }
     banner = "Dockerfile Kernel"
 
+    docker_url = Unicode(
+        "unix:///var/run/docker.sock",
+        help="""URL of the docker daemon, e.g. 'unix:///var/run/docker.sock' or 'tcp://127.0.0.1:2375'.
+        Used by both build backends.""",
+    ).tag(config=True)
+
+    context_mode = CaselessStrEnum(
+        ["mirror", "stream"],
+        default_value="mirror",
+        help="""How the build context is sent to the docker daemon.
+        'mirror' copies the build context into a temporary directory,
+        'stream' archives it straight from its source directory on every build.""",
+    ).tag(config=True)
+
+    build_backend = CaselessStrEnum(
+        ["classic", "buildkit"],
+        default_value="classic",
+        help="""The builder images are built with.
+        'classic' uses the docker daemon's classic builder,
+        'buildkit' uses BuildKit through the `docker buildx build` CLI.""",
+    ).tag(config=True)
+
+    progress_mode = CaselessStrEnum(
+        ["full", "compact"],
+        default_value="full",
+        help="""How build logs are shown.
+        'full' streams the whole log in batches,
+        'compact' shows the current build step and its latest output lines in a single updated display.""",
+    ).tag(config=True)
+
+    minimal_context = Bool(
+        True,
+        help="""Only send the build context paths referenced by a cell's COPY and ADD instructions.
+        Cells without such instructions are built with an empty build context.""",
+    ).tag(config=True)
+
+    context_copy_mode = CaselessStrEnum(
+        list(FileCopier.MODES),
+        default_value="auto",
+        help="""How files are copied into the mirrored build context.
+        'auto' uses the cheapest mechanism the file system supports: reflinks, copy_file_range, sendfile or a plain copy,
+        'hardlink' links the files instead, so that the mirror shares the inodes of the build context directory,
+        'copy' always reads and writes the files.""",
+    ).tag(config=True)
+
+    reuse_context_archive = Bool(
+        True,
+        help="""Archive the mirrored build context once and reuse the archive for following builds while the
+        build context is unchanged, only adding each cell's Dockerfile.
+        The archive is kept in a temporary file as large as the build context.""",
+    ).tag(config=True)
+
+    context_compression = CaselessStrEnum(
+        list(COMPRESSION_MODES),
+        default_value="auto",
+        help="""How the build context is compressed when it is uploaded to the docker daemon by the classic builder.
+        'gzip' compresses it on several threads, 'none' sends it uncompressed,
+        'auto' compresses once the measured upload speed makes compressing the build context faster than sending it as is,
+        e.g. for a remote or tunnelled daemon.""",
+    ).tag(config=True)
+
+    prepull_images = Bool(
+        True,
+        help="""Pull the base images referenced by the notebook's FROM instructions in the background,
+        when the kernel starts and when the first cell is executed.""",
+    ).tag(config=True)
+
+    max_parallel_pulls = Integer(
+        3,
+        help="""Number of base images pulled in the background at the same time.""",
+    ).tag(config=True)
+
+    image_budget = Unicode(
+        "",
+        help="""Disk space the image layers on the docker daemon may take, e.g. '20GB'.
+        Once exceeded, the least recently used images built by kernels are removed after a build,
+        except for tagged images and build stages. Empty disables the automatic removal, see `%gc`.""",
+    ).tag(config=True)
+
+    install_cache_mounts = Bool(
+        True,
+        help="""Keep the downloads of `%install` in BuildKit cache mounts instead of removing them,
+        so that they are not downloaded again by later installations. Only used by the 'buildkit' backend.""",
+    ).tag(config=True)
+
+    watch_context = Bool(
+        False,
+        help="""Watch the build context directory with inotify (Linux only) and apply changes to the mirrored
+        build context before the next build, instead of only when `%context` is executed.""",
+    ).tag(config=True)
+
+    build_cache = Bool(
+        True,
+        help="""Reuse the image of a previous build with identical code, parent image, build arguments and build context files
+        instead of building again. Builds are remembered across kernels in the user's cache directory.""",
+    ).tag(config=True)
+
+    persist_state = Bool(
+        True,
+        help="""Store the current image, build stages and build arguments after each build,
+        so that a restarted kernel of the same notebook can resume with `%resume`.""",
+    ).tag(config=True)
+
+    kernel_name = Unicode(
+        "docker",
+        help="""Name of the kernel spec the kernel was started with.
+        The state is stored per notebook and kernel name, so that kernels of different kernel specs don't share it.""",
+    ).tag(config=True)
+
+    auto_resume = Bool(
+        False,
+        help="""Resume the stored state of the notebook before the first cell is executed.""",
+    ).tag(config=True)
+
     # source of keywords: https://docs.docker.com/engine/reference/builder/
     keywords = {
         "ARG": ["<name>[=<default value>]"],
@@ -107,7 +284,11 @@ class DockerKernel(Kernel):
     def __init__(self, *args, **kwargs):
         """Initialize the kernel."""
         super().__init__(**kwargs)
-        self._api = docker.APIClient(base_url="unix://var/run/docker.sock")
+        self._api_client: docker.APIClient | None = None
+        self._builders = {
+            "classic": ClassicBuilder(self),
+            "buildkit": BuildKitBuilder(self),
+        }
         self._sha1: str | None = None
         self._buildargs = {}
         self._payload = []
@@ -117,27 +298,51 @@ class DockerKernel(Kernel):
         self._frontend = None
         self._tmp_dir = tempfile.TemporaryDirectory()
         self._build_context_dir: str | None = None
+        self._context_manifest: dict[str, ManifestEntry | None] = {}
+        self._context_watcher: ContextWatcher | None = None
+        self._context_ignore = None
+        self._copier = FileCopier(self.context_copy_mode)
+        self._context_archive = ContextArchive(self._tmp_dir.name)
+        self._compression = CompressionPolicy()
         self._build_context_warning_shown = False
-
-        # Only set cwd as curretn context when its not exceeding a certain threshold
-        # Threshold: 100MiB = 104,857,600 bytes
-        THRESHOLD = 104_857_600
-        docker_ignore_rules = preporcessed_dockerignore(os.getcwd())
-        ignore_function = dockerignore(os.getcwd(), docker_ignore_rules)
-        cwd_size = get_dir_size(os.getcwd(), ignore_function)
-        if cwd_size < THRESHOLD:
-            self._build_context_dir: str | None = os.getcwd()
-        # Keep _build_context_dir as None to trigger context prompt on next code execution
-        self.change_build_context_directory(self._build_context_dir)
+        self._build_cache = BuildCache(os.path.join(cache_dir(), "builds.json"))
+        self._state_path = state_path(notebook_path(), self.kernel_name)
+        self._resume_checked = False
+        self._profile: BuildProfile | None = None
+        self._profiles: deque[BuildProfile] = deque(maxlen=PROFILE_HISTORY)
+        self._puller = ImagePuller(self._create_api, self.max_parallel_pulls)
+        self._image_ledger = ImageLedger(os.path.join(cache_dir(), "images.json"))
+        self._last_gc = float("-inf")
+        self._prepull_checked = False
+        # Packages of `%install` cells collected until `%install flush`, `None` if not queueing
+        self._install_queue: list[tuple[str, list[str]]] | None = None
+
+        # Prepared in the background, the kernel answers requests meanwhile
+        self._context_task: BackgroundTask | None = BackgroundTask(
+            self._prepare_initial_context
+        )
+        if self.prepull_images:
+            BackgroundTask(lambda cancel: self._prepull())
 
     def __del__(self):
         """Destruction of `DockerKernel` instance"""
         try:
+            if self._context_task is not None:
+                self._context_task.cancel()
+            self._puller.close()
+            self._stop_watching()
             self._tmp_dir.cleanup()
             self.send_response("Temporary directory removed")
         except Exception as e:
             self.send_response(str(e))
 
+    @property
+    def language_version(self) -> str:
+        """Version of the docker SDK images are built with."""
+        import docker
+
+        return docker.__version__
+
     @property
     def kernel_info(self):
         """Extends kernel info of `ipykernel.kernelbase.Kernel`.
@@ -168,11 +373,17 @@ class DockerKernel(Kernel):
         ####################
         # Prepare kernel for code execution
         self.reset_payload()
+        self._profile = BuildProfile(self.execution_count, code)
         self._frontend = (
             self._frontend
             if self._frontend is not None
-            else FrontendInteraction(JupyterFrontEnd())
+            else FrontendInteraction.create()
         )
+        if self.auto_resume and not self._resume_checked:
+            self._auto_resume()
+        if self.prepull_images and not self._prepull_checked:
+            self._prepull_checked = True
+            self._prepull([code])
 
         ####################
         # Magic execution
@@ -195,6 +406,8 @@ class DockerKernel(Kernel):
                 "evalue": str(e),
                 "traceback": [],
             }
+        except KeyboardInterrupt:
+            return self._interrupted_reply()
 
         ####################
         # Frontend execution
@@ -206,14 +419,22 @@ class DockerKernel(Kernel):
                 "evalue": "",
                 "traceback": [],
             }
-        # Show build context warning once
-        if self._build_context_dir is None and not self._build_context_warning_shown:
+        # Show build context warning once, as soon as it is known there is no build context
+        context_prepared = self._context_task is None or self._context_task.done()
+        if (
+            context_prepared
+            and self._build_context_dir is None
+            and not self._build_context_warning_shown
+        ):
             self._frontend.build_context_warning()
             self._build_context_warning_shown = True
 
         ####################
         # Docker execution
-        self.build_image(code)
+        try:
+            self.build_image(code)
+        except KeyboardInterrupt:
+            return self._interrupted_reply()
         return {
             "status": "ok",
             "execution_count": self.execution_count,
@@ -221,6 +442,92 @@ class DockerKernel(Kernel):
             "user_expression": {},
         }
 
+    def _prepull(self, codes: list[str] | None = None):
+        """Start pulling the base images of the notebook and *codes* in the background.
+
+        Args:
+            codes (list[str] | None, optional): Code of cells not saved in the notebook yet, e.g. the cell executed.
+                Defaults to None.
+        """
+        codes = list(codes or [])
+        path = notebook_file()
+        if path is not None:
+            cells = read_code_cells(path)
+            if not isinstance(cells, Exception):
+                codes = cells + codes
+        self._puller.pull(base_images(codes))
+
+    def _wait_for_pulls(self, build_code: str):
+        """Attach to the background pulls of the base images of *build_code*, showing their progress.
+
+        Args:
+            build_code (str): The code to be built.
+
+        Raises:
+            KeyboardInterrupt: Waiting was interrupted, the pulls continue in the background.
+        """
+        pulls = self._puller.in_flight(base_images([build_code]))
+        if not pulls:
+            return
+        display_id = uuid.uuid4().hex
+        update = False
+        for progress in self._puller.wait(pulls):
+            self.send_display(progress, display_id, update)
+            update = True
+
+    def _auto_resume(self):
+        """Resume the stored state once, before the first cell is executed."""
+        self._resume_checked = True
+        if load_state(self._state_path) is None:
+            return
+        try:
+            self.resume_state()
+        except MagicError as e:
+            self.send_response(f"Stored state not resumed: {e}\n")
+
+    def finish_metadata(self, parent, metadata: dict, reply_content: dict) -> dict:
+        """Add the profile of the execution to the metadata of the execute reply.
+
+        See [here](https://jupyter-client.readthedocs.io/en/stable/messaging.html#execution-results) for more info.
+        """
+        metadata = super().finish_metadata(parent, metadata, reply_content)
+        profile, self._profile = self._profile, None
+        if profile is not None and (profile.phases or profile.steps):
+            profile.finish()
+            self._profiles.append(profile)
+            metadata["profile"] = profile.to_dict()
+        return metadata
+
+    def _phase(self, name: str):
+        """Time a phase of the current execution.
+
+        Args:
+            name (str): Name of the phase.
+
+        Returns:
+            ContextManager: Context manager timing its body.
+        """
+        if self._profile is None:
+            return nullcontext()
+        return self._profile.phase(name)
+
+    def _interrupted_reply(self):
+        """Reply to an execution stopped by a kernel interrupt."""
+        return {
+            "status": "error",
+            "ename": "KeyboardInterrupt",
+            "evalue": "Execution interrupted",
+            "traceback": [],
+        }
+
+    def use_cache_mounts(self) -> bool:
+        """Whether `%install` keeps its downloads in BuildKit cache mounts.
+
+        Returns:
+            bool: `True` if enabled and images are built with BuildKit.
+        """
+        return self.install_cache_mounts and self.build_backend == "buildkit"
+
     def create_build_stage(self, code: str):
         """Add current `_sha1` to the code.
 
@@ -253,6 +560,25 @@ class DockerKernel(Kernel):
             self.iopub_socket, "stream", {"name": "stdout", "text": content_text}
         )
 
+    def send_display(self, content_text: str, display_id: str, update: bool = False):
+        """Show text in a display that can be updated later on.
+
+        Args:
+            content_text (str): Text to be displayed.
+            display_id (str): Identifies the display.
+            update (bool, optional): Replace the content of the existing display.
+                Defaults to False.
+        """
+        super().send_response(
+            self.iopub_socket,
+            "update_display_data" if update else "display_data",
+            {
+                "data": {"text/plain": content_text},
+                "metadata": {},
+                "transient": {"display_id": display_id},
+            },
+        )
+
     @property
     def payload(self) -> list[dict[str, str]]:
         return self._payload
@@ -323,6 +649,27 @@ class DockerKernel(Kernel):
     # Docker functionality
     ########################################
 
+    @property
+    def _api(self) -> docker.APIClient:
+        """Client of the kernel's thread, connected to the docker daemon on first use."""
+        if self._api_client is None:
+            self._api_client = self._create_api()
+        return self._api_client
+
+    def _create_api(self, version: str | None = None) -> docker.APIClient:
+        """Connect to the docker daemon.
+
+        Args:
+            version (str | None, optional): The API version, detected by asking the daemon if `None`.
+                Defaults to None.
+
+        Returns:
+            docker.APIClient: A new client, not to be shared between threads.
+        """
+        import docker
+
+        return docker.APIClient(base_url=self.docker_url, version=version)
+
     def tag_image(self, name: str, tag: str | None = None):
         """Tag an image.
 
@@ -352,35 +699,547 @@ class DockerKernel(Kernel):
 
         Args:
             code (str): The user's code.
+
+        Raises:
+            KeyboardInterrupt: The build was interrupted and has been cancelled.
         """
-        tmp_dir = self._tmp_dir.name
         build_code = self.create_build_stage(code)
-        dockerfile_path = create_dockerfile(build_code, tmp_dir)
+        with self._phase("context"):
+            context_dir, ignore_function, sources = self._context_source(build_code)
+        with self._phase("cache lookup"):
+            cache_key = self._build_cache_key(
+                build_code, context_dir, ignore_function, sources
+            )
+            if cache_key is not None and self._use_cached_build(code, cache_key):
+                if self._profile is not None:
+                    self._profile.cached_build = True
+                return
+
+        with self._phase("pull wait"):
+            self._wait_for_pulls(build_code)
+        with self._phase("context"):
+            context = self._build_context(
+                build_code, context_dir, ignore_function, sources
+            )
+        builder = self._builders[self.build_backend]
+        if not self._run_build(builder, context):
+            return
+        if cache_key is not None and self._sha1 is not None:
+            self._build_cache.set(cache_key, self._sha1)
+        self._save_build_stage(code, self._sha1)
+        self._store_state()
+        self._image_ledger.touch(self._sha1)
+        self._profile_layers()
+        self._auto_collect_garbage()
+
+    def _profile_layers(self):
+        """Record the size of the built image and its newest layers in the current profile."""
+        from docker.errors import APIError
+
+        if self._profile is None or self._sha1 is None:
+            return
+        with self._phase("layer sizes"):
+            try:
+                history = self._api.history(self._sha1)
+            except APIError:
+                return
+        self._profile.image_size = sum(layer.get("Size", 0) for layer in history)
+        # History starts with the newest layer
+        count = self._profile.layer_steps
+        self._profile.set_layer_sizes(
+            [layer.get("Size", 0) for layer in history[:count]][::-1]
+        )
+
+    def _run_build(
+        self,
+        builder: Builder,
+        context: dict,
+        log_handler: Callable[[str], None] | None = None,
+    ) -> bool:
+        """Run a build and show its log, setting `_sha1` to the built image.
 
+        Args:
+            builder (Builder): The build backend.
+            context (dict[str, Any]): Build context and *Dockerfile* as returned by `_build_context`.
+            log_handler (Callable[[str], None] | None, optional): Receives every log message of the build as well.
+                Defaults to None.
+
+        Returns:
+            bool: `True` if the build succeeded.
+
+        Raises:
+            KeyboardInterrupt: The build was interrupted and has been cancelled.
+        """
+        from docker.errors import APIError
+
+        output = self._build_output()
+        profile = self._profile
+        start = time.perf_counter()
+        first_message: float | None = None
         try:
-            for logline in self._api.build(
-                buildargs=self._buildargs,
-                path=tmp_dir,
-                dockerfile=dockerfile_path,
-                rm=True,
-            ):
-                loginfo = json.loads(logline.decode())
+            for loginfo in builder.build(context, self._buildargs):
+                if profile is not None and loginfo:
+                    if first_message is None:
+                        # The daemon starts responding once the build context is received
+                        first_message = time.perf_counter()
+                        profile.phases["upload"] = first_message - start
+                    profile.record(loginfo)
                 if "error" in loginfo:
+                    output.flush()
                     self.send_response(f'\nerror: {loginfo["error"]}\n')
-                    return
+                    return False
                 if "aux" in loginfo:
                     self._sha1 = loginfo["aux"]["ID"]
                 if "stream" in loginfo:
                     log = loginfo["stream"]
+                    if log_handler is not None:
+                        log_handler(log)
                     if log.strip() != "":
-                        self.send_response(log)
-        except APIError as e:
-            if e.explanation is not None:
-                self.send_response(str(e.explanation))
+                        output.write(log)
+                output.tick()
+        except KeyboardInterrupt:
+            output.flush()
+            self.send_response("\nBuild interrupted\n")
+            raise
+        except (APIError, OSError, json.JSONDecodeError) as e:
+            # Files changing during the upload and responses ending within a message are reported like daemon errors
+            output.flush()
+            explanation = getattr(e, "explanation", None)
+            if explanation is not None:
+                self.send_response(str(explanation))
             else:
                 self.send_response(str(e))
+            return False
+        finally:
+            if profile is not None and first_message is not None:
+                profile.phases["build"] = time.perf_counter() - first_message
+        output.flush()
+        return True
+
+    def build_notebook(self, cells: list[str], jobs: int = 1):
+        """Build the code cells of a whole notebook at once.
+
+        The cells are joined into one multi-stage *Dockerfile* which is built by the classic builder.
+        With more than one job, build stages not depending on each other are built concurrently instead.
+        The images of the build steps are mapped back onto the cells, resulting in the same build stages as executing each cell.
+        `%install` cells are expanded and `%arg` cells are applied before building, other *Magics* are skipped.
+
+        Args:
+            cells (list[str]): The sources of the code cells in order.
+            jobs (int, optional): Number of builds running at the same time.
+                Defaults to 1.
+
+        Raises:
+            MagicError: If a *Magic* cell is invalid.
+            KeyboardInterrupt: The build was interrupted and has been cancelled.
+        """
+        codes: list[str] = []
+        skipped: list[str] = []
+        install_queue: list[tuple[str, list[str]]] | None = None
+        for cell in cells:
+            code = cell.strip()
+            if not code:
+                continue
+            if code.startswith("%"):
+                MagicClass, args, flags = Magic.detect_magic(code)
+                if MagicClass is magics.Arg:
+                    MagicClass(self, *args, **flags).call_magic()
+                    continue
+                if MagicClass is not magics.Install:
+                    skipped.append(code.split()[0])
+                    continue
+                # Validates the arguments
+                MagicClass(self, *args, **flags)
+                if len(args) == 1:
+                    # Queued packages are installed where the queue is flushed
+                    if args[0].lower() == "queue":
+                        install_queue = (
+                            install_queue if install_queue is not None else []
+                        )
+                    elif args[0].lower() == "flush":
+                        codes.extend(
+                            c.format(newLine="&& ")
+                            for c in magics.Install.queued_code(install_queue or [])
+                        )
+                        install_queue = None
+                    else:
+                        raise MagicError("Missing argument: package at position 2")
+                    continue
+                code = magics.Install.install_code(args[0], list(args[1:]))
+                if code is None:
+                    raise MagicError(f"Package manager not available: {args[0]}")
+                if install_queue is not None:
+                    magics.Install.enqueue(install_queue, args[0], list(args[1:]))
+                    continue
+                code = code.format(newLine="&& ")
+            codes.append(code)
+
+        if skipped:
+            self.send_response(f"Skipped magics: {', '.join(skipped)}\n")
+        if not codes:
+            self.send_response("No code cells to be built\n")
+            return
+
+        batch = plan_cells(codes)
+        if jobs > 1:
+            images = self._build_units(batch, jobs)
+        else:
+            images = self._build_batch(batch)
+        if images is None:
             return
+
+        self._build_stage_indices = {}
+        self._build_stage_aliases = {}
+        self._latest_index = None
+        for cell, image_id in zip(batch, images):
+            self._save_build_stage(cell.code, image_id)
+        self._sha1 = images[-1]
+        self._store_state()
+        self._image_ledger.touch(*images)
+        steps = sum(cell.steps for cell in batch)
+        self.send_response(f"Built {len(batch)} cells in {steps} steps\n")
+        self._auto_collect_garbage()
+
+    def _build_batch(self, batch: list[BatchCell]) -> list[str | None] | None:
+        """Build the cells of a batch as a single *Dockerfile*.
+
+        Args:
+            batch (list[BatchCell]): The cells of the batch.
+
+        Returns:
+            list[str | None] | None: The image id of each cell. `None` if the build failed.
+        """
+        dockerfile = "\n".join(resolve_stage_indices(batch)) + "\n"
+        tracker = StepTracker()
+        # Only the classic builder reports the image of each step
+        if not self._run_build(
+            self._builders["classic"], self._batch_context(dockerfile), tracker.feed
+        ):
+            return None
+        return self._cell_images(batch, tracker, self._sha1)
+
+    def _build_units(
+        self, batch: list[BatchCell], jobs: int
+    ) -> list[str | None] | None:
+        """Build the units of a batch, building units not depending on each other concurrently.
+
+        Each build uses its own connection to the docker daemon. Log lines are prefixed with the unit's alias.
+
+        Args:
+            batch (list[BatchCell]): The cells of the batch.
+            jobs (int): Number of builds running at the same time.
+
+        Returns:
+            list[str | None] | None: The image id of each cell. `None` if a build failed.
+
+        Raises:
+            KeyboardInterrupt: The build was interrupted, all running builds have been cancelled.
+        """
+        from docker.errors import APIError
+
+        units = stage_units(batch)
+        labels = [
+            min(unit.aliases) if unit.aliases else f"stage {position}"
+            for position, unit in enumerate(units)
+        ]
+        # Steps of the global build arguments repeated in every unit but the first
+        global_steps = sum(cell.steps for cell in batch if cell.stage == -1)
+        messages: queue.Queue = queue.Queue()
+        builders: dict[int, ClassicBuilder] = {}
+        trackers = {position: StepTracker() for position in range(len(units))}
+        images: dict[int, str] = {}
+        failed = False
+
+        def build(position: int, context: dict) -> str | None:
+            image_id = None
+            for message in builders[position].build(context, self._buildargs):
+                if "aux" in message:
+                    image_id = message["aux"]["ID"]
+                messages.put((position, message))
+            return image_id
+
+        output = self._build_output()
+        pool = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="docker-stage")
+        running: dict[Future, int] = {}
+        pending = list(range(len(units)))
+        try:
+            while pending or running:
+                for position in list(pending):
+                    if failed or not units[position].dependencies <= images.keys():
+                        continue
+                    pending.remove(position)
+                    dockerfile = unit_code(batch, units, position, images)
+                    builders[position] = ClassicBuilder(
+                        self, api=self._create_api(self._api.api_version)
+                    )
+                    context = self._batch_context(dockerfile)
+                    running[pool.submit(build, position, context)] = position
+                if not running:
+                    # Dependencies failed
+                    break
+
+                # All messages of a finished build are queued already
+                done = [future for future in running if future.done()]
+                received = []
+                try:
+                    received.append(messages.get(block=not done, timeout=HEARTBEAT))
+                    while True:
+                        received.append(messages.get_nowait())
+                except queue.Empty:
+                    pass
+                for position, message in received:
+                    if "stream" in message:
+                        trackers[position].feed(message["stream"])
+                        for line in message["stream"].splitlines():
+                            if line.strip():
+                                output.write(f"[{labels[position]}] {line}\n")
+                    if "error" in message:
+                        output.flush()
+                        self.send_response(
+                            f'\n[{labels[position]}] error: {message["error"]}\n'
+                        )
+                output.tick()
+
+                for future in done:
+                    position = running.pop(future)
+                    try:
+                        image_id = future.result()
+                    except APIError as e:
+                        output.flush()
+                        explanation = e.explanation if e.explanation else e
+                        self.send_response(f"[{labels[position]}] {explanation}\n")
+                        image_id = None
+                    if image_id is None:
+                        failed = True
+                    else:
+                        images[position] = image_id
+        except KeyboardInterrupt:
+            for builder in builders.values():
+                builder.cancel()
+            output.flush()
+            self.send_response("\nBuild interrupted\n")
+            raise
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        output.flush()
+        if len(images) < len(units):
+            return None
+
+        cell_images: list[str | None] = [None] * len(batch)
+        for position, unit in enumerate(units):
+            offset = global_steps if position > 0 else 0
+            unit_cells = [batch[cell] for cell in unit.cells]
+            unit_images = self._cell_images(
+                unit_cells, trackers[position], images[position], offset
+            )
+            for cell, image_id in zip(unit.cells, unit_images):
+                cell_images[cell] = image_id
+        return cell_images
+
+    def _batch_context(self, dockerfile: str) -> dict:
+        """Get the build context arguments for a batch build.
+
+        Args:
+            dockerfile (str): The *Dockerfile* code.
+
+        Returns:
+            dict[str, Any]: Keyword arguments specifying the build context and *Dockerfile*.
+        """
+        context_dir, ignore_function, sources = self._context_source(dockerfile)
+        return self._build_context(
+            dockerfile, context_dir, ignore_function, sources, archive=True
+        )
+
+    def _cell_images(
+        self,
+        cells: list[BatchCell],
+        tracker: StepTracker,
+        image_id: str,
+        offset: int = 0,
+    ) -> list[str | None]:
+        """Map the images of the build steps onto the cells they were built from.
+
+        Args:
+            cells (list[BatchCell]): The cells built, in order.
+            tracker (StepTracker): The build steps of the build.
+            image_id (str): The image the build resulted in.
+            offset (int, optional): Number of steps before the first cell.
+                Defaults to 0.
+
+        Returns:
+            list[str | None]: The image id of each cell.
+        """
+        full_ids: dict[str | None, str | None] = {}
+        images = []
+        step = offset
+        for cell in cells[:-1]:
+            step += cell.steps
+            short_id = tracker.image(step)
+            if short_id not in full_ids:
+                full_ids[short_id] = self._full_image_id(short_id)
+            images.append(full_ids[short_id])
+        return images + [image_id]
+
+    def _full_image_id(self, short_id: str | None) -> str | None:
+        """Look up the full id of an image.
+
+        Args:
+            short_id (str | None): The short id of an image.
+
+        Returns:
+            str | None: The full id including the digest algorithm. `None` if the image is unknown.
+        """
+        from docker.errors import APIError
+
+        if short_id is None:
+            return None
+        try:
+            return self._api.inspect_image(short_id)["Id"]
+        except APIError:
+            return None
+
+    def _build_cache_key(
+        self,
+        build_code: str,
+        context_dir: str | None,
+        ignore_function,
+        sources: list[str] | None,
+    ) -> str | None:
+        """Identify a build by all of its inputs.
+
+        Args:
+            build_code (str): The code to be built.
+            context_dir (str | None): Path of the build context directory.
+            ignore_function (Callable[[str, list[str]], Iterable[str]] | None): Ignore callable for the build context.
+            sources (list[str] | None): The build context paths sent, `None` for all.
+
+        Returns:
+            str | None: The build key. `None` if the build can't be cached.
+        """
+        # Remote sources may change without any of the inputs changing
+        if not self.build_cache or has_remote_sources(build_code):
+            return None
+        relevant_args = declared_args(build_code) | PREDEFINED_ARGS
+        buildargs = {k: v for k, v in self._buildargs.items() if k in relevant_args}
+        try:
+            digest = context_digest(context_dir, ignore_function, sources)
+        except OSError:
+            return None
+        return build_key(build_code, self._sha1, buildargs, digest)
+
+    def _use_cached_build(self, code: str, cache_key: str) -> bool:
+        """Use the image of a previous identical build if it still exists.
+
+        Args:
+            code (str): The user's code.
+            cache_key (str): The build key.
+
+        Returns:
+            bool: `True` if the cached image is used.
+        """
+        from docker.errors import APIError
+
+        image_id = self._build_cache.get(cache_key)
+        if image_id is None:
+            return False
+        try:
+            self._api.inspect_image(image_id)
+        except APIError:
+            # Removed since, e.g. by `docker image prune`
+            self._build_cache.remove(cache_key)
+            return False
+        self._sha1 = image_id
+        self.send_response(f"Using cached build {image_id.split(':')[-1][:12]}\n")
         self._save_build_stage(code, self._sha1)
+        self._store_state()
+        self._image_ledger.touch(self._sha1)
+        return True
+
+    def _build_output(self) -> OutputBatcher:
+        """Create the writer build logs are sent to the frontend with.
+
+        Returns:
+            OutputBatcher: Batches the log depending on `progress_mode`.
+        """
+        if self.progress_mode == "compact":
+            display_id = uuid.uuid4().hex
+            return CompactProgress(
+                lambda text, update: self.send_display(text, display_id, update)
+            )
+        return OutputBatcher(self.send_response)
+
+    def _context_source(self, build_code: str):
+        """Get where the build context of a build is taken from.
+
+        With `minimal_context` only the paths referenced by `COPY` and `ADD` instructions are sent.
+
+        Args:
+            build_code (str): The code to be built.
+
+        Returns:
+            tuple[str | None, Callable[[str, list[str]], Iterable[str]] | None, list[str] | None]: The build context directory,
+                its ignore callable and the paths to be sent (`None` for all).
+        """
+        sources = context_sources(build_code) if self.minimal_context else None
+        # Nothing is sent, no need to wait for the build context
+        if sources == []:
+            return None, None, sources
+        self._wait_for_context()
+        # The mirror is filtered already
+        if self.context_mode == "mirror":
+            self._apply_context_changes()
+            return self._tmp_dir.name, None, sources
+
+        context_dir, ignore_function = self._build_context_dir, None
+        if context_dir:
+            docker_ignore_rules = preporcessed_dockerignore(context_dir)
+            ignore_function = dockerignore(context_dir, docker_ignore_rules)
+        return context_dir, ignore_function, sources
+
+    def _build_context(
+        self,
+        build_code: str,
+        context_dir: str | None,
+        ignore_function,
+        sources: list[str] | None,
+        archive: bool = False,
+    ) -> dict:
+        """Get the build context arguments for `docker.APIClient.build`.
+
+        Args:
+            build_code (str): The code to be built.
+            context_dir (str | None): Path of the build context directory, as returned by `_context_source`.
+            ignore_function (Callable[[str, list[str]], Iterable[str]] | None): Ignore callable for the build context.
+            sources (list[str] | None): The build context paths to be sent, `None` for all.
+            archive (bool, optional): Always send an archive, e.g. for builds running concurrently.
+                Otherwise a mirrored build context is sent with the *Dockerfile* written into it.
+                Defaults to False.
+
+        Returns:
+            dict[str, Any]: Keyword arguments specifying the build context and *Dockerfile*.
+        """
+        if (
+            self.context_mode == "mirror"
+            and sources is None
+            and context_dir == self._tmp_dir.name
+            and self.reuse_context_archive
+        ):
+            # The mirror only changes with its manifest, so its archived files can be replayed
+            return {
+                "fileobj": self._context_archive.archive(
+                    self._context_manifest, build_code
+                ),
+                "custom_context": True,
+                "dockerfile": "Dockerfile",
+            }
+        if self.context_mode == "mirror" and sources is None and not archive:
+            dockerfile_path = create_dockerfile(build_code, context_dir)
+            return {"path": context_dir, "dockerfile": dockerfile_path}
+        return {
+            "fileobj": context_tar(context_dir, build_code, ignore_function, sources),
+            "custom_context": True,
+            "dockerfile": "Dockerfile",
+        }
 
     def _save_build_stage(self, code: str, image_id: str):
         """Save build stage with an index and - if provided - an alias.
@@ -401,11 +1260,118 @@ class DockerKernel(Kernel):
         )
 
         alias = None
-        if len(remain) > 1 and remain[1] == "as":
+        if len(remain) > 1 and remain[1].lower() == "as":
             alias = remain[2]
             self._build_stage_aliases[alias] = self._latest_index
         self._build_stage_indices[self._latest_index] = (image_id, alias)
 
+    def _store_state(self):
+        """Store the current image, build stages and build arguments for `resume_state`."""
+        if not self.persist_state:
+            return
+        state = {
+            "image": self._sha1,
+            "stages": self._build_stage_indices,
+            "aliases": self._build_stage_aliases,
+            "latest_index": self._latest_index,
+            "buildargs": self._buildargs,
+        }
+        response = save_state(self._state_path, state)
+        if isinstance(response, OSError):
+            self.send_response(f"Kernel state not stored: {response}\n")
+
+    def resume_state(self):
+        """Restore the state stored by a previous kernel of the same notebook.
+
+        Raises:
+            MagicError: If no valid state is stored or one of its images doesn't exist anymore.
+        """
+        from docker.errors import APIError
+
+        self._resume_checked = True
+        state = load_state(self._state_path)
+        if state is None:
+            raise MagicError("No stored state found for this notebook")
+        try:
+            stages = {
+                int(index): (image_id, alias)
+                for index, (image_id, alias) in state["stages"].items()
+            }
+            aliases = {str(k): int(v) for k, v in state["aliases"].items()}
+            buildargs = {str(k): str(v) for k, v in state["buildargs"].items()}
+            latest_index = state["latest_index"]
+            image = state["image"]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise MagicError("Stored state is invalid")
+
+        images = {image_id for image_id, _ in stages.values()} | {image}
+        images.discard(None)
+        missing = []
+        for image_id in sorted(images):
+            try:
+                self._api.inspect_image(image_id)
+            except APIError:
+                missing.append(image_id.split(":")[-1][:12])
+        if missing:
+            raise MagicError(f"Images no longer exist: {', '.join(missing)}")
+
+        self._sha1 = image
+        self._build_stage_indices = stages
+        self._build_stage_aliases = aliases
+        self._latest_index = latest_index
+        self._buildargs = buildargs
+        self._image_ledger.touch(*images)
+        current = image.split(":")[-1][:12] if image is not None else None
+        self.send_response(
+            f"Resumed {len(stages)} build stages, current image: {current}\n"
+        )
+
+    def collect_garbage(
+        self, budget: int | None = None, dry_run: bool = False
+    ) -> GarbageReport:
+        """Remove the least recently used images built by kernels that are not tagged or build stages.
+
+        Build stages are those of this kernel and the states stored by other kernels, see `_store_state`.
+
+        Args:
+            budget (int | None, optional): Bytes the image layers may take on the daemon, all removable images are removed if `None`.
+                Defaults to None.
+            dry_run (bool, optional): Only report the images that would be removed.
+                Defaults to False.
+
+        Returns:
+            GarbageReport: The removed images and reclaimed space.
+
+        Raises:
+            MagicError: If an error within the docker api occurs.
+        """
+        from docker.errors import APIError
+
+        protected = {image_id for image_id, _ in self._build_stage_indices.values()}
+        protected |= {self._sha1} | stored_images(os.path.dirname(self._state_path))
+        protected.discard(None)
+        try:
+            return collect_garbage(
+                self._api, self._image_ledger, protected, budget, dry_run
+            )
+        except APIError as e:
+            raise MagicError(str(e))
+
+    def _auto_collect_garbage(self):
+        """Collect garbage once the images exceed `image_budget`, at most every `GC_INTERVAL` seconds."""
+        budget = parse_size(self.image_budget) if self.image_budget else None
+        if budget is None or time.monotonic() - self._last_gc < GC_INTERVAL:
+            return
+        self._last_gc = time.monotonic()
+        with self._phase("garbage collection"):
+            try:
+                report = self.collect_garbage(budget)
+            except MagicError as e:
+                self.send_response(f"Garbage collection failed: {e}\n")
+                return
+        if report.removed:
+            self.send_response(report.summary() + "\n")
+
     def _replace_alias(self, code: str):
         """Replace an image index or alias with the locally stored image id.
 
@@ -454,39 +1420,273 @@ class DockerKernel(Kernel):
         else:
             self._buildargs = {}
 
-    def change_build_context_directory(self, source_dir: str):
+    def change_build_context_directory(self, source_dir: str | None):
         """Change the build context that is used by Docker.
 
+        A build context still being prepared in the background is cancelled.
+
         Args:
-            source_dir (str): The path of the new build context directory.
+            source_dir (str | None): The path of the new build context directory. `None` for no build context.
         """
-        self._build_context_dir = source_dir
+        if self._context_task is not None:
+            self._context_task.cancel()
+            self._context_task = None
+        with self._phase("context sync"):
+            messages = self._prepare_context(source_dir)
+        for message in messages:
+            self.send_response(message)
 
-        empty_response = empty_dir(self._tmp_dir.name)
-        if empty_response is True:
-            self.send_response("Temporary directory emptied\n")
-        else:
-            self.send_response(str(empty_response))
-            return
+    def _prepare_initial_context(self, cancel: threading.Event) -> list[str]:
+        """Use the working directory as build context unless it is too large.
+
+        Runs in the background after the kernel started, see `_wait_for_context`.
+
+        Args:
+            cancel (threading.Event): Stops the preparation once set.
+
+        Returns:
+            list[str]: Messages to be shown once the build context is used.
+        """
+        # Only set cwd as current context when its not exceeding a certain threshold
+        # Threshold: 100MiB = 104,857,600 bytes
+        THRESHOLD = 104_857_600
+        cwd = os.getcwd()
+        docker_ignore_rules = preporcessed_dockerignore(cwd)
+        ignore_function = dockerignore(cwd, docker_ignore_rules)
+        cwd_size = get_dir_size(cwd, ignore_function, limit=THRESHOLD, cancel=cancel)
+        if cancel.is_set():
+            return []
+        # Keep no build context to trigger context prompt on next code execution
+        return self._prepare_context(cwd if cwd_size < THRESHOLD else None, cancel)
+
+    def _prepare_context(
+        self, source_dir: str | None, cancel: threading.Event | None = None
+    ) -> list[str]:
+        """Set the build context directory and mirror it into the temporary directory.
+
+        Args:
+            source_dir (str | None): The path of the new build context directory. `None` for no build context.
+            cancel (threading.Event | None, optional): Stops mirroring once set, the mirror is emptied then.
+                Defaults to None.
+
+        Returns:
+            list[str]: Messages to be shown to the user.
+        """
+        self._build_context_dir = source_dir
+        self._stop_watching()
 
         # Leave temp directory empty if no build context is available
         # This is used primarily when the inital directory is too large
         if not self._build_context_dir:
-            return
+            return [self._empty_build_context()]
+        # The build context is archived straight from its source directory
+        if self.context_mode == "stream":
+            messages = [self._empty_build_context()] if self._context_manifest else []
+            return messages + ["Build context changed\n"]
         docker_ignore_rules = preporcessed_dockerignore(self._build_context_dir)
         ignore_function = dockerignore(self._build_context_dir, docker_ignore_rules)
-        copy_response = copy_files(
-            self._build_context_dir, self._tmp_dir.name, ignore=ignore_function
+        self._context_ignore = ignore_function
+        messages = []
+        if self.watch_context:
+            # Watching before syncing, changes made meanwhile are applied with the next build
+            try:
+                self._context_watcher = ContextWatcher(
+                    self._build_context_dir, ignore_function
+                )
+            except OSError as e:
+                messages.append(f"Build context is not watched: {e}\n")
+        # Only files added, changed or removed since the last sync are touched
+        sync_response = sync_files(
+            self._build_context_dir,
+            self._tmp_dir.name,
+            self._context_manifest,
+            ignore=ignore_function,
+            cancel=cancel,
+            copier=self._file_copier(),
         )
-        if copy_response is True:
-            self.send_response("Build context changed\n")
-        else:
-            self.send_response(str(copy_response))
+        if isinstance(sync_response, OSError):
+            # The mirror is in an unknown state, start over on the next change
+            self._stop_watching()
+            empty_message = self._empty_build_context()
+            if isinstance(sync_response, InterruptedError):
+                return []
+            return [str(sync_response), empty_message]
+        self._context_manifest, copied, removed = sync_response
+        messages.append(f"Build context changed ({copied} copied, {removed} removed)\n")
+        if summary := self._copier.summary():
+            messages.append(f"Copied with: {summary}\n")
+        return messages
+
+    def _apply_context_changes(self):
+        """Apply the changes noticed by the build context watcher to the mirrored build context.
+
+        A changed `.dockerignore` or lost events lead to a full sync with the current `.dockerignore` rules.
+        """
+        if self._context_watcher is None:
+            return
+        with self._phase("context sync"):
+            paths, full_sync = self._context_watcher.take()
+            if full_sync:
+                for message in self._prepare_context(self._build_context_dir):
+                    self.send_response(message)
+                return
+            if not paths:
+                return
+            sync_response = sync_paths(
+                self._build_context_dir,
+                self._tmp_dir.name,
+                self._context_manifest,
+                paths,
+                ignore=self._context_ignore,
+                copier=self._file_copier(),
+            )
+            if isinstance(sync_response, OSError):
+                self.send_response(str(sync_response))
+                # The mirror is in an unknown state, start over
+                self._empty_build_context()
+                for message in self._prepare_context(self._build_context_dir):
+                    self.send_response(message)
+                return
+            self._context_manifest, copied, removed = sync_response
+            if copied or removed:
+                self.send_response(
+                    f"Build context updated ({copied} copied, {removed} removed)\n"
+                )
+            if summary := self._copier.summary():
+                self.send_response(f"Copied with: {summary}\n")
+
+    def _file_copier(self) -> FileCopier:
+        """Get the copier for the mirrored build context, following changes of `context_copy_mode`."""
+        if self._copier.mode != self.context_copy_mode:
+            self._copier = FileCopier(self.context_copy_mode)
+        return self._copier
+
+    def _stop_watching(self):
+        """Stop watching the build context directory."""
+        if self._context_watcher is not None:
+            self._context_watcher.close()
+            self._context_watcher = None
 
+    def _wait_for_context(self):
+        """Wait for the build context prepared in the background and show the preparation's messages.
+
+        Raises:
+            KeyboardInterrupt: Waiting was interrupted, the preparation continues in the background.
+        """
+        task = self._context_task
+        if task is None:
             return
+        waiting = not task.done()
+        if waiting:
+            self.send_response("Waiting for the build context to be prepared\n")
+        with self._phase("context wait"):
+            try:
+                messages = task.wait()
+            except Exception as e:
+                messages = [f"Preparing the build context failed: {e}\n"]
+        self._context_task = None
+        if waiting:
+            messages.append(
+                f"Build context prepared in {time.perf_counter() - task.started:.1f} s\n"
+            )
+        for message in messages:
+            self.send_response(message)
+
+    def _empty_build_context(self) -> str:
+        """Empty the temporary directory used as build context.
+
+        Returns:
+            str: Message to be shown to the user.
+        """
+        self._context_manifest = {}
+        empty_response = empty_dir(self._tmp_dir.name)
+        if empty_response is True:
+            return "Temporary directory emptied\n"
+        return str(empty_response)
+
+    def get_profiles(self, top: int = 5) -> tuple[PrettyTable, PrettyTable]:
+        """Summarize the profiles of the previous executions.
+
+        Args:
+            top (int, optional): Number of cells and steps listed.
+                Defaults to 5.
+
+        Returns:
+            tuple[PrettyTable, PrettyTable]: The slowest cells and the slowest build steps.
+        """
+        from prettytable import PrettyTable
+
+        cells = PrettyTable(
+            ["cell", "code", "total (s)", "context (s)", "upload (s)", "build (s)"]
+            + ["cache hits", "cache misses", "image size"]
+        )
+        for profile in sorted(self._profiles, key=lambda p: p.total, reverse=True)[
+            :top
+        ]:
+            phases = profile.phases
+            context = sum(
+                phases.get(name, 0.0)
+                for name in ("context", "context sync", "context wait", "cache lookup")
+            )
+            cells.add_row(
+                [
+                    profile.execution_count,
+                    _summarize_code(profile.code),
+                    f"{profile.total:.2f}",
+                    f"{context:.2f}",
+                    f"{phases.get('upload', 0.0):.2f}",
+                    f"{phases.get('build', 0.0) + phases.get('pull wait', 0.0):.2f}",
+                    "cached build" if profile.cached_build else profile.cache_hits,
+                    profile.cache_misses,
+                    _format_size(profile.image_size),
+                ]
+            )
+
+        steps = PrettyTable(
+            ["cell", "step", "instruction", "seconds", "cached", "pulled", "layer size"]
+        )
+        all_steps = [
+            (profile.execution_count, step)
+            for profile in self._profiles
+            for step in profile.steps
+        ]
+        for execution_count, step in sorted(
+            all_steps, key=lambda s: s[1].seconds, reverse=True
+        )[:top]:
+            steps.add_row(
+                [
+                    execution_count,
+                    step.number,
+                    _summarize_code(step.instruction),
+                    f"{step.seconds:.2f}",
+                    step.cached,
+                    step.pulled,
+                    _format_size(step.size),
+                ]
+            )
+        return cells, steps
+
+    def clear_profiles(self):
+        """Remove the profiles of all previous executions."""
+        self._profiles.clear()
 
     def get_stages(self):
+        from prettytable import PrettyTable
+
         table = PrettyTable(["index", "alias", "image id"])
         for index, _rest in self._build_stage_indices.items():
             table.add_row([index, _rest[1], _rest[0]])
         return table
+
+
+def _summarize_code(code: str, length: int = 40) -> str:
+    """Shorten code to its first line for tables."""
+    line = code.strip().split("\n")[0]
+    return line if len(line) <= length else line[: length - 3] + "..."
+
+
+def _format_size(size: int | None) -> str:
+    """Format a size in bytes for tables."""
+    if size is None:
+        return ""
+    return f"{size / 1_000_000:.1f} MB"
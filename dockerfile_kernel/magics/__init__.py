@@ -1,6 +1,39 @@
-from .install import Install
-from .magics import Magics
-from .tag import Tag
-from .context import Context
-from .arg import Arg
-from .stages import Stages
+import importlib
+
+# Module of each magic, imported when the magic is first used
+MAGIC_MODULES = {
+    "Install": "install",
+    "Magics": "magics",
+    "Tag": "tag",
+    "Context": "context",
+    "Arg": "arg",
+    "Stages": "stages",
+    "Resume": "resume",
+    "Batch": "batch",
+    "Profile": "profile",
+    "Gc": "gc",
+}
+
+
+def __getattr__(name: str):
+    if name in MAGIC_MODULES:
+        module = importlib.import_module(f".{MAGIC_MODULES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_magic(name: str):
+    """Import the *Magic* of a name, registering it as a subclass of `Magic`.
+
+    Args:
+        name (str): Name of the *Magic*, case insensitive.
+    """
+    for class_name in MAGIC_MODULES:
+        if class_name.lower() == name.lower():
+            __getattr__(class_name)
+
+
+def load_magics():
+    """Import all *Magics*, registering them as subclasses of `Magic`."""
+    for class_name in MAGIC_MODULES:
+        __getattr__(class_name)
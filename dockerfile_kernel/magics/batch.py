@@ -0,0 +1,60 @@
+from typing import Callable
+
+import os
+
+from .magic import Magic
+from .helper.errors import MagicError
+from .helper.types import FlagDict
+from ..utils.batch import read_code_cells
+from ..utils.conversion import try_convert
+from ..utils.state import notebook_file
+
+
+class Batch(Magic):
+    """Build all code cells of a notebook at once with `kernel.DockerKernel`."""
+
+    def __init__(self, kernel, *args, **flags):
+        super().__init__(kernel, *args, **flags)
+
+    @staticmethod
+    def REQUIRED_ARGS() -> tuple[list[str], int]:
+        return (["notebook_path"], 0)
+
+    @staticmethod
+    def ARGS_RULES() -> dict[int, list[tuple[Callable[[str], bool], str]]]:
+        return {
+            0: [
+                (lambda path: os.path.isfile(path), "Specified notebook doesn't exist"),
+            ]
+        }
+
+    @staticmethod
+    def VALID_FLAGS() -> dict[str, FlagDict]:
+        return {
+            "jobs": {
+                "short": "j",
+                "default": "1",
+                "desc": "Number of independent build stages built at the same time",
+            }
+        }
+
+    def _execute_magic(self) -> None:
+        jobs = try_convert(self._get_default_flag("jobs", "j", "1"), None, int)
+        if jobs is None or jobs < 1:
+            raise MagicError("Number of jobs must be a positive integer")
+        path = self._args[0] if self._args else self._current_notebook()
+        cells = read_code_cells(path)
+        if isinstance(cells, Exception):
+            raise MagicError(f"Notebook can't be read: {cells}")
+        self._kernel.build_notebook(cells, jobs=jobs)
+
+    def _current_notebook(self) -> str:
+        """Find the notebook the kernel was started for.
+
+        Raises:
+            MagicError: If the notebook can't be found.
+        """
+        path = notebook_file()
+        if path is None:
+            raise MagicError("Notebook not found, please specify its path")
+        return path
@@ -3,6 +3,7 @@ from typing import Callable
 import os
 
 from .magic import Magic
+from .helper.errors import MagicError
 from .helper.types import FlagDict
 
 
@@ -29,8 +30,21 @@ class Context(Magic):
 
     @staticmethod
     def VALID_FLAGS() -> dict[str, FlagDict]:
-        return {}
+        return {
+            "mode": {
+                "short": "m",
+                "default": None,
+                "desc": "How the build context is sent: 'mirror' or 'stream'",
+            }
+        }
 
     def _execute_magic(self) -> None:
         directory_path = self._args[0]
+        mode = self._get_default_flag("mode", "m")
+        if mode is not None:
+            if mode.lower() not in ("mirror", "stream"):
+                raise MagicError(
+                    f"Unknown mode: {mode}, expected one of: 'mirror', 'stream'"
+                )
+            self._kernel.context_mode = mode.lower()
         self._kernel.change_build_context_directory(directory_path)
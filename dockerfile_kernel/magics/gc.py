@@ -0,0 +1,47 @@
+from typing import Callable
+
+from .magic import Magic
+from .helper.errors import MagicError
+from .helper.types import FlagDict
+from ..utils.gc import parse_size
+
+
+class Gc(Magic):
+    """Remove images built by `kernel.DockerKernel` that are no longer needed, least recently used first."""
+
+    def __init__(self, kernel, *args, **flags):
+        super().__init__(kernel, *args, **flags)
+
+    @staticmethod
+    def REQUIRED_ARGS() -> tuple[list[str], int]:
+        return (["command"], 0)
+
+    @staticmethod
+    def ARGS_RULES() -> dict[int, list[tuple[Callable[[str], bool], str]]]:
+        return {
+            0: [
+                (
+                    lambda arg: arg.lower() in ("run", "list"),
+                    "Unknown command, expected 'run' or 'list'",
+                )
+            ]
+        }
+
+    @staticmethod
+    def VALID_FLAGS() -> dict[str, FlagDict]:
+        return {
+            "budget": {
+                "short": "b",
+                "default": None,
+                "desc": "Disk space the images may take, e.g. 20GB. Only images exceeding it are removed",
+            }
+        }
+
+    def _execute_magic(self) -> None:
+        dry_run = bool(self._args) and self._args[0].lower() == "list"
+        budget = self._get_default_flag("budget", "b", self._kernel.image_budget)
+        size = parse_size(budget) if budget else None
+        if budget and size is None:
+            raise MagicError(f"Invalid budget '{budget}', expected e.g. '20GB'")
+        report = self._kernel.collect_garbage(size, dry_run)
+        self._kernel.send_response(report.summary(dry_run) + "\n")
@@ -1,8 +1,20 @@
-from typing import Callable, Tuple
+from typing import Callable
 
 from .magic import Magic
+from .helper.errors import MagicError
 from .helper.types import FlagDict
 
+# Directories the package managers download to, kept in BuildKit cache mounts between builds
+CACHE_MOUNTS = {
+    "apt": [
+        "--mount=type=cache,target=/var/cache/apt,sharing=locked",
+        "--mount=type=cache,target=/var/lib/apt/lists,sharing=locked",
+    ],
+    "conda": ["--mount=type=cache,target=/opt/conda/pkgs"],
+    "npm": ["--mount=type=cache,target=/root/.npm"],
+    "pip": ["--mount=type=cache,target=/root/.cache/pip"],
+}
+
 
 class Install(Magic):
     """Install additional packages to the Docker image."""
@@ -12,7 +24,7 @@ class Install(Magic):
 
     @staticmethod
     def REQUIRED_ARGS() -> tuple[list[str], int]:
-        return (["package-manager", "package"], 2)
+        return (["package-manager", "package"], 1)
 
     @staticmethod
     def ARGS_RULES() -> dict[int, tuple[Callable[[str], bool], str]]:
@@ -22,50 +34,157 @@ class Install(Magic):
     def VALID_FLAGS() -> dict[str, FlagDict]:
         return {}
 
-    def _execute_magic(self) -> list[str] | str:
-        code = None
-        packages = " {newLine}".join(self._args[1:])
-        match self._args[0].lower():
+    @staticmethod
+    def install_code(
+        package_manager: str, packages: list[str], cache: bool = False
+    ) -> str | None:
+        """*(static)* Generate the `RUN` instruction installing packages.
+
+        Args:
+            package_manager (str): The package manager to be used.
+            packages (list[str]): The packages to be installed.
+            cache (bool, optional): Keep the downloads in BuildKit cache mounts instead of removing them.
+                Defaults to False.
+
+        Returns:
+            str | None: The instruction with `{newLine}` placeholders between its commands.
+                `None` if the package manager is not available.
+        """
+        packages = " ".join(packages)
+        manager = package_manager.lower()
+        match manager:
             case "apt-get" | "apt":
+                manager = "apt"
+                if cache:
+                    # Debian based images remove downloaded packages after every installation
+                    code = (
+                        "RUN rm -f /etc/apt/apt.conf.d/docker-clean {newLine}apt-get update {newLine}apt-get install -y "
+                        + f"{packages}"
+                    )
+                else:
+                    code = (
+                        "RUN apt-get update {newLine}apt-get install -y "
+                        + f"{packages}"
+                        + " {newLine}rm -rf /var/lib/apt/lists/*"
+                    )
+            case "conda" | "conda-forge":
+                channel = " -c conda-forge" if manager == "conda-forge" else ""
+                manager = "conda"
                 code = (
-                    "RUN apt-get update {newLine}apt-get install -y "
-                    + f"{packages}"
-                    + " {newLine}rm -rf /var/lib/apt/lists/*"
-                )
-            case "conda":
-                code = (
-                    "RUN conda install -y --freeze-installed "
-                    + f"{packages}"
-                    + " {newLine}conda clean -afy"
-                )
-            case "conda-forge":
-                code = (
-                    "RUN conda install -y --freeze-installed -c conda-forge"
-                    + f"{packages}"
-                    + " {newLine}conda clean -afy"
+                    f"RUN conda install -y --freeze-installed{channel} " + f"{packages}"
                 )
+                if not cache:
+                    code += " {newLine}conda clean -afy"
             case "npm":
-                code = (
-                    "RUN npm install "
-                    + f"{packages}"
-                    + " {newLine}npm cache clean --force"
-                )
+                code = "RUN npm install " + f"{packages}"
+                if not cache:
+                    code += " {newLine}npm cache clean --force"
             case "pip":
                 code = (
                     "RUN pip install --upgrade pip {newLine}pip install "
                     + f"{packages}"
-                    + " {newLine}rm -rf /root/.cache/pip"
-                )
-            case other:
-                self._kernel.send_response(
-                    "Package manager not available (currently available: apt(-get), conda, conda-forge, npm, pip)"
                 )
+                if not cache:
+                    code += " {newLine}rm -rf /root/.cache/pip"
+            case _:
+                return None
+        if cache:
+            code = code.replace("RUN ", f"RUN {' '.join(CACHE_MOUNTS[manager])} ", 1)
+        return code
 
-        if code is not None:
-            self._kernel.payload = (
-                "set_next_input",
-                code.format(newLine="&&\\\n\t "),
-                True,
+    @staticmethod
+    def enqueue(
+        queue: list[tuple[str, list[str]]], package_manager: str, packages: list[str]
+    ):
+        """*(static)* Add packages to the queue of `%install queue`, each package once.
+
+        Packages of the same package manager as the previously queued ones join their run,
+        so the installations stay in the order they were queued.
+
+        Args:
+            queue (list[tuple[str, list[str]]]): The runs of queued packages and their package manager.
+            package_manager (str): The package manager to be used.
+            packages (list[str]): The packages to be installed.
+        """
+        manager = package_manager.lower()
+        manager = "apt" if manager == "apt-get" else manager
+        queued = {p for m, run in queue if m == manager for p in run}
+        packages = [p for p in dict.fromkeys(packages) if p not in queued]
+        if not packages:
+            return
+        if queue and queue[-1][0] == manager:
+            queue[-1][1].extend(packages)
+        else:
+            queue.append((manager, packages))
+
+    @staticmethod
+    def queued_code(
+        queue: list[tuple[str, list[str]]], cache: bool = False
+    ) -> list[str]:
+        """*(static)* Generate one `RUN` instruction per run of queued packages.
+
+        Args:
+            queue (list[tuple[str, list[str]]]): The runs of queued packages and their package manager.
+            cache (bool, optional): Keep the downloads in BuildKit cache mounts instead of removing them.
+                Defaults to False.
+
+        Returns:
+            list[str]: The instructions in the order the packages were queued, see `install_code`.
+        """
+        return [
+            Install.install_code(manager, packages, cache)
+            for manager, packages in queue
+        ]
+
+    def _execute_magic(self) -> list[str] | str:
+        command = self._args[0].lower()
+        if len(self._args) == 1:
+            match command:
+                case "queue":
+                    return self._start_queue()
+                case "flush":
+                    return self._flush_queue()
+            raise MagicError("Missing argument: package at position 2")
+
+        if Install.install_code(command, []) is None:
+            self._kernel.send_response(
+                "Package manager not available (currently available: apt(-get), conda, conda-forge, npm, pip)"
+            )
+            return
+
+        queue = self._kernel._install_queue
+        if queue is not None:
+            Install.enqueue(queue, command, list(self._args[1:]))
+            count = sum(len(packages) for _, packages in queue)
+            self._kernel.send_response(
+                f"Queued {' '.join(self._args[1:])}, {count} package{'s' if count != 1 else ''} to be installed by %install flush\n"
             )
-            code = self._kernel.create_build_stage(code.format(newLine="&& "))
-            self._kernel.build_image(code)
+            return
+
+        code = Install.install_code(
+            self._args[0], list(self._args[1:]), self._kernel.use_cache_mounts()
+        )
+        self._kernel.payload = (
+            "set_next_input",
+            code.format(newLine="&&\\\n\t "),
+            True,
+        )
+        self._kernel.build_image(code.format(newLine="&& "))
+
+    def _start_queue(self):
+        """Collect the packages of the following `%install` cells until `%install flush`."""
+        if self._kernel._install_queue is None:
+            self._kernel._install_queue = []
+        self._kernel.send_response(
+            "Queueing packages, build them with %install flush\n"
+        )
+
+    def _flush_queue(self):
+        """Install the queued packages in one layer per run of a package manager and stop queueing."""
+        queue, self._kernel._install_queue = self._kernel._install_queue, None
+        if not queue:
+            self._kernel.send_response("No packages queued\n")
+            return
+        # The queued cells remain *Magics*, so the cell isn't replaced by the instructions
+        code = "\n".join(Install.queued_code(queue, self._kernel.use_cache_mounts()))
+        self._kernel.build_image(code.format(newLine="&& "))
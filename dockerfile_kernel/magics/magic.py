@@ -10,6 +10,7 @@ import re
 import itertools
 from itertools import zip_longest
 
+from . import load_magic, load_magics
 from .helper.errors import MagicError
 from ..utils.notebook import get_cursor_words, get_cursor_frame, get_first_word
 from .helper.types import FlagDict
@@ -125,6 +126,7 @@ class Magic(ABC):
         if not name.startswith("%"):
             return None
 
+        load_magic(name.removeprefix("%"))
         magics: list[Type[Magic]] = Magic.__subclasses__()
         for magic in magics:
             if magic.__name__.lower() == name.removeprefix("%").lower():
@@ -142,6 +144,7 @@ class Magic(ABC):
         Returns:
             list[str]: Names of all *Magics* available.
         """
+        load_magics()
         return [m.__name__.lower() for m in Magic.__subclasses__()]
 
     @staticmethod
@@ -306,4 +309,4 @@ class Magic(ABC):
         Returns:
             str: Value of *flag* or default.
         """
-        return self._flags.get(long, self._flags.get(short, default))
+        return self._flags.get(long, self._shorts.get(short, default))
@@ -0,0 +1,52 @@
+from typing import Callable
+
+from .magic import Magic
+from .helper.errors import MagicError
+from .helper.types import FlagDict
+from ..utils.conversion import try_convert
+
+
+class Profile(Magic):
+    """List the slowest cells and build steps executed by `kernel.DockerKernel`."""
+
+    def __init__(self, kernel, *args, **flags):
+        super().__init__(kernel, *args, **flags)
+
+    @staticmethod
+    def REQUIRED_ARGS() -> tuple[list[str], int]:
+        return (["command"], 0)
+
+    @staticmethod
+    def ARGS_RULES() -> dict[int, list[tuple[Callable[[str], bool], str]]]:
+        return {
+            0: [
+                (
+                    lambda arg: arg.lower() in ("clear", "show"),
+                    "Unknown command, expected 'show' or 'clear'",
+                )
+            ]
+        }
+
+    @staticmethod
+    def VALID_FLAGS() -> dict[str, FlagDict]:
+        return {
+            "top": {
+                "short": "n",
+                "default": "5",
+                "desc": "Number of cells and steps listed",
+            }
+        }
+
+    def _execute_magic(self) -> None:
+        if self._args and self._args[0].lower() == "clear":
+            self._kernel.clear_profiles()
+            self._kernel.send_response("Profiles cleared\n")
+            return
+
+        top = try_convert(self._get_default_flag("top", "n", "5"), None, int)
+        if top is None or top < 1:
+            raise MagicError("Number of listed cells must be a positive integer")
+        cells, steps = self._kernel.get_profiles(top)
+        self._kernel.send_response(
+            f"Slowest cells:\n{cells}\n\nSlowest steps:\n{steps}\n"
+        )
@@ -0,0 +1,26 @@
+from typing import Callable
+
+from .magic import Magic
+from .helper.types import FlagDict
+
+
+class Resume(Magic):
+    """Restore the state a previous kernel of the notebook stored in `kernel.DockerKernel`."""
+
+    def __init__(self, kernel, *args, **flags):
+        super().__init__(kernel, *args, **flags)
+
+    @staticmethod
+    def REQUIRED_ARGS() -> tuple[list[str], int]:
+        return ([], 0)
+
+    @staticmethod
+    def ARGS_RULES() -> dict[int, list[tuple[Callable[[str], bool], str]]]:
+        return {}
+
+    @staticmethod
+    def VALID_FLAGS() -> dict[str, FlagDict]:
+        return {}
+
+    def _execute_magic(self) -> None:
+        self._kernel.resume_state()
@@ -1,7 +1,5 @@
 from typing import Callable
 
-import docker.client
-
 from .magic import Magic
 from .helper.errors import MagicError
 from .helper.types import FlagDict
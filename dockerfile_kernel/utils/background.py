@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Any, Callable
+
+
+class BackgroundTask:
+    """Run a function on a daemon thread that can be waited for or cancelled.
+
+    The function receives an event that is set once the task is cancelled and is expected to return soon after.
+    """
+
+    def __init__(self, function: Callable[[threading.Event], Any]):
+        """
+        Args:
+            function (Callable[[threading.Event], Any]): Called with the cancel event, its result is returned by `wait`.
+        """
+        self.started = time.perf_counter()
+        self._cancel = threading.Event()
+        self._result = None
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, args=(function,), daemon=True)
+        self._thread.start()
+
+    def _run(self, function: Callable[[threading.Event], Any]):
+        try:
+            self._result = function(self._cancel)
+        except BaseException as e:
+            self._error = e
+
+    def done(self) -> bool:
+        """Whether the function has returned."""
+        return not self._thread.is_alive()
+
+    def wait(self, timeout: float | None = None):
+        """Wait for the function to return.
+
+        Args:
+            timeout (float | None, optional): Seconds to wait at most, without limit if `None`.
+                Defaults to None.
+
+        Returns:
+            Any: The function's result.
+
+        Raises:
+            TimeoutError: The function didn't return within *timeout*.
+        """
+        # Joining in steps keeps the main thread responsive to interrupts
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self._thread.is_alive():
+            remaining = 0.1 if deadline is None else deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError("Background task still running")
+            self._thread.join(min(remaining, 0.1))
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def cancel(self, wait: bool = True):
+        """Ask the function to stop.
+
+        Args:
+            wait (bool, optional): Wait until the function returned.
+                Defaults to True.
+        """
+        self._cancel.set()
+        while wait and self._thread.is_alive():
+            self._thread.join(0.1)
@@ -0,0 +1,281 @@
+import json
+import re
+from typing import NamedTuple
+
+from .instructions import split_instructions
+
+FROM_FLAG_REGEX = re.compile(r"--from=([^\s,]+)")
+# The image of a `FROM` instruction, e.g. "FROM --platform=linux/amd64 builder AS test"
+FROM_IMAGE_REGEX = re.compile(
+    r"^(\s*FROM\s+(?:--\S+\s+)*)(\S+)(.*)$", re.IGNORECASE | re.MULTILINE
+)
+STEP_REGEX = re.compile(r"^Step (\d+)/\d+ : ")
+# Printed by the classic builder once a step is done, e.g. " ---> 0123456789ab"
+STEP_IMAGE_REGEX = re.compile(r"^ ---> ([0-9a-f]{12,64})$")
+
+
+def read_code_cells(path: str) -> list[str]:
+    """Read the sources of a notebook's code cells.
+
+    Args:
+        path (str): Path of the notebook.
+
+    Returns:
+        list[str] | Error: The sources of the code cells in order. An Error if the notebook can't be read.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            notebook = json.load(f)
+    except (OSError, ValueError) as e:
+        return e
+    sources = []
+    for cell in notebook.get("cells", []):
+        if cell.get("cell_type") != "code":
+            continue
+        source = cell.get("source", "")
+        # Sources may be stored as a list of lines
+        sources.append(source if isinstance(source, str) else "".join(source))
+    return sources
+
+
+class BatchCell(NamedTuple):
+    """A code cell of a batch build.
+
+    - *code* is the cell's *Dockerfile* code
+    - *steps* is the number of its instructions, each is a build step
+    - *index* is the kernel's build stage index its image is saved at, see `DockerKernel._save_build_stage`
+    - *stage* is the number of the docker build stage the cell ends in
+    """
+
+    code: str
+    steps: int
+    index: int | None
+    stage: int
+
+
+class StageUnit(NamedTuple):
+    """Consecutive cells built together, starting with a `FROM` instruction.
+
+    - *cells* are the positions of the cells in the batch
+    - *first_stage* is the number of the docker build stage the unit starts with
+    - *aliases* are the lower case names given by the unit's `FROM ... AS <name>` instructions
+    - *indices* are the kernel's build stage indices saved by the unit's cells
+    - *dependencies* are the positions of the units the unit refers to
+    """
+
+    cells: list[int]
+    first_stage: int
+    aliases: set[str]
+    indices: set[int]
+    dependencies: set[int]
+
+
+def plan_cells(codes: list[str]) -> list[BatchCell]:
+    """Determine the build stages of a notebook's cells.
+
+    Args:
+        codes (list[str]): The *Dockerfile* code of each cell in order.
+
+    Returns:
+        list[BatchCell]: The cells of the batch.
+    """
+    cells: list[BatchCell] = []
+    index: int | None = None
+    stage = -1
+    for code in codes:
+        instructions = split_instructions(code)
+        stage += sum(keyword == "FROM" for keyword, _ in instructions)
+        # Same condition as `DockerKernel._save_build_stage`
+        if code.lower().strip().startswith(("from", "arg", "#")):
+            index = index + 1 if index is not None else 0
+        cells.append(BatchCell(code, len(instructions), index, stage))
+    return cells
+
+
+def resolve_stage_indices(cells: list[BatchCell]) -> list[str]:
+    """Replace the kernel's build stage indices in `--from=<index>` with docker build stage numbers.
+
+    Args:
+        cells (list[BatchCell]): The cells of the batch.
+
+    Returns:
+        list[str]: The code of each cell, to be joined into a single *Dockerfile*.
+    """
+    stages: dict[int, int] = {}
+    codes = []
+    for cell in cells:
+        # Indices refer to earlier cells
+        codes.append(
+            FROM_FLAG_REGEX.sub(
+                lambda m: f"--from={stages.get(_as_index(m.group(1)), m.group(1))}",
+                cell.code,
+            )
+        )
+        if cell.index is not None:
+            stages[cell.index] = cell.stage
+    return codes
+
+
+def stage_units(cells: list[BatchCell]) -> list[StageUnit]:
+    """Split the cells of a batch into units that can be built independently once their dependencies are built.
+
+    A unit depends on another one if it refers to it by alias or index in `--from=` or as the image of `FROM`.
+
+    Args:
+        cells (list[BatchCell]): The cells of the batch.
+
+    Returns:
+        list[StageUnit]: The units in the order of their cells.
+    """
+    units: list[StageUnit] = []
+    for position, cell in enumerate(cells):
+        previous_stage = cells[position - 1].stage if position > 0 else -1
+        # Cells before the first `FROM` (e.g. global `ARG`s) belong to the first unit
+        if not units or (cell.stage != previous_stage and previous_stage != -1):
+            units.append(StageUnit([], previous_stage + 1, set(), set(), set()))
+        unit = len(units) - 1
+        units[unit].cells.append(position)
+
+        for reference in stage_references(cell.code):
+            dependency = _referenced_unit(units, reference)
+            if dependency is not None and dependency != unit:
+                units[unit].dependencies.add(dependency)
+        units[unit].aliases.update(stage_aliases(cell.code))
+        if cell.index is not None:
+            units[unit].indices.add(cell.index)
+    return units
+
+
+def unit_code(
+    cells: list[BatchCell],
+    units: list[StageUnit],
+    unit: int,
+    images: dict[int, str],
+) -> str:
+    """Create the *Dockerfile* of a unit, referring to the units it depends on by their image ids.
+
+    Cells declaring global build arguments are repeated at the beginning of every unit.
+
+    Args:
+        cells (list[BatchCell]): The cells of the batch.
+        units (list[StageUnit]): The units of the batch.
+        unit (int): Position of the unit to be built.
+        images (dict[int, str]): Image ids of the units built already.
+
+    Returns:
+        str: The *Dockerfile* code.
+    """
+    # Stage of each index within the unit
+    stages = {
+        cells[position].index: cells[position].stage
+        for position in units[unit].cells
+        if cells[position].index is not None
+    }
+
+    def resolve(reference: str, flag: bool) -> str:
+        index = _as_index(reference)
+        if flag and index is not None and index in stages:
+            # Stages within the unit are numbered from its first stage
+            return str(stages[index] - units[unit].first_stage)
+        other = _referenced_unit(units[:unit], reference)
+        if other in units[unit].dependencies and other in images:
+            return images[other]
+        return reference
+
+    # Global build arguments are declared before the first `FROM` of every unit
+    codes = [cell.code for cell in cells if cell.stage == -1] if unit > 0 else []
+    for position in units[unit].cells:
+        code = FROM_FLAG_REGEX.sub(
+            lambda m: f"--from={resolve(m.group(1), True)}", cells[position].code
+        )
+        code = FROM_IMAGE_REGEX.sub(
+            lambda m: f"{m.group(1)}{resolve(m.group(2), False)}{m.group(3)}", code
+        )
+        codes.append(code)
+    return "\n".join(codes) + "\n"
+
+
+def _referenced_unit(units: list[StageUnit], reference: str) -> int | None:
+    """Find the last of *units* a stage index or alias refers to."""
+    index = _as_index(reference)
+    for position in range(len(units) - 1, -1, -1):
+        if index is not None and index in units[position].indices:
+            return position
+        if reference.lower() in units[position].aliases:
+            return position
+    return None
+
+
+def stage_references(code: str) -> list[str]:
+    """Get the build stages or images *code* refers to in `--from=` and `FROM`.
+
+    Args:
+        code (str): The *Dockerfile* code.
+
+    Returns:
+        list[str]: Names, indices or images as written in *code*.
+    """
+    references = FROM_FLAG_REGEX.findall(code)
+    references.extend(match.group(2) for match in FROM_IMAGE_REGEX.finditer(code))
+    return references
+
+
+def stage_aliases(code: str) -> list[str]:
+    """Get the lower case names given to build stages by `FROM ... AS <name>`.
+
+    Args:
+        code (str): The *Dockerfile* code.
+
+    Returns:
+        list[str]: The names in order.
+    """
+    aliases = []
+    for match in FROM_IMAGE_REGEX.finditer(code):
+        parts = match.group(3).split()
+        if len(parts) >= 2 and parts[0].lower() == "as":
+            aliases.append(parts[1].lower())
+    return aliases
+
+
+def _as_index(reference: str) -> int | None:
+    return int(reference) if reference.isdigit() else None
+
+
+class StepTracker:
+    """Collect the image each step of a classic build resulted in from the build log."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._step = 0
+        self._images: dict[int, str] = {}
+
+    def feed(self, log: str):
+        """Add a part of the build log.
+
+        Args:
+            log (str): The next part of the build log.
+        """
+        self._buffer += log
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            line = line.rstrip("\r")
+            if match := STEP_REGEX.match(line):
+                self._step = int(match.group(1))
+            elif match := STEP_IMAGE_REGEX.match(line):
+                self._images[self._step] = match.group(1)
+
+    def image(self, step: int) -> str | None:
+        """Get the image a step resulted in.
+
+        Steps not resulting in an image, e.g. `ARG` before the first `FROM`, resolve to the image of the previous step.
+
+        Args:
+            step (int): Number of the step, starting at 1.
+
+        Returns:
+            str | None: The short image id. `None` if no step up to *step* resulted in an image.
+        """
+        for number in range(step, 0, -1):
+            if number in self._images:
+                return self._images[number]
+        return None
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import time
+
+from .filesystem import write_json
+
+# Number of entries kept, the least recently used are dropped first
+MAX_ENTRIES = 10_000
+
+
+def cache_dir() -> str:
+    """Get the directory the kernel keeps persistent data in.
+
+    Returns:
+        str: `dockerfile-kernel` inside `$XDG_CACHE_HOME`, `~/.cache` by default.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "dockerfile-kernel")
+
+
+def build_key(
+    build_code: str,
+    parent: str | None,
+    buildargs: dict[str, str],
+    context_digest: str,
+) -> str:
+    """Hash all inputs of a build.
+
+    Args:
+        build_code (str): The code to be built.
+        parent (str | None): Id of the image the code is built on.
+        buildargs (dict[str, str]): Build arguments used by *build_code*.
+        context_digest (str): Fingerprint of the build context sent with *build_code*.
+
+    Returns:
+        str: Hex digest identifying the build.
+    """
+    inputs = {
+        "code": build_code,
+        "parent": parent,
+        "buildargs": buildargs,
+        "context": context_digest,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+class BuildCache:
+    """Persistent mapping of build keys to the resulting image ids.
+
+    Stored as a JSON file that is written atomically and shared by all kernels.
+    """
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES):
+        """
+        Args:
+            path (str): Path of the JSON file.
+            max_entries (int, optional): Number of entries kept.
+                Defaults to `MAX_ENTRIES`.
+        """
+        self._path = path
+        self._max_entries = max_entries
+        self._entries: dict[str, dict] | None = None
+        # Inode, modification time and size of the file the entries were read from
+        self._signature: tuple[int, int, int] | None = None
+
+    def get(self, key: str) -> str | None:
+        """Look up the image built for a key, marking it as used.
+
+        Args:
+            key (str): The build key.
+
+        Returns:
+            str | None: The image id, `None` if the build is unknown.
+        """
+        entry = self._load().get(key)
+        if entry is None:
+            return None
+        entry["used"] = time.time()
+        self._store()
+        return entry["image"]
+
+    def set(self, key: str, image_id: str):
+        """Store the image built for a key.
+
+        Args:
+            key (str): The build key.
+            image_id (str): The image id.
+
+        Returns:
+            bool | Error : Returns `True` if storing was successfull, else an Error.
+        """
+        entries = self._load()
+        entries[key] = {"image": image_id, "used": time.time()}
+        if len(entries) > self._max_entries:
+            by_use = sorted(entries, key=lambda k: entries[k]["used"])
+            for old_key in by_use[: len(entries) - self._max_entries]:
+                del entries[old_key]
+        return self._store()
+
+    def remove(self, key: str):
+        """Forget the image built for a key, e.g. after it was deleted.
+
+        Args:
+            key (str): The build key.
+
+        Returns:
+            bool | Error : Returns `True` if storing was successfull, else an Error.
+        """
+        if self._load().pop(key, None) is None:
+            return True
+        return self._store()
+
+    def _load(self) -> dict[str, dict]:
+        """Read the entries, again if other kernels changed the file meanwhile."""
+        signature = self._file_signature()
+        if self._entries is None or signature != self._signature:
+            self._signature = signature
+            try:
+                with open(self._path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                # Missing or corrupted, start over
+                self._entries = {}
+        return self._entries
+
+    def _store(self):
+        response = write_json(self._path, self._entries)
+        self._signature = self._file_signature()
+        return response
+
+    def _file_signature(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            return None
+        # Replaced atomically by `write_json`, so the inode changes with every write
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
@@ -0,0 +1,204 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+import time
+from typing import Iterable, Iterator
+import zlib
+
+from .tarball import CHUNK_SIZE, TarStream
+
+COMPRESSION_MODES = ("auto", "none", "gzip")
+# Bytes compressed into one gzip member, members are compressed concurrently
+MEMBER_SIZE = CHUNK_SIZE
+# Build contexts smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 4 * 1024 * 1024
+# Assumed until measured: bytes compressed per second and thread, compressed size relative to the original
+DEFAULT_COMPRESS_RATE = 40 * 1024 * 1024
+DEFAULT_RATIO = 0.5
+# Weight of the latest measurement in the running averages
+SMOOTHING = 0.5
+
+
+class UploadStream(TarStream):
+    """Read-only file object counting the bytes of a build context archive while it is uploaded.
+
+    Optionally the archive is compressed with gzip. It is split into members of `MEMBER_SIZE` bytes
+    which are compressed on several threads, the concatenated members form a valid gzip stream.
+    """
+
+    def __init__(
+        self,
+        fileobj: Iterable[bytes],
+        compress: bool = False,
+        level: int = 6,
+        threads: int | None = None,
+    ):
+        """
+        Args:
+            fileobj (Iterable[bytes]): The archive, e.g. a `TarStream`.
+            compress (bool, optional): Compress the archive with gzip.
+                Defaults to False.
+            level (int, optional): The gzip compression level.
+                Defaults to 6.
+            threads (int | None, optional): Number of threads compressing, the number of CPUs if `None`.
+                Defaults to None.
+        """
+        self.compress = compress
+        self.level = level
+        self.threads = threads or min(os.cpu_count() or 1, 8)
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self.compress_seconds = 0.0
+        self.started: float | None = None
+        self.finished: float | None = None
+        self._source = fileobj
+        self._lock = threading.Lock()
+        chunks = self._count(iter(fileobj))
+        if compress:
+            chunks = self._gzip(chunks)
+        super().__init__(self._track(chunks))
+
+    def close(self):
+        super().close()
+        if hasattr(self._source, "close"):
+            self._source.close()
+
+    @property
+    def seconds(self) -> float | None:
+        """Seconds from the first read until the archive was exhausted, `None` if not uploaded completely."""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def summary(self) -> str:
+        """Describe the upload for the build output.
+
+        Returns:
+            str: E.g. *Sent 12.6 MB build context (gzip: 50.3 MB, 0.52 s compressing)*
+        """
+        message = f"Sent {_format_size(self.bytes_sent)} build context"
+        if self.compress:
+            message += f" (gzip: {_format_size(self.bytes_read)}, {self.compress_seconds:.2f} s compressing)"
+        return message
+
+    def _track(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Count the bytes handed to the client, timing from the first read until the archive is exhausted."""
+        self.started = time.perf_counter()
+        for chunk in chunks:
+            self.bytes_sent += len(chunk)
+            yield chunk
+        self.finished = time.perf_counter()
+
+    def _count(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.bytes_read += len(chunk)
+            yield chunk
+
+    def _gzip(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Yield gzip members of the chunks in order, compressing up to `threads` members ahead."""
+        pool = ThreadPoolExecutor(self.threads, thread_name_prefix="context-gzip")
+        pending: deque[Future] = deque()
+        try:
+            for block in _blocks(chunks, MEMBER_SIZE):
+                pending.append(pool.submit(self._gzip_member, block))
+                while len(pending) > self.threads:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _gzip_member(self, block: bytes) -> bytes:
+        start = time.perf_counter()
+        # zlib releases the GIL while compressing
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        member = compressor.compress(block) + compressor.flush()
+        with self._lock:
+            self.compress_seconds += time.perf_counter() - start
+        return member
+
+
+class CompressionPolicy:
+    """Choose whether to compress a build context from its size and the measured upload speed.
+
+    Compressing pays off once the daemon is reached through a slow link, e.g. a remote or tunnelled daemon,
+    while uploads through a local socket are faster than compressing.
+    """
+
+    def __init__(self, threads: int | None = None):
+        """
+        Args:
+            threads (int | None, optional): Number of threads compressing, the number of CPUs if `None`.
+                Defaults to None.
+        """
+        self.threads = threads or min(os.cpu_count() or 1, 8)
+        self.upload_rate: float | None = None
+        self.compress_rate = float(DEFAULT_COMPRESS_RATE)
+        self.ratio = DEFAULT_RATIO
+        self.last_size: int | None = None
+
+    def choose(self, mode: str, size: int | None = None) -> bool:
+        """Decide whether to compress a build context.
+
+        Args:
+            mode (str): One of `COMPRESSION_MODES`.
+            size (int | None, optional): Size of the build context archive in bytes, that of the previous upload if `None`.
+                Defaults to None.
+
+        Returns:
+            bool: `True` if the build context is to be compressed with gzip.
+        """
+        if mode != "auto":
+            return mode == "gzip"
+        if size is None:
+            size = self.last_size
+        if size is None or size < MIN_COMPRESS_SIZE or self.upload_rate is None:
+            return False
+        plain = size / self.upload_rate
+        # Members are uploaded while the following ones are compressed
+        compressed = max(
+            size / (self.compress_rate * self.threads),
+            size * self.ratio / self.upload_rate,
+        )
+        return compressed < plain * 0.8
+
+    def record(self, stream: UploadStream):
+        """Update the measurements with a finished upload.
+
+        Args:
+            stream (UploadStream): The uploaded build context.
+        """
+        seconds = stream.seconds
+        if seconds is None:
+            return
+        self.last_size = stream.bytes_read
+        if stream.bytes_sent < MIN_COMPRESS_SIZE or seconds <= 0:
+            # Too small to measure the upload speed
+            return
+        self.upload_rate = _smooth(self.upload_rate, stream.bytes_sent / seconds)
+        if stream.compress and stream.bytes_read and stream.compress_seconds > 0:
+            self.ratio = _smooth(self.ratio, stream.bytes_sent / stream.bytes_read)
+            self.compress_rate = _smooth(
+                self.compress_rate, stream.bytes_read / stream.compress_seconds
+            )
+
+
+def _format_size(size: int) -> str:
+    return f"{size / 1_000_000:.1f} MB"
+
+
+def _blocks(chunks: Iterator[bytes], size: int) -> Iterator[bytes]:
+    """Join chunks into blocks of at least *size* bytes, the last one may be smaller."""
+    block = bytearray()
+    for chunk in chunks:
+        block += chunk
+        if len(block) >= size:
+            yield bytes(block)
+            block = bytearray()
+    if block:
+        yield bytes(block)
+
+
+def _smooth(average: float | None, value: float) -> float:
+    return value if average is None else average + SMOOTHING * (value - average)
@@ -1,58 +1,217 @@
-from fnmatch import fnmatch
+from functools import lru_cache
 import os
+import posixpath
+import re
+
+# Characters with a meaning in regular expressions but not in Go's filepath.Match
+ESCAPED_CHARACTERS = ".+()|{}$"
+
+
+class DockerignoreMatcher:
+    """Preprocessed `.dockerignore` rules compiled once for matching many paths.
+
+    Follows the semantics of the docker daemon's [patternmatcher](https://pkg.go.dev/github.com/moby/patternmatcher):
+    A rule matches a path if it matches the path itself or one of its parent directories.
+    The last matching rule decides, rules starting with `!` re-include paths.
+    """
+
+    def __init__(self, rules: list[str]):
+        """
+        Args:
+            rules (list[str]): Preprocessed rules as returned by `preporcessed_dockerignore`.
+        """
+        self._patterns: list[tuple[re.Pattern, bool]] = []
+        # Segments of the negated rules, used to decide if a directory can be skipped
+        self._exclusions: list[list[str]] = []
+        for rule in rules:
+            negated = rule.startswith("!")
+            pattern = rule.removeprefix("!")
+            if not pattern:
+                continue
+            self._patterns.append((compile_pattern(pattern), negated))
+            if negated:
+                self._exclusions.append(pattern.split("/"))
+
+    def __bool__(self):
+        return bool(self._patterns)
+
+    def match_info(self, path: str, parent_info: list[bool] | None = None):
+        """Match every rule against a directory, reusing the results of its parent directory.
+
+        Args:
+            path (str): Path relative to the build context.
+            parent_info (list[bool] | None, optional): The `match_info` of the parent directory.
+                Defaults to None, matching all parent directories again.
+
+        Returns:
+            list[bool]: Whether each rule matches *path* or one of its parent directories.
+        """
+        if parent_info is None:
+            parent_info = self.parent_info(path)
+        return [
+            parent_matched or regex.fullmatch(path) is not None
+            for parent_matched, (regex, _) in zip(parent_info, self._patterns)
+        ]
+
+    def matches(self, path: str, parent_info: list[bool] | None = None) -> bool:
+        """Check if a path is excluded from the build context.
+
+        Args:
+            path (str): Path relative to the build context.
+            parent_info (list[bool] | None, optional): The `match_info` of the parent directory.
+                Defaults to None, matching all parent directories again.
+
+        Returns:
+            bool: `True` if *path* is excluded.
+        """
+        if parent_info is None:
+            parent_info = self.parent_info(path)
+        matched = False
+        for parent_matched, (regex, negated) in zip(parent_info, self._patterns):
+            # Only rules able to change the result need to be evaluated
+            if negated != matched:
+                continue
+            if parent_matched or regex.fullmatch(path) is not None:
+                matched = not negated
+        return matched
+
+    def can_skip(self, path: str) -> bool:
+        """Check if nothing below an excluded directory can be re-included by a negated rule.
+
+        Args:
+            path (str): Path of an excluded directory relative to the build context.
+
+        Returns:
+            bool: `True` if the whole directory can be skipped.
+        """
+        segments = path.split(os.path.sep)
+        return not any(
+            _could_match_below(segments, exclusion) for exclusion in self._exclusions
+        )
+
+    def parent_info(self, path: str) -> list[bool]:
+        """Match every rule against all parent directories of a path.
+
+        Args:
+            path (str): Path relative to the build context.
+
+        Returns:
+            list[bool]: Whether each rule matches one of the parent directories of *path*.
+        """
+        info = [False] * len(self._patterns)
+        parent = os.path.dirname(path)
+        if parent:
+            segments = parent.split(os.path.sep)
+            for index in range(len(segments)):
+                info = self.match_info(
+                    os.path.sep.join(segments[: index + 1]), parent_info=info
+                )
+        return info
+
+
+def _could_match_below(dir_segments: list[str], pattern_segments: list[str]):
+    """Check if a pattern could match the directory, one of its parents or a path below it."""
+    for index, pattern_segment in enumerate(pattern_segments):
+        if "**" in pattern_segment or index >= len(dir_segments):
+            return True
+        if compile_pattern(pattern_segment).fullmatch(dir_segments[index]) is None:
+            return False
+    # Pattern matches the directory or a parent directory
+    return True
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """Translate a `.dockerignore` pattern into a regular expression.
+
+    Mirrors the translation of the docker daemon:
+    `**` matches any number of directories, `*` and `?` don't match a path separator.
+
+    Args:
+        pattern (str): A preprocessed pattern without leading `!`.
+
+    Returns:
+        re.Pattern: Regular expression to be matched against the full path.
+    """
+    regex = ""
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        if char == "*":
+            if pattern.startswith("*", index):
+                index += 1
+                # Treat **/ as **
+                if pattern.startswith("/", index):
+                    index += 1
+                regex += ".*" if index == len(pattern) else "(.*/)?"
+            else:
+                regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char in ESCAPED_CHARACTERS:
+            regex += "\\" + char
+        elif char == "\\":
+            # Escape next character, a trailing backslash is kept
+            if index < len(pattern):
+                regex += "\\" + pattern[index]
+                index += 1
+            else:
+                regex += "\\\\"
+        else:
+            regex += char
+    return re.compile(regex)
 
 
 def dockerignore(docker_ignore_dir: str, rules: list[str]):
-    """Helper function to be added to `shutil.copytree` as the ignore function"""
+    """Helper function to be added to `shutil.copytree` as the ignore function
+
+    Excluded directories are only ignored as a whole if no negated rule can re-include a path below them.
+    """
+    matcher = DockerignoreMatcher(rules)
+    # Rule matches of visited directories, reused by their contents
+    dir_infos: dict[str, list[bool]] = {"": matcher.parent_info("")}
+
+    def get_dir_info(rel_path: str):
+        if rel_path not in dir_infos:
+            parent_info = get_dir_info(os.path.dirname(rel_path))
+            dir_infos[rel_path] = matcher.match_info(rel_path, parent_info)
+        return dir_infos[rel_path]
 
     def ignore_function(directory: str, contents: list[str]):
+        if not matcher:
+            return []
         # Path from docker_ignore_dir to the current directory
         rel_path = os.path.relpath(directory, docker_ignore_dir)
         if rel_path == ".":
             rel_path = ""
+        parent_info = get_dir_info(rel_path)
 
         ignore: list[str] = []
         for content in contents:
-            add_to_ignore = False
             rel_file_path = os.path.join(rel_path, content)
-            for rule in rules:
-                match, negated = match_dockerignore(rel_file_path, rule)
-                if match and negated:
-                    add_to_ignore = False
-                elif match and not negated:
-                    add_to_ignore = True
-            if add_to_ignore:
-                ignore.append(content)
+            if not matcher.matches(rel_file_path, parent_info):
+                continue
+            # Excluded directories must still be visited if a path below them may be re-included
+            if not matcher.can_skip(rel_file_path) and os.path.isdir(
+                os.path.join(directory, content)
+            ):
+                continue
+            ignore.append(content)
         return ignore
 
     return ignore_function
 
 
 def match_dockerignore(path: str, pattern: str):
-    is_negated = False
-    if pattern.startswith("!"):
-        pattern = pattern[1:]
-        is_negated = True
-
-    # Special case **
-    # Start matching from the right (default for fnmatch)
-    if pattern.startswith("**"):
-        root_pattern = pattern.removeprefix("**").removeprefix(os.path.sep)
-        return (fnmatch(path, pattern) or fnmatch(path, root_pattern), is_negated)
-
-    # Use segments to match from the left side
-    pattern_segments = pattern.split(os.path.sep)
-    path_segments = path.split(os.path.sep)
+    """Match a path against a single preprocessed rule.
 
-    # The pattern is not suitable for a path if longer than it
-    if len(pattern_segments) > len(path_segments):
-        return (False, is_negated)
-
-    for pattern_seg, path_seg in zip(pattern_segments, path_segments):
-        if not fnmatch(path_seg, pattern_seg):
-            return (False, is_negated)
-
-    return (True, is_negated)
+    Returns:
+        tuple[bool, bool]: Whether the rule matches *path* or one of its parent directories and whether the rule is negated.
+    """
+    is_negated = pattern.startswith("!")
+    matcher = DockerignoreMatcher([pattern.removeprefix("!")])
+    return (matcher.matches(path), is_negated)
 
 
 def preporcessed_dockerignore(directory):
@@ -66,7 +225,7 @@ def preporcessed_dockerignore(directory):
 
     if di_path is None:
         return []
-    with open(di_path, "r") as dockerignore:
+    with open(di_path, "r", encoding="utf-8-sig") as dockerignore:
         rules = dockerignore.readlines()
 
     preprocessed_rules: list[str] = []
@@ -86,17 +245,25 @@ def preprocess_rule(rule: str):
 
     As described [here](https://docs.docker.com/engine/reference/builder/#dockerignore-file) the docker daemon uses Go's [filepath.Clean](https://pkg.go.dev/path/filepath#Clean) to do so.
 
-    `os.path.normpath()` yields a similar (if not same) result. For simplicity and until there is an error regarding this, we will use this method.
+    `posixpath.normpath()` yields the same result, apart from keeping two leading slashes.
     """
     # Remove comments
     if rule.startswith("#"):
         return None
+    rule = rule.strip()
+    # Remove empty lines
+    if not rule:
+        return None
     # Remove ! as this is just a prefix for a path
-    processed_rule = os.path.normpath(rule).removeprefix("!").strip().removeprefix("!")
-    # The root of the context is considered to be both the working and the root directory
-    processed_rule = processed_rule.removeprefix(os.path.sep)
+    is_negated = rule.startswith("!")
+    processed_rule = rule.removeprefix("!").strip()
+    if processed_rule:
+        processed_rule = posixpath.normpath(processed_rule)
+        # The root of the context is considered to be both the working and the root directory
+        if len(processed_rule) > 1 and processed_rule.startswith("/"):
+            processed_rule = processed_rule.lstrip("/") or "/"
     # Add ! back
-    if rule.lstrip().startswith("!"):
+    if is_negated:
         processed_rule = "!" + processed_rule
 
     return processed_rule
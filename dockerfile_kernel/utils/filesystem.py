@@ -1,6 +1,38 @@
+import errno
+import fcntl
+import json
 import os
 import shutil
-from typing import Callable, Iterable
+import tempfile
+import threading
+from collections import Counter
+from typing import BinaryIO, Callable, Iterable, NamedTuple
+
+# ioctl cloning a file's extents, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+# Errors of a copy mechanism not supported between two file systems
+UNSUPPORTED_ERRORS = {
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+
+class ManifestEntry(NamedTuple):
+    """Metadata of a mirrored file used to detect changes between two syncs.
+
+    - *size* is the file size in bytes
+    - *mtime* is the modification time in nanoseconds
+    - *inode* is the inode number of the source file
+    """
+
+    size: int
+    mtime: int
+    inode: int
 
 
 def create_dockerfile(code: str, directory: str):
@@ -16,13 +48,155 @@ def create_dockerfile(code: str, directory: str):
         str: Path of the created *Dockerfile*
     """
     dockerfile_path = os.path.join(directory, "Dockerfile")
+    # A hardlinked Dockerfile of the build context must not be written through
+    if os.path.lexists(dockerfile_path):
+        os.remove(dockerfile_path)
     with open(dockerfile_path, "w+") as dockerfile:
         dockerfile.write(code)
     return dockerfile_path
 
 
+class FileCopier:
+    """Copy files with the cheapest mechanism supported by the file systems involved.
+
+    Mechanisms are tried in the order of `MECHANISMS`, those failing for a pair of file systems are skipped afterwards:
+
+    - *reflink* shares the data blocks until either file is changed (`FICLONE`, e.g. on btrfs and xfs)
+    - *copy_file_range* copies within the kernel, possibly offloaded to the file system or storage
+    - *sendfile* copies within the kernel
+    - *copy* reads and writes the data
+
+    With the *hardlink* mode files are linked instead, sharing their inode with the source.
+    Files are copied if linking fails, e.g. across file systems.
+    """
+
+    MECHANISMS = ("reflink", "copy_file_range", "sendfile", "copy")
+    MODES = ("auto", "hardlink", "copy")
+
+    def __init__(self, mode: str = "auto"):
+        """
+        Args:
+            mode (str, optional): One of `MODES`, *copy* only reads and writes the data.
+                Defaults to "auto".
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown copy mode: {mode}")
+        self.mode = mode
+        # Number of files copied with each mechanism
+        self.used: Counter[str] = Counter()
+        self._unsupported: dict[tuple[int, int], set[str]] = {}
+
+    def copy(self, src: str, dest: str) -> str:
+        """Copy a file's data and metadata like `shutil.copy2`.
+
+        Args:
+            src (str): Path of the source file, symbolic links are followed.
+            dest (str): Path of the destination file.
+
+        Returns:
+            str: The mechanism used, one of `MECHANISMS` or *hardlink*.
+
+        Raises:
+            OSError: Copying failed.
+        """
+        # Never write through a file linked by a previous copy
+        if os.path.lexists(dest):
+            os.remove(dest)
+        if self.mode == "hardlink":
+            try:
+                os.link(src, dest)
+                self.used["hardlink"] += 1
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRORS | {errno.EMLINK}:
+                    raise
+
+        mechanisms = self.MECHANISMS if self.mode == "auto" else ("copy",)
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+            devices = (os.fstat(fsrc.fileno()).st_dev, os.fstat(fdst.fileno()).st_dev)
+            unsupported = self._unsupported.setdefault(devices, set())
+            for mechanism in mechanisms:
+                if mechanism in unsupported:
+                    continue
+                try:
+                    _copy_data(mechanism, fsrc, fdst)
+                    break
+                except OSError as e:
+                    if mechanism == "copy" or e.errno not in UNSUPPORTED_ERRORS:
+                        raise
+                    unsupported.add(mechanism)
+                    # Start over with the next mechanism
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+        shutil.copystat(src, dest)
+        self.used[mechanism] += 1
+        return mechanism
+
+    def summary(self) -> str:
+        """Describe the mechanisms used since the last call.
+
+        Returns:
+            str: e.g. "reflink (12), copy (1)". Empty if nothing was copied.
+        """
+        summary = ", ".join(f"{name} ({count})" for name, count in self.used.items())
+        self.used.clear()
+        return summary
+
+
+def _copy_data(mechanism: str, fsrc: BinaryIO, fdst: BinaryIO):
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    if mechanism == "reflink":
+        fcntl.ioctl(out_fd, FICLONE, in_fd)
+    elif mechanism in ("copy_file_range", "sendfile"):
+        if mechanism == "copy_file_range" and not hasattr(os, "copy_file_range"):
+            raise OSError(errno.ENOSYS, "copy_file_range is not available")
+        size = os.fstat(in_fd).st_size
+        offset = 0
+        while offset < size:
+            if mechanism == "copy_file_range":
+                sent = os.copy_file_range(in_fd, out_fd, size - offset)
+            else:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+            if sent == 0:
+                # The file shrank meanwhile
+                break
+            offset += sent
+    else:
+        shutil.copyfileobj(fsrc, fdst)
+
+
+def write_json(path: str, data):
+    """Write JSON atomically, readers see either the previous or the new content.
+
+    Args:
+        path (str): Path of the file, missing parent directories are created.
+        data (Any): JSON serializable data.
+
+    Returns:
+        bool | Error : Returns `True` if writing was successfull, else an Error.
+    """
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return True
+    except OSError as e:
+        return e
+
+
 def copy_files(
-    src: str, dest: str, ignore: Callable[[str, list[str]], Iterable[str]] | None = None
+    src: str,
+    dest: str,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None = None,
+    copier: FileCopier | None = None,
 ):
     """Copy files from one directory to another.
 
@@ -31,17 +205,236 @@ def copy_files(
         dest (str): Path of destination directory.
         ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree)
             Defaults to None.
+        copier (FileCopier | None, optional): Copies the files, `shutil.copy2` if `None`.
+            Defaults to None.
 
     Returns:
         bool | Error : Returns `True` if copying was successfull, else an Error.
     """
+    copy_function = copier.copy if copier is not None else shutil.copy2
     try:
-        shutil.copytree(src, dest, dirs_exist_ok=True, ignore=ignore)
+        shutil.copytree(
+            src, dest, dirs_exist_ok=True, ignore=ignore, copy_function=copy_function
+        )
         return True
     except shutil.Error as e:
         return e
 
 
+def scan_files(
+    src: str,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None = None,
+    cancel: threading.Event | None = None,
+):
+    """Record the files and directories of a directory in a manifest.
+
+    Args:
+        src (str): Path of source directory.
+        ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree)
+            Defaults to None.
+        cancel (threading.Event | None, optional): Stops the scan once set.
+            Defaults to None.
+
+    Returns:
+        dict[str, ManifestEntry | None]: Paths relative to *src* mapped to their `ManifestEntry`.
+            Directories are mapped to `None`.
+
+    Raises:
+        InterruptedError: *cancel* was set.
+    """
+    manifest: dict[str, ManifestEntry | None] = {}
+    # Follow links to directories the same way `shutil.copytree` does
+    for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+        if cancel is not None and cancel.is_set():
+            raise InterruptedError("Scan cancelled")
+        ignored = set(ignore(dirpath, dirnames + filenames)) if ignore else set()
+        dirnames[:] = [d for d in dirnames if d not in ignored]
+
+        rel_dir = os.path.relpath(dirpath, src)
+        rel_dir = "" if rel_dir == "." else rel_dir
+        for d in dirnames:
+            manifest[os.path.join(rel_dir, d)] = None
+        for f in filenames:
+            if f in ignored:
+                continue
+            try:
+                stat = os.stat(os.path.join(dirpath, f))
+            except OSError:
+                # Broken symbolic link
+                continue
+            manifest[os.path.join(rel_dir, f)] = ManifestEntry(
+                stat.st_size, stat.st_mtime_ns, stat.st_ino
+            )
+    return manifest
+
+
+def sync_files(
+    src: str,
+    dest: str,
+    manifest: dict[str, ManifestEntry | None],
+    ignore: Callable[[str, list[str]], Iterable[str]] | None = None,
+    cancel: threading.Event | None = None,
+    copier: FileCopier | None = None,
+):
+    """Mirror a directory into another one, copying only what changed since the last sync.
+
+    Files are compared by size, modification time and inode against *manifest*,
+    the manifest returned by the previous sync into *dest*.
+
+    Args:
+        src (str): Path of source directory.
+        dest (str): Path of destination directory.
+        manifest (dict[str, ManifestEntry | None]): Manifest of the previous sync. Empty if *dest* is empty.
+        ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree)
+            Defaults to None.
+        cancel (threading.Event | None, optional): Stops syncing once set, leaving *dest* partially synced.
+            Defaults to None.
+        copier (FileCopier | None, optional): Copies the files, `shutil.copy2` if `None`.
+            Defaults to None.
+
+    Returns:
+        tuple[dict[str, ManifestEntry | None], int, int] | Error: The new manifest, the number of copied and the number of removed paths.
+            An Error if syncing failed, an `InterruptedError` if it was cancelled.
+    """
+    try:
+        new_manifest = scan_files(src, ignore, cancel)
+        copied, removed = _apply_manifest(
+            src, dest, manifest, new_manifest, cancel, copier
+        )
+        return new_manifest, copied, removed
+    except OSError as e:
+        return e
+
+
+def sync_paths(
+    src: str,
+    dest: str,
+    manifest: dict[str, ManifestEntry | None],
+    paths: Iterable[str],
+    ignore: Callable[[str, list[str]], Iterable[str]] | None = None,
+    copier: FileCopier | None = None,
+):
+    """Mirror the changes of some paths of a directory into another one.
+
+    Like `sync_files`, but only *paths* and everything below them are compared, e.g. the paths reported by a `ContextWatcher`.
+
+    Args:
+        src (str): Path of source directory.
+        dest (str): Path of destination directory.
+        manifest (dict[str, ManifestEntry | None]): Manifest of the previous sync.
+        paths (Iterable[str]): Paths relative to *src* that were created, changed, removed or renamed.
+        ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree)
+            Defaults to None.
+        copier (FileCopier | None, optional): Copies the files, `shutil.copy2` if `None`.
+            Defaults to None.
+
+    Returns:
+        tuple[dict[str, ManifestEntry | None], int, int] | Error: The new manifest, the number of copied and the number of removed paths.
+            An Error if syncing failed.
+    """
+    try:
+        new_manifest = dict(manifest)
+        copied = removed = 0
+        changed = set(paths)
+        for rel_path in sorted(changed):
+            # Paths below another changed path are compared along with it
+            if _has_parent_in(rel_path, changed):
+                continue
+            old = {rel_path: manifest[rel_path]} if rel_path in manifest else {}
+            if rel_path in manifest and manifest[rel_path] is None:
+                prefix = rel_path + os.sep
+                old.update((p, e) for p, e in manifest.items() if p.startswith(prefix))
+            new = _scan_path(src, rel_path, ignore)
+            path_copied, path_removed = _apply_manifest(
+                src, dest, old, new, copier=copier
+            )
+            for old_path in old:
+                del new_manifest[old_path]
+            new_manifest.update(new)
+            copied += path_copied
+            removed += path_removed
+        return new_manifest, copied, removed
+    except OSError as e:
+        return e
+
+
+def _has_parent_in(rel_path: str, paths: set[str]) -> bool:
+    parent = os.path.dirname(rel_path)
+    while parent:
+        if parent in paths:
+            return True
+        parent = os.path.dirname(parent)
+    return False
+
+
+def _scan_path(
+    src: str,
+    rel_path: str,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None,
+) -> dict[str, ManifestEntry | None]:
+    """Record a path of a directory, and everything below it, in a manifest as `scan_files` does."""
+    # Ignored if the path or any of its parent directories is ignored
+    parts = rel_path.split(os.sep)
+    if ignore is not None:
+        for depth, name in enumerate(parts):
+            if name in set(ignore(os.path.join(src, *parts[:depth]), [name])):
+                return {}
+    path = os.path.join(src, rel_path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # Removed or a broken symbolic link
+        return {}
+    if not os.path.isdir(path):
+        return {rel_path: ManifestEntry(stat.st_size, stat.st_mtime_ns, stat.st_ino)}
+    manifest: dict[str, ManifestEntry | None] = {rel_path: None}
+    for sub_path, entry in scan_files(path, ignore).items():
+        manifest[os.path.join(rel_path, sub_path)] = entry
+    return manifest
+
+
+def _apply_manifest(
+    src: str,
+    dest: str,
+    manifest: dict[str, ManifestEntry | None],
+    new_manifest: dict[str, ManifestEntry | None],
+    cancel: threading.Event | None = None,
+    copier: FileCopier | None = None,
+) -> tuple[int, int]:
+    """Remove and copy what differs between two manifests, returning the number of copied and removed paths."""
+    copy = copier.copy if copier is not None else shutil.copy2
+    removed = 0
+    # Reverse order removes files before their parent directories
+    for rel_path in sorted(manifest, reverse=True):
+        old_entry = manifest[rel_path]
+        if rel_path in new_manifest and (old_entry is None) == (
+            new_manifest[rel_path] is None
+        ):
+            continue
+        path = os.path.join(dest, rel_path)
+        if old_entry is None:
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
+        removed += 1
+
+    copied = 0
+    # Sorted order creates directories before their contents
+    for rel_path in sorted(new_manifest):
+        entry = new_manifest[rel_path]
+        if rel_path in manifest and manifest[rel_path] == entry:
+            continue
+        if cancel is not None and cancel.is_set():
+            raise InterruptedError("Sync cancelled")
+        path = os.path.join(dest, rel_path)
+        if entry is None:
+            os.makedirs(path, exist_ok=True)
+        else:
+            copy(os.path.join(src, rel_path), path)
+        copied += 1
+    return copied, removed
+
+
 def empty_dir(dir_path: str):
     """Empty a given directory without deleting the directory itself.
 
@@ -55,7 +448,7 @@ def empty_dir(dir_path: str):
         contents = os.listdir(dir_path)
         for item in contents:
             item_path = os.path.join(dir_path, item)
-            if os.path.isfile(item):
+            if os.path.isfile(item_path):
                 os.remove(item_path)
             elif os.path.isdir(item_path):
                 shutil.rmtree(item_path)
@@ -65,28 +458,53 @@ def empty_dir(dir_path: str):
 
 
 def get_dir_size(
-    start_path: str, ignore: Callable[[str, list[str]], Iterable[str]] = None
+    start_path: str,
+    ignore: Callable[[str, list[str]], Iterable[str]] = None,
+    limit: int | None = None,
+    cancel: threading.Event | None = None,
 ):
     """Get directoy size in bytes
 
+    Ignored directories are not descended into. Symbolic links are not followed.
+
     Args:
         start_path (str): Path of the directory.
         ignore (Callable[[str, list[str]], Iterable[str]] | None, optional), optional): Callable that determines what files are not to be included in calculation.
             See [ignore of shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree) for reference.
             Defaults to None.
+        limit (int | None, optional): Stop as soon as the size reaches *limit* bytes.
+            Defaults to None.
+        cancel (threading.Event | None, optional): Stop as soon as it is set.
+            Defaults to None.
 
     Returns:
-        _type_: _description_
+        int: Size of the directory in bytes. At least *limit* if the scan stopped early.
+            Only the size counted so far if it was cancelled.
     """
     total_size = 0
-    for dirpath, _, filenames in os.walk(start_path):
-        ignore_files = []
-        if ignore:
-            ignore_files = ignore(dirpath, filenames)
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            # skip if it is symbolic link
-            if not os.path.islink(fp) and f not in ignore_files:
-                total_size += os.path.getsize(fp)
+    directories = [start_path]
+    while directories:
+        if cancel is not None and cancel.is_set():
+            return total_size
+        dirpath = directories.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        ignored = set(ignore(dirpath, [e.name for e in entries])) if ignore else ()
+        for entry in entries:
+            if entry.name in ignored:
+                continue
+            try:
+                # File types are known from the directory listing, only the size needs a stat call
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total_size += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            if limit is not None and total_size >= limit:
+                return total_size
 
     return total_size
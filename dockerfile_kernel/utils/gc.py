@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import re
+import time
+from typing import TYPE_CHECKING, NamedTuple
+
+from .filesystem import write_json
+from .state import load_state
+
+if TYPE_CHECKING:
+    from docker import APIClient
+
+SIZE_REGEX = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "k": 10**3, "m": 10**6, "g": 10**9, "t": 10**12}
+# Repository tag of images without a tag
+NO_TAG = "<none>:<none>"
+
+
+def parse_size(size: str) -> int | None:
+    """Parse a size like *20GB*, *500m* or *1024*.
+
+    Args:
+        size (str): Number of bytes, optionally followed by a unit (k, m, g, t).
+
+    Returns:
+        int | None: The size in bytes. `None` if it can't be parsed.
+    """
+    match = SIZE_REGEX.match(size)
+    if match is None:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+class ImageLedger:
+    """Persistent record of the images built by kernels and when each was last used.
+
+    Stored as a JSON file that is written atomically and shared by all kernels.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path of the JSON file.
+        """
+        self._path = path
+
+    def touch(self, *image_ids: str):
+        """Record that images were built or used.
+
+        Args:
+            *image_ids (str): The image ids.
+
+        Returns:
+            bool | Error : Returns `True` if storing was successfull, else an Error.
+        """
+        entries = self.entries()
+        now = time.time()
+        for image_id in image_ids:
+            if image_id is not None:
+                entries[image_id] = now
+        return write_json(self._path, entries)
+
+    def forget(self, image_ids: set[str]):
+        """Stop tracking images, e.g. after they were removed.
+
+        Args:
+            image_ids (set[str]): The image ids.
+
+        Returns:
+            bool | Error : Returns `True` if storing was successfull, else an Error.
+        """
+        entries = self.entries()
+        for image_id in image_ids:
+            entries.pop(image_id, None)
+        return write_json(self._path, entries)
+
+    def entries(self) -> dict[str, float]:
+        """Get the tracked images.
+
+        Returns:
+            dict[str, float]: The image ids mapped to the time they were last used.
+        """
+        # Read every time, other kernels might have changed it
+        try:
+            with open(self._path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+
+def stored_images(state_dir: str) -> set[str]:
+    """Get the images referenced by the states stored for `%resume`.
+
+    Args:
+        state_dir (str): Directory of the state files.
+
+    Returns:
+        set[str]: The image ids of the current images and build stages.
+    """
+    images: set[str] = set()
+    for path in glob.glob(os.path.join(state_dir, "*.json")):
+        state = load_state(path)
+        if state is None:
+            continue
+        images.add(state.get("image"))
+        for stage in (state.get("stages") or {}).values():
+            if isinstance(stage, list) and stage:
+                images.add(stage[0])
+    images.discard(None)
+    return images
+
+
+class GarbageReport(NamedTuple):
+    """Result of a garbage collection.
+
+    - *removed* are the ids of the removed images, least recently used first
+    - *reclaimed* is the disk space freed in bytes, as reported by the docker daemon
+    - *kept* maps the reason images were not removed to their number, e.g. `tagged`
+    - *disk_usage* is the size of all image layers on the daemon before collecting in bytes
+    """
+
+    removed: list[str]
+    reclaimed: int
+    kept: dict[str, int]
+    disk_usage: int
+
+    def summary(self, dry_run: bool = False) -> str:
+        """Describe the garbage collection.
+
+        Args:
+            dry_run (bool, optional): Whether the images were only listed.
+                Defaults to False.
+
+        Returns:
+            str: E.g. *Removed 3 images, reclaimed 120.5 MB (kept 2 tagged, 4 in stage table)*
+        """
+        count = len(self.removed)
+        images = f"{count} image{'s' if count != 1 else ''}"
+        if dry_run:
+            summary = f"Would remove {images}"
+            if self.removed:
+                ids = ", ".join(i.split(":")[-1][:12] for i in self.removed)
+                summary += f": {ids}"
+        else:
+            summary = f"Removed {images}, reclaimed {self.reclaimed / 1_000_000:.1f} MB"
+        if self.kept:
+            kept = ", ".join(f"{n} {reason}" for reason, n in self.kept.items())
+            summary += f" (kept {kept})"
+        return summary
+
+
+def collect_garbage(
+    api: APIClient,
+    ledger: ImageLedger,
+    protected: set[str],
+    budget: int | None = None,
+    dry_run: bool = False,
+) -> GarbageReport:
+    """Remove the least recently used images built by kernels.
+
+    Images that are tagged, used by containers or *protected* are never removed.
+    Images are removed without pruning their parents, which might be protected.
+    Images with children are only removed once their children were removed, a dry run keeps them.
+
+    Args:
+        api (APIClient): Client of the docker daemon.
+        ledger (ImageLedger): The images built by kernels.
+        protected (set[str]): Ids of images to be kept, e.g. the build stages of running kernels.
+        budget (int | None, optional): Bytes the image layers may take on the daemon, images are removed until they fit.
+            All images not kept are removed if `None`.
+            Defaults to None.
+        dry_run (bool, optional): Only report the images that would be removed.
+            Defaults to False.
+
+    Returns:
+        GarbageReport: The removed images and reclaimed space.
+    """
+    from docker.errors import APIError, ImageNotFound
+
+    usage = api.df()
+    disk_usage = usage.get("LayersSize") or 0
+    images = {image["Id"]: image for image in usage.get("Images") or []}
+    entries = ledger.entries()
+
+    kept: dict[str, int] = {}
+    candidates: list[str] = []
+    gone: set[str] = set()
+    parents: set[str] = set()
+    for image_id in sorted(entries, key=entries.get):
+        if image_id not in images:
+            # Images with children are not listed, removing them frees no layer of their own
+            try:
+                info = api.inspect_image(image_id)
+            except ImageNotFound:
+                gone.add(image_id)
+                continue
+            parents.add(image_id)
+            images[image_id] = {
+                "Id": image_id,
+                "Size": info.get("Size", 0),
+                "SharedSize": info.get("Size", 0),
+                "RepoTags": info.get("RepoTags"),
+            }
+        image = images[image_id]
+        reason = None
+        if image_id in protected:
+            reason = "in stage table"
+        elif any(tag != NO_TAG for tag in image.get("RepoTags") or []):
+            reason = "tagged"
+        elif (image.get("Containers") or 0) > 0:
+            reason = "used by containers"
+        if reason is not None:
+            kept[reason] = kept.get(reason, 0) + 1
+        else:
+            candidates.append(image_id)
+
+    if budget is not None:
+        # Layers shared with other images are not freed
+        excess = disk_usage - budget
+        selected = []
+        for image_id in candidates:
+            if excess <= 0:
+                break
+            selected.append(image_id)
+            image = images[image_id]
+            excess -= max(image.get("Size", 0) - max(image.get("SharedSize", 0), 0), 0)
+        if len(candidates) > len(selected):
+            kept["within budget"] = len(candidates) - len(selected)
+        candidates = selected
+
+    removed: list[str] = []
+    if not dry_run:
+        # Children have to be removed before their parents
+        while candidates:
+            remaining = []
+            for image_id in candidates:
+                try:
+                    api.remove_image(image_id, noprune=True)
+                    removed.append(image_id)
+                except APIError as e:
+                    if e.status_code == 404:
+                        removed.append(image_id)
+                    else:
+                        remaining.append(image_id)
+            if len(remaining) == len(candidates):
+                break
+            candidates = remaining
+        if candidates:
+            kept["has children"] = len(candidates)
+    if removed or gone:
+        ledger.forget(set(removed) | gone)
+
+    if dry_run:
+        removed = [image_id for image_id in candidates if image_id not in parents]
+        if len(candidates) > len(removed):
+            kept["has children"] = len(candidates) - len(removed)
+        reclaimed = 0
+    else:
+        reclaimed = disk_usage - (api.df().get("LayersSize") or 0) if removed else 0
+    return GarbageReport(removed, max(reclaimed, 0), kept, disk_usage)
@@ -0,0 +1,201 @@
+import json
+import posixpath
+import re
+
+HEREDOC_REGEX = re.compile(r"<<-?\s*[\"']?(\w+)[\"']?")
+# Build arguments available without being declared by an `ARG` instruction
+PREDEFINED_ARGS = {
+    name
+    for proxy in ("HTTP_PROXY", "HTTPS_PROXY", "FTP_PROXY", "NO_PROXY", "ALL_PROXY")
+    for name in (proxy, proxy.lower())
+}
+
+
+def split_instructions(code: str) -> list[tuple[str, str]]:
+    """Split *Dockerfile* code into its instructions.
+
+    Comments and empty lines are dropped, continued lines are joined and heredocs are kept with their instruction.
+
+    Args:
+        code (str): The *Dockerfile* code.
+
+    Returns:
+        list[tuple[str, str]]: The upper case keyword and the arguments of each instruction.
+    """
+    instructions: list[tuple[str, str]] = []
+    lines = iter(code.split("\n"))
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        while stripped.endswith("\\"):
+            continuation = next(lines, None)
+            if continuation is None:
+                break
+            continuation = continuation.strip()
+            if continuation.startswith("#"):
+                continue
+            stripped = stripped[:-1].rstrip() + " " + continuation
+        for terminator in HEREDOC_REGEX.findall(stripped):
+            for heredoc_line in lines:
+                stripped += "\n" + heredoc_line
+                if heredoc_line.strip() == terminator:
+                    break
+        keyword, _, arguments = stripped.partition(" ")
+        instructions.append((keyword.upper(), arguments.strip()))
+    return instructions
+
+
+def split_flags(arguments: str) -> tuple[dict[str, str], str]:
+    """Separate leading `--flag=value` flags from the rest of an instruction's arguments.
+
+    Args:
+        arguments (str): The arguments of an instruction.
+
+    Returns:
+        tuple[dict[str, str], str]: The lower case flag names mapped to their value and the remaining arguments.
+    """
+    flags: dict[str, str] = {}
+    rest = arguments.strip()
+    while rest.startswith("--"):
+        flag, _, rest = rest.partition(" ")
+        name, _, value = flag[2:].partition("=")
+        flags[name.lower()] = value
+        rest = rest.strip()
+    return flags, rest
+
+
+def context_sources(code: str) -> list[str] | None:
+    """Get the build context paths the `COPY` and `ADD` instructions and `RUN --mount=type=bind` mounts in *code* refer to.
+
+    Args:
+        code (str): The *Dockerfile* code.
+
+    Returns:
+        list[str] | None: Source paths or patterns relative to the build context root.
+            `None` if the instructions might need the whole build context.
+    """
+    sources: list[str] = []
+    for keyword, arguments in split_instructions(code):
+        # Triggers are executed by other builds with unknown sources
+        if keyword == "ONBUILD":
+            return None
+        paths = _copy_sources(keyword, arguments)
+        if paths is None:
+            return None
+
+        for source in paths:
+            # Inline files and remote sources
+            if source.startswith("<<") or _is_remote(source):
+                continue
+            # Variables can't be resolved before building
+            if "$" in source:
+                return None
+            source = posixpath.normpath(source).lstrip("/")
+            # Whole build context or paths docker will reject
+            if source in ("", ".") or source.startswith(".."):
+                return None
+            sources.append(source)
+    return sources
+
+
+def has_remote_sources(code: str) -> bool:
+    """Check if the `COPY` and `ADD` instructions in *code* download remote sources.
+
+    Args:
+        code (str): The *Dockerfile* code.
+
+    Returns:
+        bool: `True` if a source is a URL or git repository or can't be determined.
+    """
+    for keyword, arguments in split_instructions(code):
+        # Bind mounts only read from the build context
+        if keyword == "RUN":
+            continue
+        paths = _copy_sources(keyword, arguments)
+        if paths is None or any(_is_remote(source) for source in paths):
+            return True
+    return False
+
+
+def declared_args(code: str) -> set[str]:
+    """Get the names of the build arguments declared by `ARG` instructions in *code*.
+
+    Args:
+        code (str): The *Dockerfile* code.
+
+    Returns:
+        set[str]: The declared names.
+    """
+    names: set[str] = set()
+    for keyword, arguments in split_instructions(code):
+        if keyword != "ARG":
+            continue
+        for declaration in arguments.split():
+            names.add(declaration.partition("=")[0])
+    return names
+
+
+def _copy_sources(keyword: str, arguments: str) -> list[str] | None:
+    """Get the sources of a `COPY` or `ADD` instruction copied from the build context or a remote location,
+    or of the bind mounts of a `RUN` instruction.
+
+    Returns:
+        list[str] | None: The sources, empty for other instructions or sources of other stages.
+            `None` if the arguments can't be parsed or the whole build context is mounted.
+    """
+    if keyword == "RUN":
+        return _mount_sources(arguments)
+    if keyword not in ("COPY", "ADD"):
+        return []
+    flags, arguments = split_flags(arguments)
+    # Copied from another stage or image, not from the build context
+    if "from" in flags:
+        return []
+
+    arguments = arguments.split("\n")[0].strip()
+    if arguments.startswith("["):
+        try:
+            paths = json.loads(arguments)
+        except json.JSONDecodeError:
+            return None
+    else:
+        paths = arguments.split()
+    return paths[:-1]
+
+
+def _mount_sources(arguments: str) -> list[str] | None:
+    """Get the build context paths bind mounted by the `--mount` flags of a `RUN` instruction.
+
+    Returns:
+        list[str] | None: The sources of the bind mounts.
+            `None` if a mount has no source, i.e. mounts the whole build context, or can't be parsed.
+    """
+    sources: list[str] = []
+    rest = arguments.strip()
+    # Flags may be repeated, unlike in `split_flags`
+    while rest.startswith("--"):
+        flag, _, rest = rest.partition(" ")
+        rest = rest.strip()
+        name, _, value = flag[2:].partition("=")
+        if name.lower() != "mount":
+            continue
+        if '"' in value or "'" in value:
+            return None
+        options: dict[str, str] = {}
+        for option in value.split(","):
+            key, _, option_value = option.partition("=")
+            options[key.strip().lower()] = option_value.strip()
+        # Bind is the default type of mounts
+        if options.get("type", "bind").lower() != "bind" or "from" in options:
+            continue
+        source = options.get("source", options.get("src"))
+        if not source:
+            return None
+        sources.append(source)
+    return sources
+
+
+def _is_remote(source: str) -> bool:
+    """Check if a source is a URL or git repository."""
+    return "://" in source or source.startswith("git@")
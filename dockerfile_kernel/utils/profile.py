@@ -0,0 +1,172 @@
+import time
+from contextlib import contextmanager
+from typing import Any, NamedTuple
+
+STEP_PREFIX = "Step "
+CACHE_HIT = " ---> Using cache"
+
+
+class StepProfile(NamedTuple):
+    """Timing of a single build step.
+
+    - *number* is the step's number within the build
+    - *instruction* is the instruction as printed by the builder
+    - *seconds* is the time from the step's start until the next step started or the build ended
+    - *cached* is whether the builder's layer cache was used
+    - *pulled* is whether an image was pulled
+    - *size* is the size of the layer in bytes, `None` if unknown
+    """
+
+    number: int
+    instruction: str
+    seconds: float
+    cached: bool
+    pulled: bool
+    size: int | None = None
+
+
+class BuildProfile:
+    """Timings of the phases and steps of a cell's execution.
+
+    Phases are timed by the kernel, steps are parsed from the messages of the builder.
+    """
+
+    def __init__(self, execution_count: int, code: str):
+        """
+        Args:
+            execution_count (int): Execution count of the cell.
+            code (str): The user's code.
+        """
+        self.execution_count = execution_count
+        self.code = code
+        self.phases: dict[str, float] = {}
+        self.steps: list[StepProfile] = []
+        self.cached_build = False
+        self.image_size: int | None = None
+        self._start = time.perf_counter()
+        self._total: float | None = None
+        self._step: dict[str, Any] | None = None
+        self._last_message: float | None = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase, adding up repeated phases of the same name.
+
+        Args:
+            name (str): Name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self, message: dict[str, Any]):
+        """Record a message of the builder.
+
+        Args:
+            message (dict[str, Any]): A log message in the format of the docker daemon.
+        """
+        now = time.perf_counter()
+        if message:
+            self._last_message = now
+        if "status" in message and "pull" in str(message["status"]).lower():
+            if self._step is not None:
+                self._step["pulled"] = True
+        for line in message.get("stream", "").splitlines():
+            if line.startswith(STEP_PREFIX) and " : " in line:
+                self._finish_step(now)
+                head, _, instruction = line.partition(" : ")
+                number = head.removeprefix(STEP_PREFIX).split("/")[0]
+                self._step = {
+                    "number": int(number) if number.isdigit() else len(self.steps) + 1,
+                    "instruction": instruction.strip(),
+                    "start": now,
+                    "cached": False,
+                    "pulled": False,
+                }
+            elif line.startswith(CACHE_HIT) and self._step is not None:
+                self._step["cached"] = True
+
+    def finish(self):
+        """End the profile after the execution."""
+        self._finish_step(self._last_message or time.perf_counter())
+        self._total = time.perf_counter() - self._start
+
+    @property
+    def layer_steps(self) -> int:
+        """Number of steps after the last `FROM`, each adding a layer to the resulting image."""
+        for position in range(len(self.steps) - 1, -1, -1):
+            if _is_from(self.steps[position]):
+                return len(self.steps) - position - 1
+        return len(self.steps)
+
+    def set_layer_sizes(self, sizes: list[int]):
+        """Assign the sizes of the newest layers to the steps creating them.
+
+        Args:
+            sizes (list[int]): Sizes of the layers in bytes, oldest first, one for each of the `layer_steps`.
+        """
+        count = self.layer_steps
+        if count == 0 or len(sizes) != count:
+            return
+        self.steps[-count:] = [
+            step._replace(size=size) for step, size in zip(self.steps[-count:], sizes)
+        ]
+
+    @property
+    def total(self) -> float:
+        """Seconds the execution took."""
+        if self._total is None:
+            return time.perf_counter() - self._start
+        return self._total
+
+    @property
+    def cache_hits(self) -> int:
+        """Number of steps the builder's layer cache was used for."""
+        return sum(step.cached for step in self.steps)
+
+    @property
+    def cache_misses(self) -> int:
+        """Number of steps that were executed, not counting `FROM` steps."""
+        return sum(not step.cached and not _is_from(step) for step in self.steps)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Summarize the profile for the metadata of the execute reply.
+
+        Returns:
+            dict[str, Any]: JSON serializable profile.
+        """
+        return {
+            "total": round(self.total, 3),
+            "phases": {
+                name: round(seconds, 3) for name, seconds in self.phases.items()
+            },
+            "steps": [
+                {**step._asdict(), "seconds": round(step.seconds, 3)}
+                for step in self.steps
+            ],
+            "cached_build": self.cached_build,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "image_size": self.image_size,
+        }
+
+    def _finish_step(self, end: float):
+        if self._step is None:
+            return
+        step = self._step
+        self._step = None
+        self.steps.append(
+            StepProfile(
+                step["number"],
+                step["instruction"],
+                max(end - step["start"], 0.0),
+                step["cached"],
+                step["pulled"],
+            )
+        )
+
+
+def _is_from(step: StepProfile) -> bool:
+    return step.instruction.upper().startswith("FROM ")
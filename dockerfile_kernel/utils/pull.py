@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
+
+from .background import BackgroundTask
+from .batch import FROM_IMAGE_REGEX, stage_aliases
+
+if TYPE_CHECKING:
+    from docker import APIClient
+
+# Seconds between progress reports while waiting for pulls
+PROGRESS_INTERVAL = 0.5
+
+
+def base_images(codes: Iterable[str]) -> list[str]:
+    """Get the images the `FROM` instructions of *codes* pull from a registry.
+
+    Build stages, kernel build stage indices, image ids, `scratch`, images given with `--platform`
+    and images containing variables are left out.
+
+    Args:
+        codes (Iterable[str]): *Dockerfile* code, e.g. of each cell of a notebook.
+
+    Returns:
+        list[str]: The images in the order of their first reference.
+    """
+    images: list[str] = []
+    aliases: set[str] = set()
+    for code in codes:
+        for match in FROM_IMAGE_REGEX.finditer(code):
+            image = match.group(2)
+            if (
+                "--platform" in match.group(1).lower()
+                or "$" in image
+                or image.isdigit()
+                or image.startswith("sha256:")
+                or image.lower() in aliases | {"scratch"}
+                or image in images
+            ):
+                continue
+            images.append(image)
+        aliases.update(stage_aliases(code))
+    return images
+
+
+class ImagePull:
+    """Progress of an image pulled in the background.
+
+    - *image* is the image reference, e.g. `ubuntu:22.04`
+    - *layers* maps the id of each layer to its downloaded and total bytes
+    - *status* is the latest status reported by the daemon
+    - *error* is the reason the pull failed, `None` if it did not fail
+    """
+
+    def __init__(self, image: str):
+        self.image = image
+        self.layers: dict[str, tuple[int, int]] = {}
+        self.status = "Waiting"
+        self.error: str | None = None
+        self.task: BackgroundTask | None = None
+
+    def done(self) -> bool:
+        """Whether the pull has ended."""
+        return self.task is not None and self.task.done()
+
+    def record(self, message: dict[str, Any]):
+        """Record a progress message of the daemon.
+
+        Args:
+            message (dict[str, Any]): A message of `docker.APIClient.pull`.
+        """
+        if "error" in message:
+            self.error = str(message["error"])
+            return
+        self.status = message.get("status", self.status)
+        detail = message.get("progressDetail") or {}
+        layer = message.get("id")
+        if layer and detail.get("total"):
+            self.layers[layer] = (detail.get("current", 0), detail["total"])
+        elif (
+            layer
+            and layer in self.layers
+            and self.status.startswith("Download complete")
+        ):
+            total = self.layers[layer][1]
+            self.layers[layer] = (total, total)
+
+    @property
+    def progress(self) -> tuple[int, int]:
+        """Bytes downloaded and total bytes of the layers known so far."""
+        return (
+            sum(current for current, _ in self.layers.values()),
+            sum(total for _, total in self.layers.values()),
+        )
+
+
+class ImagePuller:
+    """Pull images in the background, with a limited number of pulls running at the same time.
+
+    Each image is pulled once, waiting for an image attaches to its pull if it is in flight.
+    """
+
+    def __init__(self, create_api: Callable[[], APIClient], max_parallel: int = 3):
+        """
+        Args:
+            create_api (Callable[[], APIClient]): Creates a client for each pull, clients are not shared between threads.
+            max_parallel (int, optional): Number of images pulled at the same time.
+                Defaults to 3.
+        """
+        self._create_api = create_api
+        self._slots = threading.BoundedSemaphore(max(max_parallel, 1))
+        self._lock = threading.Lock()
+        self.pulls: dict[str, ImagePull] = {}
+
+    def pull(self, images: Iterable[str]) -> list[str]:
+        """Start pulling the images which are not present yet.
+
+        Args:
+            images (Iterable[str]): Image references.
+
+        Returns:
+            list[str]: The images not pulled or being pulled before.
+        """
+        started = []
+        with self._lock:
+            for image in images:
+                if image in self.pulls:
+                    continue
+                pull = self.pulls[image] = ImagePull(image)
+                pull.task = BackgroundTask(
+                    lambda cancel, pull=pull: self._pull(pull, cancel)
+                )
+                started.append(image)
+        return started
+
+    def in_flight(self, images: Iterable[str]) -> list[ImagePull]:
+        """Get the pulls of images that have not ended yet.
+
+        Args:
+            images (Iterable[str]): Image references.
+
+        Returns:
+            list[ImagePull]: The pulls in flight.
+        """
+        with self._lock:
+            pulls = [self.pulls.get(image) for image in images]
+        return [pull for pull in pulls if pull is not None and not pull.done()]
+
+    def wait(
+        self, pulls: list[ImagePull], interval: float = PROGRESS_INTERVAL
+    ) -> Iterator[str]:
+        """Wait for pulls to end.
+
+        Args:
+            pulls (list[ImagePull]): The pulls, e.g. as returned by `in_flight`.
+            interval (float, optional): Seconds between progress reports.
+                Defaults to `PROGRESS_INTERVAL`.
+
+        Yields:
+            str: The aggregated progress of the pulls, see `summary`.
+        """
+        for pull in pulls:
+            while True:
+                try:
+                    pull.task.wait(interval)
+                    break
+                except TimeoutError:
+                    yield summary(pulls)
+        yield summary(pulls)
+
+    def close(self):
+        """Stop all pulls without waiting for them."""
+        with self._lock:
+            pulls = list(self.pulls.values())
+        for pull in pulls:
+            pull.task.cancel(wait=False)
+
+    def _pull(self, pull: ImagePull, cancel: threading.Event):
+        from docker.errors import ImageNotFound
+        from docker.utils import parse_repository_tag
+
+        with self._slots:
+            if cancel.is_set():
+                pull.error = "cancelled"
+                return
+            try:
+                api = self._create_api()
+                try:
+                    api.inspect_image(pull.image)
+                    pull.status = "Already present"
+                    return
+                except ImageNotFound:
+                    pass
+                repository, tag = parse_repository_tag(pull.image)
+                pull.status = "Pulling"
+                for message in api.pull(
+                    repository, tag or "latest", stream=True, decode=True
+                ):
+                    if cancel.is_set():
+                        pull.error = "cancelled"
+                        return
+                    pull.record(message)
+                if pull.error is None:
+                    pull.status = "Pulled"
+            except Exception as e:
+                # The build reports the error once it pulls the image itself
+                pull.error = str(e)
+
+
+def summary(pulls: list[ImagePull]) -> str:
+    """Summarize the progress of pulls, one line each and a total.
+
+    Args:
+        pulls (list[ImagePull]): The pulls.
+
+    Returns:
+        str: E.g. *Pulling 2 images: 12.3/80.0 MB* followed by a line per image.
+    """
+    done = sum(pull.done() for pull in pulls)
+    current = sum(pull.progress[0] for pull in pulls)
+    total = sum(pull.progress[1] for pull in pulls)
+    lines = [
+        f"Pulling {len(pulls)} image{'s' if len(pulls) != 1 else ''}"
+        f" ({done} done): {_megabytes(current)}/{_megabytes(total)} MB"
+    ]
+    for pull in pulls:
+        status = f"error: {pull.error}" if pull.error else pull.status
+        current, total = pull.progress
+        size = f" {_megabytes(current)}/{_megabytes(total)} MB" if total else ""
+        lines.append(f"  {pull.image}: {status}{size}")
+    return "\n".join(lines)
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1_000_000:.1f}"
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+from .cache import cache_dir
+from .filesystem import write_json
+
+
+def notebook_path() -> str:
+    """Get the path of the notebook the kernel was started for.
+
+    Returns:
+        str: The notebook path provided by the Jupyter server in `JPY_SESSION_NAME`.
+            The working directory if the kernel was not started by a Jupyter server.
+    """
+    return os.environ.get("JPY_SESSION_NAME") or os.getcwd()
+
+
+def notebook_file() -> str | None:
+    """Find the file of the notebook the kernel was started for.
+
+    Returns:
+        str | None: Path of the notebook, relative to the working directory if not absolute.
+            `None` if the notebook can't be found.
+    """
+    path = notebook_path()
+    # The server provides the path relative to its root, the kernel runs in the notebook's directory
+    for candidate in (path, os.path.basename(path)):
+        if candidate.endswith(".ipynb") and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def state_path(notebook: str, kernel_name: str) -> str:
+    """Get the path the state of a kernel is stored in.
+
+    Args:
+        notebook (str): Path of the notebook.
+        kernel_name (str): Name of the kernel.
+
+    Returns:
+        str: Path of a JSON file inside the cache directory.
+    """
+    key = f"{kernel_name}\0{os.getcwd()}\0{notebook}"
+    name = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(cache_dir(), "state", f"{name}.json")
+
+
+def save_state(path: str, state: dict):
+    """Store the state of a kernel.
+
+    Args:
+        path (str): Path of the state file.
+        state (dict[str, Any]): JSON serializable state.
+
+    Returns:
+        bool | Error : Returns `True` if storing was successfull, else an Error.
+    """
+    return write_json(path, state)
+
+
+def load_state(path: str) -> dict | None:
+    """Load the state of a kernel.
+
+    Args:
+        path (str): Path of the state file.
+
+    Returns:
+        dict[str, Any] | None: The stored state. `None` if there is none or it can't be read.
+    """
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
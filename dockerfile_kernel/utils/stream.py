@@ -0,0 +1,155 @@
+import codecs
+import json
+import re
+import time
+from collections import deque
+from typing import Any, Callable
+
+
+class JSONStreamDecoder:
+    """Incrementally decode a stream of concatenated JSON objects.
+
+    Chunks may contain several objects or only part of one, objects are returned once complete.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+
+    def feed(self, chunk: bytes) -> list[Any]:
+        """Add a chunk of the stream.
+
+        Args:
+            chunk (bytes): The next chunk of the stream.
+
+        Returns:
+            list[Any]: The objects completed by *chunk*.
+        """
+        self._buffer += self._text_decoder.decode(chunk)
+        objects = []
+        index = 0
+        while True:
+            # Skip separating whitespace
+            while index < len(self._buffer) and self._buffer[index].isspace():
+                index += 1
+            if index == len(self._buffer):
+                break
+            try:
+                obj, index = self._decoder.raw_decode(self._buffer, index)
+            except json.JSONDecodeError:
+                # Incomplete, wait for the next chunk
+                break
+            objects.append(obj)
+        self._buffer = self._buffer[index:]
+        return objects
+
+    def close(self):
+        """End the stream.
+
+        Raises:
+            json.JSONDecodeError: The stream ended within an object.
+        """
+        self._buffer += self._text_decoder.decode(b"", final=True)
+        if self._buffer.strip():
+            self._decoder.decode(self._buffer)
+
+
+class OutputBatcher:
+    """Collect output text and send it in batches.
+
+    Text is sent once *max_size* characters are collected or *interval* seconds passed since the last send.
+    """
+
+    def __init__(
+        self, send: Callable[[str], None], max_size: int = 8192, interval: float = 0.1
+    ):
+        """
+        Args:
+            send (Callable[[str], None]): Sends a batch of text.
+            max_size (int, optional): Number of characters that are sent immediately.
+                Defaults to 8192.
+            interval (float, optional): Seconds after which collected text is sent.
+                Defaults to 0.1.
+        """
+        self._send = send
+        self._max_size = max_size
+        self._interval = interval
+        self._parts: list[str] = []
+        self._size = 0
+        self._last_flush = 0.0
+
+    def write(self, text: str):
+        """Add text to the current batch.
+
+        Args:
+            text (str): The text to be sent.
+        """
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._max_size:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        """Send the current batch if *interval* seconds passed since the last send."""
+        if self._parts and time.monotonic() - self._last_flush >= self._interval:
+            self.flush()
+
+    def flush(self):
+        """Send the current batch."""
+        if self._parts:
+            self._send("".join(self._parts))
+            self._parts = []
+            self._size = 0
+        self._last_flush = time.monotonic()
+
+
+class CompactProgress(OutputBatcher):
+    """Show only the latest output lines in a single, updated display.
+
+    The last line matching *header_pattern* (e.g. the current build step) stays on top.
+    """
+
+    # Build steps of the classic builder ("Step 2/3 : RUN ...") and of BuildKit ("#5 [2/3] RUN ...")
+    HEADER_PATTERN = r"Step \d+/\d+ :|#\d+ \[(?:\S+ )?\d+/\d+\]"
+
+    def __init__(
+        self,
+        display: Callable[[str, bool], None],
+        lines: int = 5,
+        interval: float = 0.1,
+        header_pattern: str = HEADER_PATTERN,
+    ):
+        """
+        Args:
+            display (Callable[[str, bool], None]): Shows the text, updating the existing display if the second argument is `True`.
+            lines (int, optional): Number of output lines shown.
+                Defaults to 5.
+            interval (float, optional): Seconds between updates of the display.
+                Defaults to 0.1.
+            header_pattern (str, optional): Regular expression matching the start of lines kept on top.
+                Defaults to the build steps of the classic builder and of BuildKit.
+        """
+        super().__init__(self._show, max_size=0, interval=interval)
+        self._display = display
+        self._header_pattern = re.compile(header_pattern)
+        self._header = ""
+        self._lines: deque[str] = deque(maxlen=lines)
+        self._shown = False
+
+    def write(self, text: str):
+        for line in text.splitlines():
+            if self._header_pattern.match(line):
+                self._header = line
+                self._lines.clear()
+            elif line.strip():
+                self._lines.append(line)
+        self._parts.append(text)
+        self.tick()
+
+    def _show(self, _: str):
+        text = "\n".join([self._header, *self._lines] if self._header else self._lines)
+        self._display(text + "\n", self._shown)
+        self._shown = True
@@ -0,0 +1,342 @@
+from fnmatch import fnmatchcase
+import hashlib
+import itertools
+import os
+import stat
+import tarfile
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+# Size of the chunks files are read and streamed in
+CHUNK_SIZE = 1024 * 1024
+
+
+class TarStream:
+    """Read-only file object lazily producing a tar archive chunk by chunk.
+
+    Can be passed as `fileobj` with `custom_context=True` to [docker's build API](https://docker-py.readthedocs.io/en/stable/api.html#module-docker.api.build).
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        """
+        Args:
+            chunks (Iterator[bytes]): Iterator yielding the archive's bytes.
+        """
+        self._chunks = chunks
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to *size* bytes, all remaining if *size* is negative.
+
+        Args:
+            size (int, optional): Number of bytes to be read.
+                Defaults to -1.
+
+        Returns:
+            bytes: The bytes read. Empty if the archive is exhausted.
+        """
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._buffer:
+            yield self.read()
+        # Not delegating to the chunks directly lets `close` end the iteration
+        while (chunk := next(self._chunks, None)) is not None:
+            yield chunk
+
+    def close(self):
+        """Stop producing the archive."""
+        self._buffer = b""
+        self._chunks = iter(())
+
+
+def context_tar(
+    context_dir: str | None,
+    dockerfile_code: str,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None = None,
+    include: list[str] | None = None,
+):
+    """Create a build context archive straight from a directory.
+
+    The *Dockerfile* is added from memory and replaces a *Dockerfile* at the root of *context_dir*.
+
+    Args:
+        context_dir (str | None): Path of the build context directory. `None` for an empty build context.
+        dockerfile_code (str): The *Dockerfile* code.
+        ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree)
+            Defaults to None.
+        include (list[str] | None, optional): Paths or patterns (as in `COPY` sources) to be archived, including everything below them.
+            Defaults to None, archiving everything.
+
+    Returns:
+        TarStream: The archive, read lazily while it is uploaded.
+    """
+    return TarStream(_tar_chunks(context_dir, dockerfile_code, ignore, include))
+
+
+class ContextArchive:
+    """Build context archives of a directory reusing the archived files between builds.
+
+    While the first archive is read its file members are recorded in a temporary file.
+    Following archives replay them and only add their *Dockerfile*, as long as the manifest of the directory is unchanged.
+    """
+
+    def __init__(self, context_dir: str):
+        """
+        Args:
+            context_dir (str): Path of the build context directory, e.g. the kernel's mirrored build context.
+        """
+        self._context_dir = context_dir
+        self._lock = threading.Lock()
+        self._prefix: BinaryIO | None = None
+        self._prefix_size = 0
+        self._manifest: dict | None = None
+        self._recording = False
+
+    def archive(self, manifest: dict, dockerfile_code: str) -> TarStream:
+        """Create a build context archive of the whole directory.
+
+        Args:
+            manifest (dict[str, ManifestEntry | None]): Manifest of the directory, see `sync_files`.
+                The recorded files are reused as long as it is equal to the manifest they were recorded with.
+            dockerfile_code (str): The *Dockerfile* code.
+
+        Returns:
+            TarStream: The archive, read lazily while it is uploaded.
+        """
+        with self._lock:
+            if self._prefix is not None and self._manifest == manifest:
+                members = _replay(self._prefix, self._prefix_size)
+            else:
+                members = self._record(dict(manifest))
+        return TarStream(itertools.chain(members, _dockerfile_chunks(dockerfile_code)))
+
+    @property
+    def cached(self) -> bool:
+        """Whether recorded files are available."""
+        return self._prefix is not None
+
+    def _record(self, manifest: dict) -> Iterator[bytes]:
+        """Yield the file members of the directory, recording them once all were read."""
+        with self._lock:
+            # Another archive may be read meanwhile, e.g. by concurrent builds
+            recording, self._recording = self._recording, True
+        if recording:
+            yield from _member_chunks(self._context_dir, None, None)
+            return
+        prefix = None
+        size = 0
+        complete = False
+        try:
+            prefix = tempfile.TemporaryFile(prefix="dockerfile-kernel-context-")
+            for chunk in _member_chunks(self._context_dir, None, None):
+                prefix.write(chunk)
+                size += len(chunk)
+                yield chunk
+            prefix.flush()
+            complete = True
+        finally:
+            with self._lock:
+                self._recording = False
+                if complete:
+                    # Archives replaying the previous recording keep it open until they are done
+                    self._prefix, self._prefix_size = prefix, size
+                    self._manifest = manifest
+            if not complete and prefix is not None:
+                prefix.close()
+
+
+def _replay(prefix: BinaryIO, size: int) -> Iterator[bytes]:
+    """Yield recorded archive members, reading independently of other replays."""
+    offset = 0
+    while offset < size:
+        chunk = os.pread(prefix.fileno(), min(CHUNK_SIZE, size - offset), offset)
+        if not chunk:
+            raise OSError("Recorded build context archive is truncated")
+        offset += len(chunk)
+        yield chunk
+
+
+def context_digest(
+    context_dir: str | None,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None = None,
+    include: list[str] | None = None,
+) -> str:
+    """Fingerprint the files `context_tar` would archive by their metadata.
+
+    Paths, types, modes, sizes and modification times are hashed, file contents are not read.
+
+    Args:
+        context_dir (str | None): Path of the build context directory. `None` for an empty build context.
+        ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree)
+            Defaults to None.
+        include (list[str] | None, optional): Paths or patterns (as in `COPY` sources) to be archived, including everything below them.
+            Defaults to None, archiving everything.
+
+    Returns:
+        str: Hex digest changing whenever an archived file is added, removed or modified.
+    """
+    digest = hashlib.sha256()
+    for path, rel_path, st in _context_entries(context_dir, ignore, include):
+        link = os.readlink(path) if stat.S_ISLNK(st.st_mode) else ""
+        digest.update(
+            f"{rel_path}\0{st.st_mode}\0{st.st_size}\0{st.st_mtime_ns}\0{link}\n".encode()
+        )
+    return digest.hexdigest()
+
+
+def _context_entries(
+    context_dir: str | None,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None,
+    include: list[str] | None,
+) -> Iterator[tuple[str, str, os.stat_result]]:
+    """Yield path, archive name and `os.lstat` result of every path in a build context archive."""
+    if context_dir is None:
+        return
+    patterns = None if include is None else [p.split("/") for p in include]
+    if patterns == []:
+        return
+    # Directories whose whole content is archived
+    included_dirs = {""} if include is None else set()
+    for dirpath, dirnames, filenames in os.walk(context_dir):
+        ignored = set(ignore(dirpath, dirnames + filenames)) if ignore else set()
+        rel_dir = os.path.relpath(dirpath, context_dir)
+        rel_dir = "" if rel_dir == "." else rel_dir
+
+        subdirs = set(dirnames)
+        kept_dirs = set()
+        for name in sorted(dirnames + filenames):
+            if name in ignored or (rel_dir == "" and name == "Dockerfile"):
+                continue
+            rel_path = os.path.join(rel_dir, name)
+            matched, partial = True, False
+            if rel_dir not in included_dirs:
+                matched, partial = _match_include(rel_path.split(os.path.sep), patterns)
+                # Only directories may contain matches further down
+                if not matched and not (partial and name in subdirs):
+                    continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                # Vanished since listing the directory
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                kept_dirs.add(name)
+                if matched:
+                    included_dirs.add(rel_path)
+            yield path, rel_path, st
+        # Links to directories are added as links and not followed
+        dirnames[:] = [d for d in dirnames if d in kept_dirs]
+
+
+def _tar_chunks(
+    context_dir: str | None,
+    dockerfile_code: str,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None,
+    include: list[str] | None,
+) -> Iterator[bytes]:
+    """Yield the bytes of a build context archive."""
+    yield from _member_chunks(context_dir, ignore, include)
+    yield from _dockerfile_chunks(dockerfile_code)
+
+
+def _member_chunks(
+    context_dir: str | None,
+    ignore: Callable[[str, list[str]], Iterable[str]] | None,
+    include: list[str] | None,
+) -> Iterator[bytes]:
+    """Yield the archive members of the files of a build context."""
+    for path, rel_path, st in _context_entries(context_dir, ignore, include):
+        try:
+            info = _tar_info(path, rel_path, st)
+        except OSError:
+            # Not archivable
+            continue
+        yield info.tobuf(tarfile.DEFAULT_FORMAT)
+        if info.isreg():
+            yield from _file_chunks(path, info.size)
+
+
+def _dockerfile_chunks(dockerfile_code: str) -> Iterator[bytes]:
+    """Yield the archive member of the *Dockerfile* and the end of the archive."""
+    dockerfile = dockerfile_code.encode()
+    info = tarfile.TarInfo("Dockerfile")
+    info.size = len(dockerfile)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    yield info.tobuf(tarfile.DEFAULT_FORMAT)
+    yield dockerfile + _padding(info.size)
+    # End of archive marker
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+def _match_include(segments: list[str], patterns: list[list[str]]) -> tuple[bool, bool]:
+    """Match a path's segments against the segments of the included patterns.
+
+    Returns:
+        tuple[bool, bool]: Whether a pattern matches the path and whether a pattern could match a path below it.
+    """
+    partial = False
+    for pattern in patterns:
+        if len(pattern) < len(segments):
+            continue
+        if all(fnmatchcase(s, p) for s, p in zip(segments, pattern)):
+            if len(pattern) == len(segments):
+                return True, True
+            partial = True
+    return False, partial
+
+
+def _tar_info(path: str, arcname: str, st: os.stat_result) -> tarfile.TarInfo:
+    """Create the archive header for the file or directory at *path* from its `os.lstat` result."""
+    info = tarfile.TarInfo(arcname)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = int(st.st_mtime)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    if stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISREG(st.st_mode):
+        info.size = st.st_size
+    else:
+        raise OSError(f"Unsupported file type: {path}")
+    return info
+
+
+def _file_chunks(path: str, size: int) -> Iterator[bytes]:
+    """Yield the content of a file followed by the padding of its archive member.
+
+    Raises:
+        OSError: The file changed its size while being read.
+    """
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise OSError(
+                    f"File changed while adding it to the build context: {path}"
+                )
+            remaining -= len(chunk)
+            yield chunk
+    yield _padding(size)
+
+
+def _padding(size: int) -> bytes:
+    """Zero bytes filling an archive member of *size* bytes up to a full block."""
+    remainder = size % tarfile.BLOCKSIZE
+    return tarfile.NUL * (tarfile.BLOCKSIZE - remainder) if remainder else b""
@@ -0,0 +1,193 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from functools import lru_cache
+from typing import Callable, Iterable
+
+# Constants of <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+# struct inotify_event without its trailing name
+EVENT = struct.Struct("iIII")
+
+
+@lru_cache(maxsize=None)
+def _libc() -> ctypes.CDLL | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def inotify_available() -> bool:
+    """Check whether directories can be watched with inotify.
+
+    Returns:
+        bool: `True` on Linux with a C library providing inotify.
+    """
+    return _libc() is not None
+
+
+class ContextWatcher:
+    """Collect the paths changed within a directory tree using Linux' inotify.
+
+    Events are queued by the operating system and read when `take` is called,
+    so no thread is needed and no change made before the call is missed.
+    """
+
+    def __init__(
+        self, root: str, ignore: Callable[[str, list[str]], Iterable[str]] | None = None
+    ):
+        """
+        Args:
+            root (str): Path of the directory watched, including all directories below it.
+            ignore (Callable[[str, list[str]], Iterable[str]] | None, optional): Ignore callable for [shutil.copytree](https://docs.python.org/3/library/shutil.html#shutil.copytree),
+                ignored directories are not watched.
+                Defaults to None.
+
+        Raises:
+            OSError: inotify is not available or a directory can't be watched, e.g. because the limit of watches is reached.
+        """
+        self._libc = _libc()
+        if self._libc is None:
+            raise OSError("inotify is not available on this system")
+        self._root = root
+        self._ignore = ignore
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # Path relative to root of each watched directory
+        self._watches: dict[int, str] = {}
+        self._pending: set[str] = set()
+        self._full_sync = False
+        try:
+            self._watch_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    def take(self) -> tuple[set[str], bool]:
+        """Get the paths changed since the previous call.
+
+        Returns:
+            tuple[set[str], bool]: Paths relative to the root that were created, modified, deleted or renamed,
+                and whether a full sync is needed, e.g. because `.dockerignore` changed or events were lost.
+        """
+        self._read_events()
+        paths, full_sync = self._pending, self._full_sync
+        self._pending, self._full_sync = set(), False
+        return paths, full_sync
+
+    def close(self):
+        """Stop watching."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._watches = {}
+
+    def _watch_tree(self, rel_dir: str):
+        """Watch a directory and all directories below it that are not ignored."""
+        top = os.path.join(self._root, rel_dir) if rel_dir else self._root
+        # Follow links to directories the same way `scan_files` does
+        for dirpath, dirnames, _ in os.walk(top, followlinks=True):
+            if self._ignore is not None:
+                ignored = set(self._ignore(dirpath, dirnames))
+                dirnames[:] = [d for d in dirnames if d not in ignored]
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(dirpath), WATCH_MASK
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), dirpath)
+            rel_path = os.path.relpath(dirpath, self._root)
+            self._watches[wd] = "" if rel_path == "." else rel_path
+
+    def _unwatch_tree(self, rel_dir: str):
+        """Stop watching a directory moved away and all directories below it."""
+        for wd, watched in list(self._watches.items()):
+            if watched == rel_dir or watched.startswith(rel_dir + os.sep):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+
+    def _read_events(self):
+        if self._fd < 0:
+            return
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                start = offset + EVENT.size
+                name = data[start : start + length].split(b"\0", 1)[0]
+                offset = start + length
+                self._handle_event(wd, mask, os.fsdecode(name))
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self._full_sync = True
+            return
+        rel_dir = self._watches.get(wd)
+        if rel_dir is None:
+            return
+        if mask & IN_IGNORED:
+            # The directory was deleted
+            del self._watches[wd]
+            return
+        if not name:
+            # Events of a directory itself are reported by its parent as well, except for the root
+            if rel_dir == "" and mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._full_sync = True
+            return
+
+        rel_path = os.path.join(rel_dir, name)
+        # Read by `preporcessed_dockerignore`, changing it may change every ignored path
+        if rel_dir == "" and name.endswith(".dockerignore"):
+            self._full_sync = True
+        self._pending.add(rel_path)
+        if not mask & IN_ISDIR:
+            return
+        if mask & IN_MOVED_FROM:
+            self._unwatch_tree(rel_path)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            parent = os.path.join(self._root, rel_dir)
+            if self._ignore is not None and name in set(self._ignore(parent, [name])):
+                return
+            try:
+                self._watch_tree(rel_path)
+            except OSError:
+                # Changes below it would be missed
+                self._full_sync = True
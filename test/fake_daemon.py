@@ -0,0 +1,366 @@
+"""Stand-in for the docker daemon serving the parts of the Engine API used by the kernel over a unix socket.
+
+Builds accept the build context archive and respond with scripted messages at a controllable rate,
+so that log handling and context uploads can be tested without docker.
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import socketserver
+import tarfile
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Callable, NamedTuple
+from urllib.parse import parse_qs, urlparse
+
+API_VERSION = "1.43"
+VERSION_PREFIX = re.compile(r"^/v[\d.]+")
+
+
+class BuildRequest(NamedTuple):
+    """A build received by the daemon.
+
+    - *params* are the query parameters, e.g. `t` or `buildargs`
+    - *files* are the names of the build context's members
+    - *size* is the size of the build context archive in bytes
+    - *dockerfile* is the content of the *Dockerfile*
+    - *encoding* is the archive's `Content-Encoding`, e.g. `gzip`
+    """
+
+    params: dict[str, str]
+    files: list[str]
+    size: int
+    dockerfile: str
+    encoding: str | None = None
+
+
+def default_script(dockerfile: str) -> list[dict[str, Any]]:
+    """Messages of the classic builder building *dockerfile*, one step per instruction."""
+    instructions = [
+        line.strip()
+        for line in dockerfile.splitlines()
+        if line.strip() and not line.strip().startswith("#")
+    ]
+    messages = []
+    for number, instruction in enumerate(instructions, 1):
+        step_id = hashlib.sha256(f"{dockerfile}{number}".encode()).hexdigest()
+        messages.append(
+            {"stream": f"Step {number}/{len(instructions)} : {instruction}\n"}
+        )
+        messages.append({"stream": f" ---> {step_id[:12]}\n"})
+    image_id = "sha256:" + hashlib.sha256(dockerfile.encode()).hexdigest()
+    messages.append({"aux": {"ID": image_id}})
+    messages.append({"stream": f"Successfully built {image_id[7:19]}\n"})
+    return messages
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients aborting an upload, e.g. because the build context changed
+        pass
+
+
+class FakeDaemon:
+    """Docker daemon answering on a unix socket in a temporary directory.
+
+    Usage:
+        with FakeDaemon(rate=1000) as daemon:
+            api = docker.APIClient(base_url=daemon.url)
+    """
+
+    def __init__(
+        self,
+        script: Callable[[str], list[dict[str, Any]]] = default_script,
+        rate: float | None = None,
+        image_size: int = 1_000_000,
+    ):
+        """
+        Args:
+            script (Callable[[str], list[dict[str, Any]]], optional): Creates the messages of a build from its *Dockerfile*.
+                Images of `aux` messages become known to the daemon, `bytes` are sent as they are.
+                Defaults to `default_script`.
+            rate (float | None, optional): Messages sent per second, as fast as possible if `None`.
+                Defaults to None.
+            image_size (int, optional): Size of every layer of the built images in bytes.
+                Defaults to 1_000_000.
+        """
+        self.script = script
+        self.rate = rate
+        self.image_size = image_size
+        self.builds: list[BuildRequest] = []
+        # Pulls wait until the gate is set, if one is given
+        self.pulls: list[str] = []
+        self.pull_gate: threading.Event | None = None
+        self.images: dict[str, list[str]] = {}
+        self.parents: dict[str, str] = {}
+        self.tags: dict[str, str] = {}
+        self._dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self._dir.name, "docker.sock")
+        self.url = f"unix://{self.socket_path}"
+        self._server = _Server(self.socket_path, self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._dir.cleanup()
+
+    def find_image(self, name: str) -> str | None:
+        """Resolve an image id, short id or tag to the image id."""
+        name = self.tags.get(name, self.tags.get(f"{name}:latest", name))
+        for image_id in self.images:
+            if name in (image_id, image_id[7:]) or image_id[7:].startswith(name):
+                return image_id
+        return None
+
+    def image_size_of(self, image_id: str) -> int:
+        """Size of an image including its parent images."""
+        return len(self.images[image_id]) * self.image_size
+
+    def _repo_tags(self, image_id: str) -> list[str]:
+        return [tag for tag, tagged in self.tags.items() if tagged == image_id]
+
+    def _disk_usage(self) -> dict[str, Any]:
+        """Disk usage like `docker system df`, images with children are not listed."""
+        images = []
+        layers_size = 0
+        for image_id in self.images:
+            parent = self.parents.get(image_id)
+            shared = self.image_size_of(parent) if parent in self.images else 0
+            layers_size += self.image_size_of(image_id) - shared
+            if image_id in self.parents.values():
+                continue
+            images.append(
+                {
+                    "Id": image_id,
+                    "Size": self.image_size_of(image_id),
+                    "SharedSize": shared,
+                    "RepoTags": self._repo_tags(image_id) or ["<none>:<none>"],
+                    "Containers": 0,
+                }
+            )
+        return {"LayersSize": layers_size, "Images": images}
+
+    def _handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+            def do_DELETE(self):
+                self._route("DELETE")
+
+            def _route(self, method: str):
+                url = urlparse(self.path)
+                path = VERSION_PREFIX.sub("", url.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                body = self._read_body()
+
+                if method == "GET" and path == "/_ping":
+                    return self._send(200, b"OK", "text/plain")
+                if method == "GET" and path == "/version":
+                    return self._send_json(
+                        200,
+                        {
+                            "ApiVersion": API_VERSION,
+                            "MinAPIVersion": "1.12",
+                            "Version": "24.0.0",
+                            "Os": "linux",
+                            "Arch": "amd64",
+                        },
+                    )
+                if method == "POST" and path == "/build":
+                    return self._build(params, body)
+                if method == "POST" and path == "/images/create":
+                    return self._pull(params)
+                if method == "GET" and path == "/system/df":
+                    return self._send_json(200, daemon._disk_usage())
+                if method == "DELETE" and (
+                    match := re.fullmatch(r"/images/(.+)", path)
+                ):
+                    return self._remove_image(match.group(1))
+                if match := re.fullmatch(r"/images/(.+)/(json|history|tag)", path):
+                    return self._image(method, match.group(1), match.group(2), params)
+                self._send_json(404, {"message": "page not found"})
+
+            def _build(self, params: dict[str, str], body: bytes):
+                try:
+                    with tarfile.open(fileobj=io.BytesIO(body), mode="r:*") as tar:
+                        files = tar.getnames()
+                        name = params.get("dockerfile", "Dockerfile")
+                        dockerfile = tar.extractfile(name).read().decode()
+                except (tarfile.TarError, KeyError, AttributeError) as e:
+                    return self._send_json(
+                        400, {"message": f"invalid build context: {e}"}
+                    )
+                encoding = self.headers.get("Content-Encoding")
+                daemon.builds.append(
+                    BuildRequest(params, files, len(body), dockerfile, encoding)
+                )
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                # Streamed responses end the connection, clients must not reuse it
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    for message in daemon.script(dockerfile):
+                        if isinstance(message, bytes):
+                            # Raw output, e.g. a truncated message
+                            self._write_chunk(message)
+                            continue
+                        if "aux" in message and "ID" in message["aux"]:
+                            image_id = message["aux"]["ID"]
+                            daemon.images[image_id] = dockerfile.splitlines()
+                            parent = daemon.find_image(_base_image(dockerfile))
+                            if parent is not None:
+                                daemon.parents[image_id] = parent
+                            if "t" in params:
+                                daemon.tags[params["t"]] = image_id
+                        self._write_chunk(json.dumps(message).encode() + b"\r\n")
+                        if daemon.rate is not None:
+                            time.sleep(1 / daemon.rate)
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the build
+                    pass
+                self.close_connection = True
+
+            def _pull(self, params: dict[str, str]):
+                image = f"{params['fromImage']}:{params.get('tag') or 'latest'}"
+                daemon.pulls.append(image)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                # Streamed responses end the connection, clients must not reuse it
+                self.send_header("Connection", "close")
+                self.end_headers()
+                messages = [
+                    {"status": "Pulling fs layer", "id": "layer"},
+                    {
+                        "status": "Downloading",
+                        "id": "layer",
+                        "progressDetail": {"current": 0, "total": daemon.image_size},
+                    },
+                ]
+                for message in messages:
+                    self._write_chunk(json.dumps(message).encode() + b"\r\n")
+                if daemon.pull_gate is not None:
+                    daemon.pull_gate.wait(10)
+                image_id = "sha256:" + hashlib.sha256(image.encode()).hexdigest()
+                daemon.images[image_id] = [f"FROM {image}"]
+                daemon.tags[image] = image_id
+                for message in [
+                    {"status": "Download complete", "id": "layer"},
+                    {"status": f"Status: Downloaded newer image for {image}"},
+                ]:
+                    self._write_chunk(json.dumps(message).encode() + b"\r\n")
+                self._write_chunk(b"")
+                self.close_connection = True
+
+            def _remove_image(self, name: str):
+                image_id = daemon.find_image(name)
+                if image_id is None:
+                    return self._send_json(404, {"message": f"No such image: {name}"})
+                if image_id in daemon.parents.values():
+                    return self._send_json(
+                        409,
+                        {
+                            "message": f"conflict: unable to delete {name} (image has dependent child images)"
+                        },
+                    )
+                del daemon.images[image_id]
+                daemon.parents.pop(image_id, None)
+                for tag in daemon._repo_tags(image_id):
+                    del daemon.tags[tag]
+                self._send_json(200, [{"Deleted": image_id}])
+
+            def _image(self, method: str, name: str, action: str, params):
+                image_id = daemon.find_image(name)
+                if image_id is None:
+                    return self._send_json(404, {"message": f"No such image: {name}"})
+                if method == "GET" and action == "json":
+                    return self._send_json(
+                        200,
+                        {
+                            "Id": image_id,
+                            "Size": daemon.image_size_of(image_id),
+                            "RepoTags": daemon._repo_tags(image_id),
+                        },
+                    )
+                if method == "GET" and action == "history":
+                    layers = len(daemon.images[image_id])
+                    return self._send_json(
+                        200,
+                        [{"Id": image_id, "Size": daemon.image_size}] * layers,
+                    )
+                if method == "POST" and action == "tag":
+                    tag = params.get("tag") or "latest"
+                    daemon.tags[f"{params['repo']}:{tag}"] = image_id
+                    return self._send(201, b"", "text/plain")
+                self._send_json(404, {"message": "page not found"})
+
+            def _read_body(self) -> bytes:
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    body = b""
+                    while size := int(self.rfile.readline().strip(), 16):
+                        body += self.rfile.read(size)
+                        self.rfile.readline()
+                    self.rfile.readline()
+                    return body
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, status: int, data):
+                self._send(status, json.dumps(data).encode(), "application/json")
+
+            def _send(self, status: int, data: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def address_string(self):
+                return "fake-daemon"
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _base_image(dockerfile: str) -> str:
+    """The image of the first `FROM` instruction."""
+    for line in dockerfile.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].upper() == "FROM":
+            return parts[1]
+    return ""
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from dockerfile_kernel.utils.background import BackgroundTask
+
+
+def test_wait():
+    task = BackgroundTask(lambda cancel: 42)
+    assert task.wait() == 42
+    assert task.done()
+
+
+def test_cancel():
+    started = threading.Event()
+
+    def run(cancel):
+        started.set()
+        cancel.wait()
+        return "cancelled"
+
+    task = BackgroundTask(run)
+    started.wait()
+    with pytest.raises(TimeoutError):
+        task.wait(timeout=0.05)
+    task.cancel()
+    assert task.done()
+    assert task.wait() == "cancelled"
+
+
+def test_error():
+    def fail(cancel):
+        raise ValueError("failed")
+
+    task = BackgroundTask(fail)
+    with pytest.raises(ValueError, match="failed"):
+        task.wait()
+
+
+def test_cancel_without_waiting():
+    release = threading.Event()
+
+    def work(cancel):
+        release.wait(5)
+        return cancel.is_set()
+
+    task = BackgroundTask(work)
+    task.cancel(wait=False)
+    assert not task.done()
+    release.set()
+    assert task.wait(timeout=5) is True
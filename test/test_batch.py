@@ -0,0 +1,83 @@
+import json
+import os
+
+from dockerfile_kernel.utils.batch import (
+    StepTracker,
+    plan_cells,
+    read_code_cells,
+    resolve_stage_indices,
+    stage_units,
+    unit_code,
+)
+
+
+def test_read_code_cells(tmp_path):
+    path = os.path.join(tmp_path, "notebook.ipynb")
+    notebook = {
+        "cells": [
+            {"cell_type": "code", "source": ["FROM alpine\n", "RUN echo a"]},
+            {"cell_type": "markdown", "source": "# Title"},
+            {"cell_type": "code", "source": "%install apt git"},
+        ]
+    }
+    with open(path, "w") as f:
+        json.dump(notebook, f)
+
+    assert read_code_cells(path) == ["FROM alpine\nRUN echo a", "%install apt git"]
+    assert isinstance(read_code_cells(os.path.join(tmp_path, "missing")), OSError)
+
+
+def test_step_tracker():
+    tracker = StepTracker()
+    log = [
+        "Step 1/4 : ARG VERSION=3\n",
+        "Step 2/4 : FROM alpine:$VERSION\n",
+        " ---> 0123456789ab\n",
+        "Step 3/4 : RUN echo a\n",
+        " ---> Running in ba9876543210\n",
+        "a\n",
+        "Removing intermediate container ba9876543210\n ---> ",
+        "aaaaaaaaaaaa\n",
+        "Step 4/4 : ENV A=1\n",
+        " ---> Using cache\n",
+        " ---> bbbbbbbbbbbb\n",
+        "Successfully built bbbbbbbbbbbb\n",
+    ]
+    for part in log:
+        tracker.feed(part)
+
+    assert tracker.image(1) is None
+    assert tracker.image(2) == "0123456789ab"
+    assert tracker.image(3) == "aaaaaaaaaaaa"
+    assert tracker.image(4) == "bbbbbbbbbbbb"
+
+
+def test_stage_units():
+    codes = [
+        "ARG VERSION=3",
+        "FROM alpine:$VERSION AS base",
+        "RUN echo a",
+        "FROM python AS build\nRUN echo b",
+        "FROM node",
+        "FROM base\nCOPY --from=build /a /a\nCOPY --from=3 /b /b",
+    ]
+    cells = plan_cells(codes)
+    assert [(cell.index, cell.stage) for cell in cells] == [
+        (0, -1),
+        (1, 0),
+        (1, 0),
+        (2, 1),
+        (3, 2),
+        (4, 3),
+    ]
+    # Indices are resolved to docker stage numbers for a single build
+    assert resolve_stage_indices(cells)[-1].endswith("COPY --from=2 /b /b")
+
+    units = stage_units(cells)
+    assert [unit.cells for unit in units] == [[0, 1, 2], [3], [4], [5]]
+    assert [unit.dependencies for unit in units] == [set(), set(), set(), {0, 1, 2}]
+
+    images = {0: "sha256:a", 1: "sha256:b", 2: "sha256:c"}
+    assert unit_code(cells, units, 3, images) == (
+        "ARG VERSION=3\nFROM sha256:a\nCOPY --from=sha256:b /a /a\nCOPY --from=sha256:c /b /b\n"
+    )
@@ -0,0 +1,107 @@
+import json
+import os
+import stat
+import sys
+import types
+
+import pytest
+
+from dockerfile_kernel.builders import BuildKitBuilder
+
+# Stands in for the docker CLI, recording how it was called
+STUB = f"""#!{sys.executable}
+import json, os, sys
+
+directory = os.environ["STUB_DIR"]
+with open(os.path.join(directory, "call.json"), "w") as call:
+    json.dump({{"argv": sys.argv[1:], "docker_host": os.environ.get("DOCKER_HOST")}}, call)
+if sys.argv[-1] == "-":
+    with open(os.path.join(directory, "stdin"), "wb") as stdin:
+        stdin.write(sys.stdin.buffer.read())
+print("#1 [internal] load build definition from Dockerfile")
+print("#5 [1/1] FROM docker.io/library/alpine")
+status = int(os.environ.get("STUB_EXIT", "0"))
+if status:
+    print("ERROR: failed to solve: process did not complete successfully")
+    sys.exit(status)
+with open(sys.argv[sys.argv.index("--iidfile") + 1], "w") as iidfile:
+    iidfile.write("sha256:1234\\n")
+"""
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    docker = bin_dir / "docker"
+    docker.write_text(STUB)
+    docker.chmod(docker.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir), prepend=":")
+    monkeypatch.setenv("STUB_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def builder():
+    return BuildKitBuilder(types.SimpleNamespace(docker_url="unix:///tmp/docker.sock"))
+
+
+def call(stub) -> dict:
+    return json.loads((stub / "call.json").read_text())
+
+
+def test_build_path(stub, builder, tmp_path):
+    context = {"dockerfile": "Dockerfile.kernel", "path": str(tmp_path)}
+    messages = [m for m in builder.build(context, {"VERSION": "1.0"}) if m]
+
+    argv = call(stub)["argv"]
+    iid_path = argv[argv.index("--iidfile") + 1]
+    assert argv == [
+        "buildx",
+        "build",
+        "--progress=plain",
+        "--load",
+        "--iidfile",
+        iid_path,
+        "--file",
+        "Dockerfile.kernel",
+        "--build-arg",
+        "VERSION=1.0",
+        str(tmp_path),
+    ]
+    assert call(stub)["docker_host"] == "unix:///tmp/docker.sock"
+    assert not (stub / "stdin").exists()
+    assert messages[0] == {
+        "stream": "#1 [internal] load build definition from Dockerfile\n"
+    }
+    assert messages[-1] == {"aux": {"ID": "sha256:1234"}}
+    # The iidfile is removed after reading it
+    assert not os.path.exists(iid_path)
+
+
+def test_build_stdin(stub, builder):
+    context = {"dockerfile": "Dockerfile", "fileobj": iter([b"tar", b"ball"])}
+    messages = [m for m in builder.build(context, {}) if m]
+
+    assert call(stub)["argv"][-3:] == ["--file", "Dockerfile", "-"]
+    assert (stub / "stdin").read_bytes() == b"tarball"
+    assert messages[-1] == {"aux": {"ID": "sha256:1234"}}
+
+
+def test_build_error(stub, builder, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_EXIT", "1")
+    context = {"dockerfile": "Dockerfile", "path": str(tmp_path)}
+    messages = [m for m in builder.build(context, {}) if m]
+
+    assert messages[-1] == {
+        "error": "failed to solve: process did not complete successfully"
+    }
+    assert not any("aux" in m for m in messages)
+
+
+def test_missing_cli(builder, tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    context = {"dockerfile": "Dockerfile", "path": str(tmp_path)}
+    assert list(builder.build(context, {})) == [
+        {"error": "The BuildKit backend requires the docker CLI"}
+    ]
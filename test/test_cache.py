@@ -0,0 +1,57 @@
+import json
+import os
+
+from dockerfile_kernel.utils.cache import BuildCache, build_key
+
+
+def test_build_key():
+    key = build_key("FROM scratch", None, {"A": "1"}, "digest")
+    assert key == build_key("FROM scratch", None, {"A": "1"}, "digest")
+    assert key != build_key("FROM scratch", None, {"A": "2"}, "digest")
+    assert key != build_key("FROM scratch", "sha256:1", {"A": "1"}, "digest")
+    assert key != build_key("FROM scratch", None, {"A": "1"}, "changed")
+
+
+def test_build_cache(tmp_path):
+    path = os.path.join(tmp_path, "cache", "builds.json")
+    cache = BuildCache(path, max_entries=2)
+    assert cache.get("a") is None
+
+    assert cache.set("a", "sha256:a") is True
+    # Shared with other kernels through the file
+    assert BuildCache(path).get("a") == "sha256:a"
+
+    cache.set("b", "sha256:b")
+    # Looking up an entry marks it as used
+    assert cache.get("a") == "sha256:a"
+    cache.set("c", "sha256:c")
+    # The least recently used entry is dropped
+    assert cache.get("b") is None
+    assert cache.get("a") == "sha256:a"
+    assert cache.get("c") == "sha256:c"
+
+    cache.remove("c")
+    assert BuildCache(path).get("c") is None
+    with open(path) as f:
+        assert list(json.load(f)) == ["a"]
+
+
+def test_build_cache_shared(tmp_path):
+    path = os.path.join(tmp_path, "builds.json")
+    cache = BuildCache(path)
+    assert cache.get("a") is None
+    # Entries stored by other kernels later on are seen
+    BuildCache(path).set("a", "sha256:a")
+    assert cache.get("a") == "sha256:a"
+    BuildCache(path).remove("a")
+    assert cache.get("a") is None
+
+
+def test_build_cache_corrupted(tmp_path):
+    path = os.path.join(tmp_path, "builds.json")
+    with open(path, "w") as f:
+        f.write("{")
+    cache = BuildCache(path)
+    assert cache.get("a") is None
+    cache.set("a", "sha256:a")
+    assert BuildCache(path).get("a") == "sha256:a"
@@ -0,0 +1,65 @@
+import gzip
+import os
+
+from dockerfile_kernel.utils import compression
+from dockerfile_kernel.utils.compression import (
+    MIN_COMPRESS_SIZE,
+    CompressionPolicy,
+    UploadStream,
+)
+
+
+def test_upload_stream():
+    data = os.urandom(1000) * 50
+    chunks = [data[i : i + 700] for i in range(0, len(data), 700)]
+
+    upload = UploadStream(iter(chunks))
+    assert upload.read(100) + b"".join(iter(upload)) == data
+    assert upload.bytes_read == upload.bytes_sent == len(data)
+    assert upload.seconds is not None
+    assert "gzip" not in upload.summary()
+
+
+def test_upload_stream_gzip(monkeypatch):
+    # Several members compressed concurrently
+    monkeypatch.setattr(compression, "MEMBER_SIZE", 4096)
+    data = os.urandom(1000) * 50
+    chunks = [data[i : i + 700] for i in range(0, len(data), 700)]
+
+    upload = UploadStream(iter(chunks), compress=True, threads=3)
+    compressed = upload.read()
+    assert gzip.decompress(compressed) == data
+    assert compressed.count(b"\x1f\x8b\x08") >= len(data) // 4096
+    assert upload.bytes_read == len(data)
+    assert upload.bytes_sent == len(compressed) < len(data)
+    assert "(gzip: " in upload.summary()
+
+
+def test_upload_stream_close():
+    upload = UploadStream(iter([b"a" * 100] * 10), compress=True)
+    upload.read(10)
+    upload.close()
+    assert upload.read() == b""
+    assert upload.seconds is None
+
+
+def test_compression_policy():
+    policy = CompressionPolicy(threads=4)
+    assert policy.choose("gzip") and not policy.choose("none")
+    # Nothing is measured yet
+    assert not policy.choose("auto", 100 * MIN_COMPRESS_SIZE)
+
+    def upload(rate: float):
+        stream = UploadStream(iter([b"\0" * (2 * MIN_COMPRESS_SIZE)]))
+        stream.read()
+        stream.started, stream.finished = 0.0, stream.bytes_sent / rate
+        policy.upload_rate = None
+        policy.record(stream)
+
+    # A local socket is faster than compressing
+    upload(2e9)
+    assert not policy.choose("auto")
+    # A slow link isn't
+    upload(5e6)
+    assert policy.choose("auto")
+    assert not policy.choose("auto", MIN_COMPRESS_SIZE // 2)
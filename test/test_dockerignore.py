@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from dockerfile_kernel.utils.dockerignore import (
+    DockerignoreMatcher,
+    dockerignore,
+    preprocess_rule,
+)
+
+
+@pytest.mark.parametrize(
+    "rule, expected",
+    [
+        ("# comment", None),
+        ("   \n", None),
+        ("/foo/bar/\n", "foo/bar"),
+        ("  ! /foo/../baz ", "!baz"),
+        ("//foo", "foo"),
+        ("./*.md", "*.md"),
+    ],
+)
+def test_preprocess_rule(rule, expected):
+    assert preprocess_rule(rule) == expected
+
+
+@pytest.mark.parametrize(
+    "rules, path, excluded",
+    [
+        (["foo"], "foo/bar/baz.txt", True),
+        (["*.md"], "docs/readme.md", False),
+        (["*/*.md"], "docs/readme.md", True),
+        (["**/*.md"], "readme.md", True),
+        (["**/*.md"], "docs/api/readme.md", True),
+        (["docs/**"], "docs", False),
+        (["docs/**"], "docs/a/b", True),
+        (["a?c"], "abc", True),
+        (["a?c"], "a/c", False),
+        (["[a-c].txt"], "b.txt", True),
+        (["file.txt"], "fileatxt", False),
+        (["*.md", "!README.md"], "README.md", False),
+        (["*.md", "!README.md", "README*"], "README.md", True),
+        (["build", "!build/keep"], "build/keep/file", False),
+        (["build", "!build/keep"], "build/other", True),
+    ],
+)
+def test_matcher(rules, path, excluded):
+    assert DockerignoreMatcher(rules).matches(path) == excluded
+
+
+def test_ignore_function_prunes_directories(tmp_path):
+    for name in ["node_modules/pkg/index.js", "build/keep/file", "build/other"]:
+        path = os.path.join(tmp_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+    ignore = dockerignore(str(tmp_path), ["node_modules", "build", "!build/keep"])
+
+    # Nothing below node_modules can be re-included, build must be visited
+    assert ignore(str(tmp_path), ["node_modules", "build"]) == ["node_modules"]
+    build = os.path.join(tmp_path, "build")
+    assert ignore(build, ["keep", "other"]) == ["other"]
+    assert ignore(os.path.join(build, "keep"), ["file"]) == []
@@ -0,0 +1,469 @@
+import _thread
+import os
+import threading
+import time
+
+import docker
+import nbformat
+import pytest
+
+from dockerfile_kernel.kernel import DockerKernel
+from dockerfile_kernel.utils.tarball import TarStream
+from dockerfile_kernel.utils.watcher import inotify_available
+from fake_daemon import FakeDaemon, default_script
+
+
+class FrontendStub:
+    def handle_code(self, code):
+        return False
+
+    def build_context_warning(self):
+        pass
+
+
+class RecordingKernel(DockerKernel):
+    def __init__(self, **kwargs):
+        self.output = []
+        super().__init__(**kwargs)
+        self._frontend = FrontendStub()
+
+    def send_response(self, content_text):
+        self.output.append(content_text)
+
+    def send_display(self, content_text, display_id, update=False):
+        self.output.append(content_text)
+
+
+@pytest.fixture
+def daemon():
+    with FakeDaemon() as daemon:
+        yield daemon
+
+
+@pytest.fixture
+def kernel_factory(daemon, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    def create(**kwargs):
+        options = {"build_cache": False, "persist_state": False}
+        return RecordingKernel(docker_url=daemon.url, **(options | kwargs))
+
+    return create
+
+
+def test_api_client(daemon):
+    api = docker.APIClient(base_url=daemon.url)
+    assert api.api_version == "1.43"
+    assert api.ping()
+
+
+@pytest.mark.parametrize("context_mode", ["mirror", "stream"])
+def test_build(daemon, kernel_factory, tmp_path, context_mode):
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "data.txt").write_text("data")
+    kernel = kernel_factory(context_mode=context_mode, minimal_context=False)
+    kernel.change_build_context_directory(str(context))
+
+    kernel.do_execute("FROM alpine\nCOPY data.txt /", silent=False)
+
+    assert len(daemon.builds) == 1
+    build = daemon.builds[0]
+    assert "data.txt" in [os.path.basename(f) for f in build.files]
+    assert "COPY data.txt /" in build.dockerfile
+    assert kernel._sha1 == daemon.find_image(kernel._sha1)
+    assert "Step 2/2 : COPY data.txt /" in "".join(kernel.output)
+
+
+def test_build_compressed(daemon, kernel_factory, tmp_path):
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "data.txt").write_text("data" * 10000)
+    kernel = kernel_factory(context_compression="gzip", minimal_context=False)
+    kernel.change_build_context_directory(str(context))
+
+    kernel.do_execute("FROM alpine\nCOPY data.txt /", silent=False)
+
+    build = daemon.builds[0]
+    assert build.encoding == "gzip"
+    assert "data.txt" in build.files
+    assert build.size < 40000
+    assert f"Sent {build.size / 1_000_000:.1f} MB build context (gzip:" in "".join(
+        kernel.output
+    )
+
+
+def test_attach_to_pull(daemon, kernel_factory):
+    daemon.pull_gate = threading.Event()
+    kernel = kernel_factory()
+    kernel._puller.pull(["alpine"])
+    threading.Timer(0.5, daemon.pull_gate.set).start()
+
+    kernel.do_execute("FROM alpine", silent=False)
+
+    assert daemon.pulls == ["alpine:latest"]
+    output = "".join(kernel.output)
+    assert "Pulling 1 image (1 done)" in output
+    assert output.index("alpine: Pulled") < output.index("Step 1/1")
+    assert "pull wait" in kernel._profile.phases
+
+
+def test_prepull_notebook_in_subdirectory(
+    daemon, kernel_factory, tmp_path, monkeypatch
+):
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells = [nbformat.v4.new_code_cell("FROM debian:12")]
+    (tmp_path / "sub").mkdir()
+    nbformat.write(notebook, str(tmp_path / "sub" / "notebook.ipynb"))
+    # The server's path is relative to its root, the kernel runs in the notebook's directory
+    monkeypatch.chdir(tmp_path / "sub")
+    monkeypatch.setenv("JPY_SESSION_NAME", "sub/notebook.ipynb")
+
+    kernel = kernel_factory()
+    for _ in range(100):
+        if daemon.pulls:
+            break
+        time.sleep(0.05)
+    assert daemon.pulls == ["debian:12"]
+    assert "debian:12" in kernel._puller.pulls
+
+
+def test_build_cache(daemon, kernel_factory):
+    cells = ["FROM alpine", "RUN a"]
+    kernel = kernel_factory(build_cache=True)
+    for cell in cells:
+        kernel.do_execute(cell, silent=False)
+    image = kernel._sha1
+    # E.g. after restarting the kernel
+    restarted = kernel_factory(build_cache=True)
+    for cell in cells:
+        restarted.do_execute(cell, silent=False)
+
+    assert len(daemon.builds) == 2
+    assert restarted._sha1 == image
+    assert f"Using cached build {image[7:19]}" in "".join(restarted.output)
+
+
+def test_resume(daemon, kernel_factory):
+    kernel = kernel_factory(persist_state=True)
+    kernel.do_execute("FROM alpine AS base", silent=False)
+    kernel.do_execute("RUN a", silent=False)
+
+    restarted = kernel_factory(persist_state=True)
+    restarted.do_execute("%resume", silent=False)
+    assert restarted._sha1 == kernel._sha1
+    assert restarted._build_stage_indices == kernel._build_stage_indices
+    assert restarted._build_stage_aliases == {"base": 0}
+    assert restarted.output[-1].startswith("Resumed 1 build stages")
+
+    # Resumed automatically, the cell is built on the stored image
+    resumed = kernel_factory(persist_state=True, auto_resume=True)
+    resumed.do_execute("RUN b", silent=False)
+    assert daemon.builds[-1].dockerfile == f"FROM {kernel._sha1}\nRUN b"
+
+    # The state of other kernel specs is kept apart
+    other = kernel_factory(persist_state=True, kernel_name="other")
+    other.do_execute("%resume", silent=False)
+    assert other._sha1 is None
+    assert "No stored state found for this notebook" in other.output[-1]
+
+
+def test_resume_missing_image(daemon, kernel_factory):
+    kernel = kernel_factory(persist_state=True)
+    kernel.do_execute("FROM alpine", silent=False)
+    del daemon.images[kernel._sha1]
+
+    restarted = kernel_factory(persist_state=True)
+    reply = restarted.do_execute("%resume", silent=False)
+    assert reply["ename"] == "MagicError"
+    assert reply["traceback"] == []
+    assert restarted._sha1 is None
+    assert restarted.output[-1] == f"Images no longer exist: {kernel._sha1[7:19]}"
+
+    # Starting without the stored state
+    resumed = kernel_factory(persist_state=True, auto_resume=True)
+    reply = resumed.do_execute("FROM alpine", silent=False)
+    assert reply["status"] == "ok"
+    assert resumed.output[0].startswith("Stored state not resumed: Images no longer")
+    assert resumed._sha1 == kernel._sha1
+
+
+def test_tag(daemon, kernel_factory):
+    kernel = kernel_factory()
+    kernel.do_execute("FROM alpine", silent=False)
+    kernel.do_execute("%tag example:1.0", silent=False)
+    assert daemon.find_image("example:1.0") == kernel._sha1
+
+
+def test_gc(daemon, kernel_factory):
+    # Images of a closed kernel which did not store its state
+    closed = kernel_factory()
+    closed.do_execute("FROM alpine\nRUN a", silent=False)
+    orphan = closed._sha1
+    kernel = kernel_factory()
+    kernel.do_execute("FROM alpine", silent=False)
+    kernel.do_execute("RUN b", silent=False)
+
+    kernel.output.clear()
+    kernel.do_execute("%gc list", silent=False)
+    assert f"Would remove 1 image: {orphan[7:19]}" in "".join(kernel.output)
+    kernel.do_execute("%gc", silent=False)
+    assert "Removed 1 image, reclaimed 1.0 MB" in "".join(kernel.output)
+    assert orphan not in daemon.images
+    for image_id, _ in kernel._build_stage_indices.values():
+        assert image_id in daemon.images
+
+
+def test_install_queue(daemon, kernel_factory):
+    kernel = kernel_factory()
+    kernel.do_execute("FROM python", silent=False)
+    kernel.do_execute("%install queue", silent=False)
+    kernel.do_execute("%install pip numpy", silent=False)
+    kernel.do_execute("%install pip pandas", silent=False)
+    kernel.do_execute("%install apt curl", silent=False)
+    kernel.do_execute("%install pip scipy", silent=False)
+    assert len(daemon.builds) == 1
+    assert "4 packages to be installed by %install flush" in kernel.output[-1]
+
+    kernel.do_execute("%install flush", silent=False)
+
+    assert len(daemon.builds) == 2
+    dockerfile = daemon.builds[-1].dockerfile
+    # Installations keep their order, consecutive ones of a package manager share a layer
+    assert dockerfile.count("RUN ") == 3
+    assert dockerfile.index("pip install numpy pandas") < dockerfile.index("curl")
+    assert dockerfile.index("curl") < dockerfile.index("pip install scipy")
+    assert "--mount" not in dockerfile
+    assert kernel._install_queue is None
+    kernel.do_execute("%install flush", silent=False)
+    assert kernel.output[-1] == "No packages queued\n"
+
+
+def test_batch_matches_sequential(daemon, kernel_factory):
+    cells = ["FROM python AS base", "%install pip numpy", "RUN a", "FROM base", "RUN b"]
+    sequential = kernel_factory()
+    for cell in cells:
+        sequential.do_execute(cell, silent=False)
+    batch = kernel_factory()
+    batch.build_notebook(cells)
+
+    assert sequential._build_stage_aliases == batch._build_stage_aliases == {"base": 0}
+    assert list(sequential._build_stage_indices) == [0, 1]
+    assert list(batch._build_stage_indices) == [0, 1]
+    # The sequential builds don't start new stages for `%install` cells
+    install = daemon.builds[1].dockerfile
+    assert install.count("FROM ") == 1
+    assert "pip install numpy" in install
+
+
+def test_parallel_batch_matches_sequential(daemon, kernel_factory):
+    cells = [
+        "FROM alpine AS a",
+        "RUN a",
+        "FROM python AS b",
+        "RUN b",
+        "FROM a",
+        "COPY --from=b /b /b",
+        "RUN c",
+    ]
+    sequential = kernel_factory()
+    for cell in cells:
+        sequential.do_execute(cell, silent=False)
+    sequential_builds = len(daemon.builds)
+    parallel = kernel_factory()
+    parallel.build_notebook(cells, jobs=2)
+
+    assert sequential._build_stage_aliases == parallel._build_stage_aliases
+    assert list(sequential._build_stage_indices) == [0, 1, 2]
+    assert list(parallel._build_stage_indices) == [0, 1, 2]
+    for stages in (sequential._build_stage_indices, parallel._build_stage_indices):
+        assert [alias for _, alias in stages.values()] == ["a", "b", None]
+        assert all(image_id in daemon.images for image_id, _ in stages.values())
+    assert parallel._sha1 == parallel._build_stage_indices[2][0]
+    assert parallel.output[-1] == "Built 7 cells in 7 steps\n"
+
+    # The independent stages are built on their own, the last stage from their images
+    a, b, _ = (image_id for image_id, _ in parallel._build_stage_indices.values())
+    dockerfiles = [build.dockerfile for build in daemon.builds[sequential_builds:]]
+    assert sorted(dockerfiles[:2]) == [
+        "FROM alpine AS a\nRUN a\n",
+        "FROM python AS b\nRUN b\n",
+    ]
+    assert dockerfiles[2] == f"FROM {a}\nCOPY --from={b} /b /b\nRUN c\n"
+    sequential_b = sequential._build_stage_indices[1][0]
+    assert (
+        f"--from={sequential_b} /b /b"
+        in daemon.builds[sequential_builds - 2].dockerfile
+    )
+
+
+def test_error(kernel_factory, daemon):
+    daemon.script = lambda dockerfile: [
+        {"stream": "Step 1/1 : FROM missing\n"},
+        {"error": "pull access denied for missing"},
+    ]
+    kernel = kernel_factory()
+    kernel.do_execute("FROM missing", silent=False)
+    assert kernel._sha1 is None
+    assert "error: pull access denied for missing" in "".join(kernel.output)
+
+
+def test_truncated_response(kernel_factory, daemon):
+    daemon.script = lambda dockerfile: [
+        {"stream": "Step 1/1 : FROM alpine\n"},
+        b'{"stream": "trunc',
+    ]
+    kernel = kernel_factory()
+    reply = kernel.do_execute("FROM alpine", silent=False)
+    assert reply["status"] == "ok"
+    assert kernel._sha1 is None
+    assert "Unterminated string" in kernel.output[-1]
+
+
+def test_context_changed_during_upload(daemon, kernel_factory, tmp_path):
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "data.txt").write_bytes(b"data" * 1_000_000)
+    kernel = kernel_factory(context_mode="stream", minimal_context=False)
+    kernel.change_build_context_directory(str(context))
+    build_context = kernel._build_context
+
+    def shrink_during_upload(*args):
+        build = build_context(*args)
+        archive = build["fileobj"]
+
+        def chunks():
+            sent = 0
+            for chunk in archive:
+                yield chunk
+                sent += len(chunk)
+                if sent > 1024 * 1024:
+                    (context / "data.txt").write_bytes(b"data")
+
+        build["fileobj"] = chunks()
+        return build
+
+    kernel._build_context = shrink_during_upload
+    reply = kernel.do_execute("FROM alpine\nCOPY data.txt /", silent=False)
+    assert reply["status"] == "ok"
+    assert kernel._sha1 is None
+    assert "File changed while adding it to the build context" in kernel.output[-1]
+    assert daemon.builds == []
+
+
+def test_scripted_rate(kernel_factory, daemon):
+    lines = 200
+    daemon.rate = 1000
+    daemon.script = lambda dockerfile: [
+        {"stream": f"line {i}\n"} for i in range(lines)
+    ] + [{"aux": {"ID": "sha256:" + "a" * 64}}]
+    kernel = kernel_factory()
+
+    start = time.perf_counter()
+    kernel.do_execute("FROM alpine", silent=False)
+    seconds = time.perf_counter() - start
+
+    assert seconds >= lines / daemon.rate
+    output = "".join(kernel.output)
+    assert all(f"line {i}\n" in output for i in range(lines))
+    # Lines arriving in quick succession are batched
+    assert len(kernel.output) < lines
+    assert kernel._sha1 == "sha256:" + "a" * 64
+
+
+def test_interrupt(daemon, kernel_factory, tmp_path):
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "data.bin").write_bytes(os.urandom(8 * 1024 * 1024))
+    kernel = kernel_factory(context_mode="stream", minimal_context=False)
+    kernel.change_build_context_directory(str(context))
+    build_context = kernel._build_context
+    uploaded = []
+
+    def slow_upload(*args):
+        build = build_context(*args)
+        archive = build["fileobj"]
+
+        def chunks():
+            for chunk in archive:
+                uploaded.append(len(chunk))
+                time.sleep(0.1)
+                yield chunk
+
+        build["fileobj"] = TarStream(chunks())
+        return build
+
+    # Interrupted while uploading the build context
+    kernel._build_context = slow_upload
+    threading.Timer(0.3, _thread.interrupt_main).start()
+    reply = kernel.do_execute("FROM alpine\nCOPY data.bin /", silent=False)
+    assert reply["ename"] == "KeyboardInterrupt"
+    assert "Build interrupted" in kernel.output[-1]
+    count = len(uploaded)
+    assert count < 8
+    time.sleep(0.3)
+    assert len(uploaded) == count
+    assert daemon.builds == []
+
+    # Interrupted while the daemon is building
+    kernel._build_context = build_context
+    daemon.rate = 20
+    daemon.script = lambda dockerfile: [
+        {"stream": f"line {i}\n"} for i in range(200)
+    ] + [{"aux": {"ID": "sha256:" + "a" * 64}}]
+    threading.Timer(0.5, _thread.interrupt_main).start()
+    start = time.perf_counter()
+    reply = kernel.do_execute("FROM alpine", silent=False)
+    assert reply["ename"] == "KeyboardInterrupt"
+    assert time.perf_counter() - start < 5
+    assert kernel._sha1 is None
+    assert not [t for t in threading.enumerate() if t.name == "docker-build"]
+
+    # The next cell still builds
+    daemon.rate = None
+    daemon.script = default_script
+    kernel.do_execute("FROM alpine", silent=False)
+    assert kernel._sha1 == daemon.find_image(kernel._sha1)
+
+
+def test_initial_context(daemon, kernel_factory, tmp_path, monkeypatch):
+    context = tmp_path / "cwd"
+    context.mkdir()
+    (context / "data.txt").write_text("data")
+    monkeypatch.chdir(context)
+    kernel = kernel_factory()
+
+    # Builds without a build context don't wait for it
+    kernel.do_execute("FROM alpine", silent=False)
+    assert daemon.builds[0].files == ["Dockerfile"]
+
+    kernel.do_execute("COPY data.txt /", silent=False)
+    assert "data.txt" in daemon.builds[1].files
+    assert "Build context changed (1 copied, 0 removed)\n" in kernel.output
+
+
+def test_context_magic_cancels_preparation(kernel_factory, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    kernel = kernel_factory()
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "other.txt").write_text("other")
+
+    kernel.do_execute(f"%context {other}", silent=False)
+    assert kernel._context_task is None
+    assert kernel._build_context_dir == str(other)
+    assert os.listdir(kernel._tmp_dir.name) == ["other.txt"]
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify is not available")
+def test_watch_context(daemon, kernel_factory, tmp_path):
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "data.txt").write_text("data")
+    kernel = kernel_factory(watch_context=True)
+    kernel.change_build_context_directory(str(context))
+
+    (context / "added.txt").write_text("added")
+    kernel.do_execute("FROM alpine\nCOPY added.txt /", silent=False)
+    assert "added.txt" in daemon.builds[0].files
+    assert "Build context updated (1 copied, 0 removed)\n" in kernel.output
@@ -0,0 +1,127 @@
+import errno
+import os
+import threading
+
+from dockerfile_kernel.utils import filesystem
+from dockerfile_kernel.utils.dockerignore import dockerignore
+from dockerfile_kernel.utils.filesystem import (
+    FileCopier,
+    create_dockerfile,
+    get_dir_size,
+    sync_files,
+)
+
+
+def write(path, content="content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_sync_files(tmp_path):
+    src = os.path.join(tmp_path, "src")
+    dest = os.path.join(tmp_path, "dest")
+    os.makedirs(dest)
+    write(os.path.join(src, "keep.txt"))
+    write(os.path.join(src, "change.txt"))
+    write(os.path.join(src, "remove", "file.txt"))
+    write(os.path.join(src, "ignored.log"))
+    ignore = dockerignore(src, ["*.log"])
+
+    manifest, copied, removed = sync_files(src, dest, {}, ignore)
+    assert sorted(os.listdir(dest)) == ["change.txt", "keep.txt", "remove"]
+    assert (copied, removed) == (4, 0)
+
+    # Nothing changed, nothing is touched
+    manifest, copied, removed = sync_files(src, dest, manifest, ignore)
+    assert (copied, removed) == (0, 0)
+
+    write(os.path.join(src, "change.txt"), "changed content")
+    write(os.path.join(src, "add.txt"))
+    os.remove(os.path.join(src, "remove", "file.txt"))
+    os.rmdir(os.path.join(src, "remove"))
+
+    manifest, copied, removed = sync_files(src, dest, manifest, ignore)
+    assert sorted(os.listdir(dest)) == ["add.txt", "change.txt", "keep.txt"]
+    assert (copied, removed) == (2, 2)
+    with open(os.path.join(dest, "change.txt")) as f:
+        assert f.read() == "changed content"
+
+
+def test_get_dir_size(tmp_path):
+    write(os.path.join(tmp_path, "a.txt"), "a" * 10)
+    write(os.path.join(tmp_path, "sub", "b.txt"), "b" * 20)
+    write(os.path.join(tmp_path, "node_modules", "c.js"), "c" * 40)
+    ignore = dockerignore(str(tmp_path), ["node_modules"])
+
+    assert get_dir_size(str(tmp_path)) == 70
+    assert get_dir_size(str(tmp_path), ignore) == 30
+    # Stops once the limit is reached
+    assert 10 <= get_dir_size(str(tmp_path), ignore, limit=5) < 30
+
+
+def test_cancel(tmp_path):
+    src = os.path.join(tmp_path, "src")
+    dest = os.path.join(tmp_path, "dest")
+    os.makedirs(dest)
+    write(os.path.join(src, "file.txt"))
+    cancel = threading.Event()
+    cancel.set()
+
+    assert isinstance(sync_files(src, dest, {}, cancel=cancel), InterruptedError)
+    assert os.listdir(dest) == []
+    assert get_dir_size(src, cancel=cancel) == 0
+
+
+def test_file_copier(tmp_path):
+    src = os.path.join(tmp_path, "src.txt")
+    write(src, "data")
+    os.utime(src, ns=(1_000_000_000, 1_000_000_000))
+    copier = FileCopier()
+
+    mechanism = copier.copy(src, os.path.join(tmp_path, "copy.txt"))
+    assert mechanism in FileCopier.MECHANISMS
+    with open(os.path.join(tmp_path, "copy.txt")) as f:
+        assert f.read() == "data"
+    assert os.stat(os.path.join(tmp_path, "copy.txt")).st_mtime_ns == 1_000_000_000
+    assert copier.summary() == f"{mechanism} (1)"
+    assert copier.summary() == ""
+
+
+def test_file_copier_fallback(tmp_path, monkeypatch):
+    src = os.path.join(tmp_path, "src.txt")
+    write(src, "data")
+    copy_data = filesystem._copy_data
+
+    def unsupported(mechanism, fsrc, fdst):
+        if mechanism != "copy":
+            fdst.write(b"partial")
+            raise OSError(errno.EOPNOTSUPP, "not supported")
+        copy_data(mechanism, fsrc, fdst)
+
+    monkeypatch.setattr(filesystem, "_copy_data", unsupported)
+    copier = FileCopier()
+    assert copier.copy(src, os.path.join(tmp_path, "a.txt")) == "copy"
+    with open(os.path.join(tmp_path, "a.txt")) as f:
+        assert f.read() == "data"
+    # Unsupported mechanisms are not tried again
+    assert len(next(iter(copier._unsupported.values()))) == 3
+
+
+def test_hardlink_mode(tmp_path):
+    src = os.path.join(tmp_path, "src")
+    dest = os.path.join(tmp_path, "dest")
+    os.makedirs(dest)
+    write(os.path.join(src, "Dockerfile"), "FROM source")
+    copier = FileCopier("hardlink")
+
+    sync_files(src, dest, {}, copier=copier)
+    assert os.path.samefile(
+        os.path.join(src, "Dockerfile"), os.path.join(dest, "Dockerfile")
+    )
+    assert copier.summary() == "hardlink (1)"
+
+    # The kernel's Dockerfile doesn't change the linked one
+    create_dockerfile("FROM kernel", dest)
+    with open(os.path.join(src, "Dockerfile")) as f:
+        assert f.read() == "FROM source"
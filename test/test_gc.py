@@ -0,0 +1,90 @@
+import io
+import json
+
+import docker
+
+from dockerfile_kernel.utils.gc import (
+    ImageLedger,
+    collect_garbage,
+    parse_size,
+    stored_images,
+)
+from fake_daemon import FakeDaemon
+
+
+def build(api: docker.APIClient, dockerfile: str, tag: str | None = None) -> str:
+    image_id = None
+    for message in api.build(
+        fileobj=io.BytesIO(dockerfile.encode()), tag=tag, decode=True
+    ):
+        image_id = message.get("aux", {}).get("ID", image_id)
+    return image_id
+
+
+def test_parse_size():
+    assert parse_size("1024") == 1024
+    assert parse_size("500m") == 500_000_000
+    assert parse_size("1.5 GB") == 1_500_000_000
+    assert parse_size("20GiB") == 20_000_000_000
+    assert parse_size("lots") is None
+    assert parse_size("") is None
+
+
+def test_image_ledger(tmp_path):
+    ledger = ImageLedger(str(tmp_path / "images.json"))
+    assert ledger.entries() == {}
+    assert ledger.touch("sha256:a", None) is True
+    assert ledger.touch("sha256:b") is True
+    entries = ledger.entries()
+    assert list(entries) == ["sha256:a", "sha256:b"]
+    assert entries["sha256:a"] <= entries["sha256:b"]
+    assert ledger.forget({"sha256:a", "sha256:c"}) is True
+    assert list(ledger.entries()) == ["sha256:b"]
+
+    (tmp_path / "images.json").write_text("not json")
+    assert ledger.entries() == {}
+
+
+def test_stored_images(tmp_path):
+    state = {
+        "image": "sha256:a",
+        "stages": {"1": ["sha256:b", "FROM alpine"], "base": ["sha256:a", ""]},
+    }
+    (tmp_path / "kernel.json").write_text(json.dumps(state))
+    (tmp_path / "broken.json").write_text("{")
+    assert stored_images(str(tmp_path)) == {"sha256:a", "sha256:b"}
+    assert stored_images(str(tmp_path / "missing")) == set()
+
+
+def test_collect_garbage(tmp_path):
+    with FakeDaemon() as daemon:
+        api = docker.APIClient(base_url=daemon.url)
+        ledger = ImageLedger(str(tmp_path / "images.json"))
+        base = build(api, "FROM alpine")
+        child = build(api, f"FROM {base}\nRUN a")
+        old = build(api, "FROM alpine\nRUN old")
+        tagged = build(api, "FROM alpine\nRUN tagged", tag="example:1.0")
+        kept = build(api, "FROM alpine\nRUN kept")
+        for image_id in [old, base, child, tagged, kept, "sha256:" + "0" * 64]:
+            ledger.touch(image_id)
+
+        report = collect_garbage(api, ledger, {kept}, dry_run=True)
+        assert report.removed == [old, child]
+        assert report.kept == {"has children": 1, "tagged": 1, "in stage table": 1}
+        assert "Would remove 2 images" in report.summary(dry_run=True)
+        assert len(daemon.images) == 5
+
+        # Only the least recently used image is needed to fit
+        budget = report.disk_usage - daemon.image_size
+        report = collect_garbage(api, ledger, {kept}, budget=budget)
+        assert report.removed == [old]
+        assert report.reclaimed == 2 * daemon.image_size
+        assert report.kept["within budget"] == 2
+        assert old not in daemon.images
+
+        # Children are removed before their parents
+        report = collect_garbage(api, ledger, {kept})
+        assert sorted(report.removed) == sorted([base, child])
+        assert report.summary().startswith("Removed 2 images, reclaimed 2.0 MB")
+        assert set(daemon.images) == {tagged, kept}
+        assert set(ledger.entries()) == {tagged, kept}
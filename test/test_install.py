@@ -0,0 +1,53 @@
+from dockerfile_kernel.magics import Install
+
+
+def test_install_code():
+    code = Install.install_code("pip", ["numpy", "pandas"]).format(newLine="&& ")
+    assert code == (
+        "RUN pip install --upgrade pip && pip install numpy pandas && rm -rf /root/.cache/pip"
+    )
+    assert Install.install_code("yum", ["curl"]) is None
+
+
+def test_install_code_cache_mounts():
+    code = Install.install_code("apt-get", ["curl"], cache=True)
+    assert code.startswith(
+        "RUN --mount=type=cache,target=/var/cache/apt,sharing=locked"
+        " --mount=type=cache,target=/var/lib/apt/lists,sharing=locked "
+    )
+    assert "rm -rf /var/lib/apt/lists" not in code
+    code = Install.install_code("conda-forge", ["numpy"], cache=True)
+    assert code == (
+        "RUN --mount=type=cache,target=/opt/conda/pkgs"
+        " conda install -y --freeze-installed -c conda-forge numpy"
+    )
+    for manager in ["pip", "npm"]:
+        code = Install.install_code(manager, ["a"], cache=True)
+        assert "--mount=type=cache" in code and "clean" not in code
+
+
+def test_queued_code():
+    queue = []
+    Install.enqueue(queue, "pip", ["numpy"])
+    Install.enqueue(queue, "PIP", ["pandas", "numpy"])
+    Install.enqueue(queue, "apt-get", ["curl"])
+    Install.enqueue(queue, "apt", ["git", "curl"])
+    assert queue == [("pip", ["numpy", "pandas"]), ("apt", ["curl", "git"])]
+    codes = Install.queued_code(queue)
+    assert len(codes) == 2
+    assert "pip install numpy pandas" in codes[0]
+    assert "apt-get install -y curl git" in codes[1]
+
+
+def test_queued_code_mixed_managers():
+    queue = []
+    Install.enqueue(queue, "pip", ["a"])
+    Install.enqueue(queue, "apt", ["b"])
+    Install.enqueue(queue, "pip", ["c", "a"])
+    Install.enqueue(queue, "apt", ["b"])
+    # pip c may depend on apt b, so it isn't moved before it
+    assert queue == [("pip", ["a"]), ("apt", ["b"]), ("pip", ["c"])]
+    codes = Install.queued_code(queue)
+    assert "pip install a" in codes[0]
+    assert "apt-get install -y b" in codes[1]
+    assert "pip install c" in codes[2]
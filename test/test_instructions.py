@@ -0,0 +1,45 @@
+from dockerfile_kernel.utils.instructions import (
+    context_sources,
+    declared_args,
+    has_remote_sources,
+    split_instructions,
+)
+
+
+def test_split_instructions():
+    code = "# comment\nFROM busybox\nRUN echo a \\\n  # inline comment\n  && echo b\n\nCOPY <<EOF /file\nhello\nEOF\nenv A=1"
+    assert split_instructions(code) == [
+        ("FROM", "busybox"),
+        ("RUN", "echo a && echo b"),
+        ("COPY", "<<EOF /file\nhello\nEOF"),
+        ("ENV", "A=1"),
+    ]
+
+
+def test_context_sources():
+    assert context_sources("RUN echo\nENV A=1") == []
+    assert context_sources("COPY --chown=1:1 ./src/ *.py /app/") == ["src", "*.py"]
+    assert context_sources('ADD ["a b", "https://example.com/f", "/dest"]') == ["a b"]
+    assert context_sources("COPY --from=builder /bin/app /app") == []
+    assert context_sources("COPY . /app") is None
+    assert context_sources("COPY $SRC /app") is None
+    assert context_sources("ONBUILD COPY x /app") is None
+    assert context_sources(
+        "RUN --mount=type=bind,source=req.txt,target=/r"
+        " --mount=type=cache,target=/root/.cache pip install -r /r"
+    ) == ["req.txt"]
+    assert context_sources("RUN --mount=type=bind,target=/src make") is None
+    assert context_sources("RUN --mount=target=/src,src=./lib/ make") == ["lib"]
+    assert context_sources("RUN --mount=type=bind,from=build,target=/b ls") == []
+
+
+def test_has_remote_sources():
+    assert not has_remote_sources("COPY src /app\nRUN curl https://example.com")
+    assert not has_remote_sources("COPY --from=builder /bin/app /app")
+    assert not has_remote_sources("RUN --mount=type=bind,target=/src make")
+    assert has_remote_sources("ADD https://example.com/file /file")
+    assert has_remote_sources("ADD git@github.com:user/repo.git /repo")
+
+
+def test_declared_args():
+    assert declared_args("ARG A\nARG B=1 C\nRUN echo $D") == {"A", "B", "C"}
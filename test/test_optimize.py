@@ -0,0 +1,162 @@
+import nbformat
+
+from dockerfile_kernel.export import DockerExporter, OptimizedDockerExporter
+from dockerfile_kernel.export.optimize import optimize_cells
+
+
+def test_merge_runs():
+    dockerfile = optimize_cells(
+        [
+            "FROM ubuntu",
+            "RUN apt-get update",
+            "",
+            "# Only a comment",
+            "RUN cd /src && make",
+            "RUN true",
+            "RUN echo a; echo b",
+            "ENV A=1",
+            "RUN echo $A",
+            "RUN --mount=type=cache,target=/cache ls /cache",
+            'RUN ["echo", "exec form"]',
+        ]
+    )
+    assert dockerfile == (
+        "FROM ubuntu\n"
+        "RUN apt-get update \\\n"
+        "    && ( cd /src && make ) \\\n"
+        "    && ( echo a; echo b )\n"
+        "ENV A=1\n"
+        "RUN echo $A\n"
+        "RUN --mount=type=cache,target=/cache ls /cache\n"
+        'RUN ["echo", "exec form"]\n'
+    )
+
+
+def test_fold_installs():
+    dockerfile = optimize_cells(
+        [
+            "FROM python",
+            "%install apt curl",
+            "%install pip numpy",
+            "%install apt-get git curl",
+            "%install apt git",
+            "RUN make",
+            "%install pip pandas",
+        ]
+    )
+    assert dockerfile.count("RUN ") == 5
+    assert "apt-get install -y curl &&" in dockerfile
+    assert "apt-get install -y git curl &&" in dockerfile
+    # Packages aren't installed before those of another package manager preceding them
+    assert dockerfile.index("numpy") < dockerfile.index("git curl")
+    assert dockerfile.index("git curl") < dockerfile.index("make")
+    assert dockerfile.index("make") < dockerfile.index("pandas")
+
+
+def test_queued_installs():
+    dockerfile = optimize_cells(
+        [
+            "FROM python",
+            "%install queue",
+            "%install pip numpy",
+            "RUN make",
+            "%install apt-get curl",
+            "%install pip pandas numpy",
+            "%install flush",
+            "%install pip scipy",
+        ]
+    )
+    assert dockerfile.count("RUN ") == 4
+    assert dockerfile.index("make") < dockerfile.index("pip install numpy &&")
+    assert dockerfile.index("numpy") < dockerfile.index("apt-get install -y curl")
+    # The last queued run is folded with the installation after the flush
+    assert dockerfile.index("curl") < dockerfile.index("pip install pandas scipy")
+
+
+def test_move_metadata():
+    dockerfile = optimize_cells(
+        [
+            "FROM alpine AS base",
+            "LABEL version=1",
+            "RUN a",
+            "EXPOSE $PORT",
+            "RUN b",
+            'CMD ["sh"]',
+            "RUN c",
+            "%arg PORT=80",
+            "%context /somewhere",
+            "FROM alpine",
+            "COPY --from=0 /a /a",
+        ]
+    )
+    assert dockerfile.split("\n\n") == [
+        "# docker build --build-arg PORT=80",
+        "FROM alpine AS base\n"
+        "RUN a\n"
+        "EXPOSE $PORT\n"
+        "RUN b \\\n"
+        "    && c\n"
+        "LABEL version=1\n"
+        'CMD ["sh"]',
+        "FROM alpine\nCOPY --from=0 /a /a\n",
+    ]
+
+
+def test_metadata_before_shell():
+    dockerfile = optimize_cells(
+        [
+            "FROM alpine",
+            "CMD echo started",
+            "LABEL a=1",
+            "RUN a",
+            'SHELL ["/bin/bash", "-c"]',
+            "CMD echo bash",
+            "RUN b",
+        ]
+    )
+    assert dockerfile == (
+        "FROM alpine\n"
+        "RUN a\n"
+        "CMD echo started\n"
+        "LABEL a=1\n"
+        'SHELL ["/bin/bash", "-c"]\n'
+        "RUN b\n"
+        "CMD echo bash\n"
+    )
+
+
+def test_comments_not_merged():
+    dockerfile = optimize_cells(
+        [
+            "FROM ubuntu",
+            "RUN apt-get update # refresh index",
+            "RUN touch /made",
+            "RUN echo '#not a comment'",
+            'RUN echo "# neither"',
+        ]
+    )
+    assert dockerfile == (
+        "FROM ubuntu\n"
+        "RUN apt-get update # refresh index\n"
+        "RUN touch /made \\\n"
+        "    && echo '#not a comment' \\\n"
+        '    && echo "# neither"\n'
+    )
+
+
+def test_exporter():
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells = [
+        nbformat.v4.new_code_cell("FROM alpine"),
+        nbformat.v4.new_markdown_cell("# Heading"),
+        nbformat.v4.new_code_cell("RUN a"),
+        nbformat.v4.new_code_cell("RUN b"),
+    ]
+
+    restorable, _ = DockerExporter().from_notebook_node(notebook)
+    assert "#md # Heading" in restorable
+
+    optimized, resources = OptimizedDockerExporter().from_notebook_node(notebook)
+    assert optimized == "FROM alpine\nRUN a \\\n    && b\n"
+    assert resources["output_extension"] == ".Dockerfile"
+    assert DockerExporter(optimize=True).from_notebook_node(notebook)[0] == optimized
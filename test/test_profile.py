@@ -0,0 +1,31 @@
+from dockerfile_kernel.utils.profile import BuildProfile
+
+
+def test_build_profile():
+    profile = BuildProfile(1, "RUN echo a\nCOPY a /a")
+    with profile.phase("context"):
+        pass
+    messages = [
+        {"stream": "Step 1/3 : FROM sha256:0123\n"},
+        {"stream": " ---> 0123456789ab\n"},
+        {"stream": "Step 2/3 : RUN echo a\n"},
+        {"stream": " ---> Using cache\n ---> aaaaaaaaaaaa\n"},
+        {"stream": "Step 3/3 : COPY a /a\n"},
+        {"stream": " ---> bbbbbbbbbbbb\n"},
+        {},
+    ]
+    for message in messages:
+        profile.record(message)
+    profile.finish()
+    profile.set_layer_sizes([0, 100])
+
+    assert [step.instruction for step in profile.steps] == [
+        "FROM sha256:0123",
+        "RUN echo a",
+        "COPY a /a",
+    ]
+    assert [step.size for step in profile.steps] == [None, 0, 100]
+    assert (profile.cache_hits, profile.cache_misses) == (1, 1)
+    summary = profile.to_dict()
+    assert set(summary["phases"]) == {"context"}
+    assert summary["steps"][1]["cached"] is True
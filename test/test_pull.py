@@ -0,0 +1,62 @@
+import threading
+import time
+
+import docker
+
+from dockerfile_kernel.utils.pull import ImagePuller, base_images, summary
+from fake_daemon import FakeDaemon
+
+
+def test_base_images():
+    cells = [
+        "ARG VERSION=3.12",
+        "FROM python:${VERSION} AS build",
+        "FROM ubuntu:22.04 AS base\nRUN make",
+        "FROM base\nCOPY --from=build /a /a",
+        "FROM --platform=linux/arm64 alpine",
+        "FROM 0",
+        "FROM scratch",
+        "FROM ubuntu:22.04",
+        "from debian",
+    ]
+    assert base_images(cells) == ["ubuntu:22.04", "debian"]
+
+
+def test_image_puller():
+    with FakeDaemon() as daemon:
+        daemon.pull_gate = threading.Event()
+        puller = ImagePuller(lambda: docker.APIClient(base_url=daemon.url), 1)
+
+        assert puller.pull(["alpine", "debian:12"]) == ["alpine", "debian:12"]
+        # Bounded number of parallel pulls
+        time.sleep(0.2)
+        assert len(daemon.pulls) == 1
+        pulls = puller.in_flight(["alpine", "debian:12", "ubuntu"])
+        assert [pull.image for pull in pulls] == ["alpine", "debian:12"]
+        assert "Pulling 2 images (0 done)" in summary(pulls)
+
+        # Images are only pulled once
+        assert puller.pull(["alpine"]) == []
+        daemon.pull_gate.set()
+        progress = list(puller.wait(pulls, interval=0.05))
+        assert "Pulling 2 images (2 done): 2.0/2.0 MB" in progress[-1]
+        assert sorted(daemon.pulls) == ["alpine:latest", "debian:12"]
+        assert puller.in_flight(["alpine", "debian:12"]) == []
+
+        # Present images are not pulled again
+        puller.pulls.clear()
+        puller.pull(["alpine"])
+        list(puller.wait(puller.in_flight(["alpine"])))
+        assert puller.pulls["alpine"].status == "Already present"
+        assert len(daemon.pulls) == 2
+
+
+def test_image_puller_error(tmp_path):
+    puller = ImagePuller(
+        lambda: docker.APIClient(
+            base_url=f"unix://{tmp_path}/missing.sock", version="1.43"
+        )
+    )
+    puller.pull(["alpine"])
+    list(puller.wait(puller.in_flight(["alpine"])))
+    assert puller.pulls["alpine"].error
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import time
+
+from jupyter_client import BlockingKernelClient
+from jupyter_client.connect import write_connection_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds from spawning the kernel process until it answers `kernel_info_request`
+STARTUP_BUDGET = float(os.environ.get("DOCKERFILE_KERNEL_STARTUP_BUDGET", "5"))
+
+
+def test_startup_time(tmp_path):
+    connection_file, _ = write_connection_file(str(tmp_path / "kernel.json"))
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "dockerfile_kernel",
+            "-f",
+            connection_file,
+            # Starting must not wait for the docker daemon
+            f"--DockerKernel.docker_url=unix://{tmp_path}/missing.sock",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "XDG_CACHE_HOME": str(tmp_path / "cache")},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    client = BlockingKernelClient(connection_file=connection_file)
+    client.load_connection_file()
+    client.start_channels()
+    try:
+        client.wait_for_ready(timeout=60)
+        seconds = time.perf_counter() - start
+    finally:
+        client.stop_channels()
+        process.terminate()
+        process.wait()
+    assert (
+        seconds < STARTUP_BUDGET
+    ), f"Startup took {seconds:.2f} s, budget is {STARTUP_BUDGET} s"
+
+
+def test_lazy_imports():
+    lazy = ["docker", "ipylab", "prettytable", "dockerfile_kernel.magics.install"]
+    script = (
+        "import sys, dockerfile_kernel.kernel; "
+        f"print([m for m in {lazy!r} if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,27 @@
+import os
+
+from dockerfile_kernel.utils.state import load_state, save_state, state_path
+
+
+def test_state(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    path = state_path("notebook.ipynb", "Dockerfile Kernel")
+    assert path.startswith(str(tmp_path))
+    assert path != state_path("other.ipynb", "Dockerfile Kernel")
+    assert load_state(path) is None
+
+    state = {"image": "sha256:a", "stages": {0: ["sha256:a", "base"]}}
+    assert save_state(path, state) is True
+    assert load_state(path) == {
+        "image": "sha256:a",
+        "stages": {"0": ["sha256:a", "base"]},
+    }
+    # No temporary files are left behind
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+
+def test_state_corrupted(tmp_path):
+    path = os.path.join(tmp_path, "state.json")
+    with open(path, "w") as f:
+        f.write("[]")
+    assert load_state(path) is None
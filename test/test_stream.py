@@ -0,0 +1,62 @@
+import json
+
+from dockerfile_kernel.utils.stream import (
+    CompactProgress,
+    JSONStreamDecoder,
+    OutputBatcher,
+)
+
+
+def test_json_stream_decoder():
+    messages = [{"stream": "Step 1/2 : FROM alpine\n"}, {"aux": {"ID": "sha256:ü"}}]
+    data = "\r\n".join(json.dumps(message, ensure_ascii=False) for message in messages)
+    data = data.encode()
+    decoder = JSONStreamDecoder()
+
+    # Split within a message and within a multi-byte character
+    split = data.index("ü".encode()) + 1
+    assert decoder.feed(data[:10]) == []
+    assert decoder.feed(data[10:split]) == messages[:1]
+    assert decoder.feed(data[split:]) == messages[1:]
+    decoder.close()
+
+
+def test_output_batcher():
+    sent = []
+    batcher = OutputBatcher(sent.append, max_size=10, interval=60)
+    batcher.flush()
+    batcher.write("abc")
+    batcher.write("def")
+    assert sent == []
+    batcher.write("ghijk")
+    assert sent == ["abcdefghijk"]
+    batcher.write("l")
+    batcher.flush()
+    assert sent == ["abcdefghijk", "l"]
+
+
+def test_compact_progress():
+    shown = []
+    progress = CompactProgress(lambda text, update: shown.append((text, update)), 2)
+    progress.write("Step 1/2 : FROM alpine\n")
+    progress.write("Step 2/2 : RUN echo\n")
+    progress.write("a\nb\nc\n")
+    progress.flush()
+    assert shown[0] == ("Step 1/2 : FROM alpine\n", False)
+    assert shown[-1] == ("Step 2/2 : RUN echo\nb\nc\n", True)
+
+
+def test_compact_progress_buildkit():
+    shown = []
+    progress = CompactProgress(lambda text, update: shown.append((text, update)), 2)
+    progress.write("#1 [internal] load build definition from Dockerfile\n")
+    progress.write("#5 [build 2/3] RUN make\n#5 0.512 compiling\n")
+    progress.write("#6 [internal] load build context\n")
+    progress.flush()
+    assert shown[-1] == (
+        "#5 [build 2/3] RUN make\n#5 0.512 compiling\n#6 [internal] load build context\n",
+        True,
+    )
+    progress.write("#7 [3/3] COPY . .\n#7 DONE 0.1s\n")
+    progress.flush()
+    assert shown[-1] == ("#7 [3/3] COPY . .\n#7 DONE 0.1s\n", True)
@@ -0,0 +1,101 @@
+import io
+import os
+import tarfile
+
+from dockerfile_kernel.utils.dockerignore import dockerignore
+from dockerfile_kernel.utils.tarball import ContextArchive, context_digest, context_tar
+
+
+def test_context_tar(tmp_path):
+    for name in ["Dockerfile", "app.py", "build.log", os.path.join("src", "main.py")]:
+        path = os.path.join(tmp_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(name)
+    ignore = dockerignore(str(tmp_path), ["*.log"])
+
+    archive = context_tar(str(tmp_path), "FROM scratch\n", ignore)
+    # Read in uneven chunks as the docker client might do
+    data = archive.read(700) + b"".join(iter(archive))
+
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert sorted(tar.getnames()) == ["Dockerfile", "app.py", "src", "src/main.py"]
+        assert tar.extractfile("Dockerfile").read() == b"FROM scratch\n"
+        assert tar.extractfile("src/main.py").read() == b"src/main.py"
+
+
+def test_context_tar_include(tmp_path):
+    for name in ["app.py", "setup.py", os.path.join("src", "pkg", "main.py")]:
+        path = os.path.join(tmp_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(name)
+
+    archive = context_tar(str(tmp_path), "FROM scratch\n", include=["src", "a*.py"])
+    with tarfile.open(fileobj=io.BytesIO(archive.read())) as tar:
+        assert sorted(tar.getnames()) == [
+            "Dockerfile",
+            "app.py",
+            "src",
+            "src/pkg",
+            "src/pkg/main.py",
+        ]
+
+    archive = context_tar(str(tmp_path), "FROM scratch\n", include=[])
+    with tarfile.open(fileobj=io.BytesIO(archive.read())) as tar:
+        assert tar.getnames() == ["Dockerfile"]
+
+
+def test_context_digest(tmp_path):
+    for name in ["app.py", os.path.join("src", "main.py")]:
+        path = os.path.join(tmp_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(name)
+
+    digest = context_digest(str(tmp_path))
+    src_digest = context_digest(str(tmp_path), include=["src"])
+    assert context_digest(str(tmp_path)) == digest
+    assert context_digest(None) == context_digest(str(tmp_path), include=[])
+
+    # Only changes to archived files count
+    with open(os.path.join(tmp_path, "app.py"), "a") as f:
+        f.write("changed")
+    assert context_digest(str(tmp_path)) != digest
+    assert context_digest(str(tmp_path), include=["src"]) == src_digest
+
+
+def test_context_archive(tmp_path):
+    for name in ["Dockerfile", "app.py", os.path.join("src", "main.py")]:
+        path = os.path.join(tmp_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(name)
+    context = ContextArchive(str(tmp_path))
+    manifest = {"app.py": (1, 1), "src": None, "src/main.py": (2, 2)}
+
+    def members(archive):
+        with tarfile.open(fileobj=io.BytesIO(archive.read())) as tar:
+            return {
+                member.name: tar.extractfile(member).read() if member.isfile() else None
+                for member in tar.getmembers()
+            }
+
+    # Abandoned archives are not reused
+    context.archive(manifest, "FROM scratch\n").close()
+    archive = context.archive(manifest, "FROM scratch\n")
+    archive.read(100)
+    archive.close()
+    assert not context.cached
+
+    expected = members(context_tar(str(tmp_path), "FROM scratch\n"))
+    assert members(context.archive(manifest, "FROM scratch\n")) == expected
+    assert context.cached
+
+    # The recorded files are replayed while the manifest is unchanged
+    os.remove(os.path.join(tmp_path, "app.py"))
+    replayed = members(context.archive(dict(manifest), "FROM alpine\n"))
+    assert replayed == {**expected, "Dockerfile": b"FROM alpine\n"}
+
+    del manifest["app.py"]
+    assert "app.py" not in members(context.archive(manifest, "FROM scratch\n"))
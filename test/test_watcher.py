@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from dockerfile_kernel.utils.dockerignore import dockerignore
+from dockerfile_kernel.utils.filesystem import sync_files, sync_paths
+from dockerfile_kernel.utils.watcher import ContextWatcher, inotify_available
+
+pytestmark = pytest.mark.skipif(
+    not inotify_available(), reason="inotify is not available"
+)
+
+
+def write(path, content="content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def listing(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, name), root)
+        for dirpath, dirnames, filenames in os.walk(root)
+        for name in dirnames + filenames
+    )
+
+
+@pytest.fixture
+def context(tmp_path):
+    src = os.path.join(tmp_path, "src")
+    dest = os.path.join(tmp_path, "dest")
+    os.makedirs(dest)
+    write(os.path.join(src, "keep.txt"))
+    write(os.path.join(src, "change.txt"))
+    write(os.path.join(src, "remove.txt"))
+    write(os.path.join(src, "dir", "file.txt"))
+    write(os.path.join(src, "ignored", "file.txt"))
+    ignore = dockerignore(src, ["ignored"])
+    manifest, _, _ = sync_files(src, dest, {}, ignore)
+    watcher = ContextWatcher(src, ignore)
+    yield src, dest, manifest, ignore, watcher
+    watcher.close()
+
+
+def test_incremental_sync(context):
+    src, dest, manifest, ignore, watcher = context
+    write(os.path.join(src, "change.txt"), "changed")
+    os.remove(os.path.join(src, "remove.txt"))
+    write(os.path.join(src, "new", "sub", "file.txt"))
+    os.rename(os.path.join(src, "dir"), os.path.join(src, "renamed"))
+    write(os.path.join(src, "renamed", "added.txt"))
+    write(os.path.join(src, "ignored", "other.txt"))
+
+    paths, full_sync = watcher.take()
+    assert not full_sync
+    assert "keep.txt" not in paths
+    manifest, copied, removed = sync_paths(src, dest, manifest, paths, ignore)
+
+    assert listing(dest) == [
+        "change.txt",
+        "keep.txt",
+        "new",
+        "new/sub",
+        "new/sub/file.txt",
+        "renamed",
+        "renamed/added.txt",
+        "renamed/file.txt",
+    ]
+    with open(os.path.join(dest, "change.txt")) as f:
+        assert f.read() == "changed"
+    # The manifest matches a full sync
+    assert sync_files(src, dest, manifest, ignore)[1:] == (0, 0)
+    assert watcher.take() == (set(), False)
+
+
+def test_watches_new_directories(context):
+    src, dest, manifest, ignore, watcher = context
+    write(os.path.join(src, "new", "file.txt"))
+    watcher.take()
+
+    write(os.path.join(src, "new", "later.txt"))
+    assert watcher.take() == ({os.path.join("new", "later.txt")}, False)
+
+
+def test_dockerignore_change(context):
+    src, dest, manifest, ignore, watcher = context
+    write(os.path.join(src, ".dockerignore"), "*.txt")
+    paths, full_sync = watcher.take()
+    assert full_sync
+
+    write(os.path.join(src, "Dockerfile.dockerignore"), "*.md")
+    paths, full_sync = watcher.take()
+    assert full_sync
+
+    # Only files in the root of the build context are read
+    write(os.path.join(src, "dir", "nested.dockerignore"), "*.md")
+    paths, full_sync = watcher.take()
+    assert not full_sync